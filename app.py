@@ -1,29 +1,44 @@
 import os
 import typer
-import json
 from rich import print
-import json
-import sqlite3
-from dotenv import load_dotenv
 
 # Local imports
+# NOTE: Heavier modules (PDF parsing, LLM, quiz, report) are imported inside the
+# commands that use them so that e.g. `report` or `--help` starts quickly.
+# benchmarks/startup.py checks that this stays true.
 from db import get_db
-from parser import import_path
-from llm import ask_gemini_cli
-from quizzer import generate_quiz, grade_and_log
-from kp_extractor import extract_knowledge_points, save_knowledge_points
-from report import generate_report
-
-load_dotenv()
+import metrics
 
 app = typer.Typer(help="Study Partner CLI")
 
+# Learner whose quiz attempts and mistakes are used (None: the single-user tables)
+_user = None
+
+@app.callback()
+def main(
+    user: str = typer.Option(None, "--user", "-u", envvar="STUDY_USER",
+                             help="Keep quiz history and reports separate for this learner."),
+):
+    global _user
+    _user = user
+
+def _load_env():
+    """Loads .env (e.g. GEMINI_API_KEY) for commands that talk to Gemini."""
+    from dotenv import load_dotenv
+    load_dotenv()
+
 # NOTE: Command to import local documents
 @app.command(name="import")
 def import_command(
-    path: str = typer.Argument(..., help="Path to the directory with your study files.")
+    path: str = typer.Argument(..., help="Path to the directory with your study files."),
+    watch: bool = typer.Option(False, "--watch", "-w", help="Keep running and import new or changed files as they appear."),
+    extract: bool = typer.Option(False, "--extract", help="With --watch, also extract knowledge points from new text."),
+    debounce: float = typer.Option(None, "--debounce", help="Seconds of quiet before importing a burst of changes."),
+    poll: bool = typer.Option(False, "--poll", help="With --watch, re-scan the folder instead of using inotify."),
 ):
-    """Imports documents from a local path into the database."""
+    """Imports documents from a local path into the database (unchanged files are skipped)."""
+    from parser import import_path
+
     # Check if the database file exists and if db.py is accessible
     if not os.path.exists("study.db"):
         try:
@@ -36,35 +51,67 @@ def import_command(
     conn = get_db()
     n_docs, n_chunks = import_path(conn, path)
     print(f"[green]Successfully imported[/] [bold]{n_docs}[/bold] documents with [bold]{n_chunks}[/bold] text chunks.")
+    if not watch:
+        return
+
+    import datetime
+    from watcher import watch as watch_folder, ingest
+
+    if extract:
+        _load_env()
+
+    def on_batch(paths):
+        try:
+            docs, chunks, kps = ingest(conn, paths, extract=extract)
+        except Exception as e:
+            # Keep watching; the next change to the file will retry it
+            metrics.inc("errors_total", where="watch_ingest")
+            print(f"[bold red]Error:[/] Could not import {', '.join(paths)}: {e}")
+            return
+        if docs:
+            stamp = datetime.datetime.now().strftime("%H:%M:%S")
+            msg = f"[{stamp}] Imported [bold]{docs}[/bold] documents with [bold]{chunks}[/bold] text chunks"
+            print(f"[green]{msg}[/]" + (f", [bold]{kps}[/bold] knowledge points." if extract else "."))
+
+    print(f"[cyan]Watching {path} for new or changed files (Ctrl+C to stop)...[/]")
+    try:
+        watch_folder(path, on_batch, debounce=debounce, poll=poll or None)
+    except KeyboardInterrupt:
+        print("\n[yellow]Stopped watching.[/]")
+    finally:
+        conn.close()
 
 # NOTE: Command to summarize and extract knowledge points
 @app.command(name="summarize")
-def summarize_command():
+def summarize_command(
+    redo_all: bool = typer.Option(False, "--all", help="Re-extract chunks that were already summarized."),
+):
     """Generates a summary of the documents in a local path."""
+    _load_env()
+    from llm import ask_gemini_cli_stream
+    from kp_extractor import KP_SCHEMA
+    from response_parser import JsonArrayStream
+    from chunk_store import iter_chunks, mark_extracted
+    import tokens
+
     conn = get_db()
-    cursor = conn.cursor()
     
-    # Get chunks AND check if documents have user-provided subjects
-    cursor.execute("""
-        SELECT c.id, c.content, d.subject 
-        FROM chunks c 
-        JOIN documents d ON d.id = c.document_id
-    """)
-    all_chunks = cursor.fetchall()
+    # Get chunks AND check if documents have user-provided subjects.
+    # NOTE: Text shared by several pages/documents comes back once, and text that was
+    # already summarized is skipped, so re-running after an import only pays for new text.
+    all_chunks = list(iter_chunks(conn, unextracted=not redo_all))
 
     if not all_chunks:
-        print("[bold red]Error:[/] No text found in the database. Please run the 'import' command first.")
+        if conn.execute("SELECT 1 FROM chunks LIMIT 1").fetchone():
+            print("[yellow]All imported text has been summarized already (use --all to redo it).[/]")
+        else:
+            print("[bold red]Error:[/] No text found in the database. Please run the 'import' command first.")
         return
 
     # Check if user provided subjects during import
     user_subjects = set(row[2] for row in all_chunks if row[2] is not None)
     has_user_subjects = len(user_subjects) > 0
 
-    # Create document string with chunk IDs
-    doc_string = ""
-    for chunk_id, content, doc_subject in all_chunks:
-        doc_string += f"[CHUNK_ID:{chunk_id}] {content}\n\n"
-    
     print("[yellow]Extracting knowledge points from documents...[/]")
     
     # Adapt prompt based on whether user provided subjects
@@ -86,10 +133,7 @@ def summarize_command():
         {docs}
         ---
         """
-        prompt = prompt_template.format(
-            subjects=list(user_subjects), 
-            docs=doc_string
-        )
+        prompt_args = {"subjects": list(user_subjects)}
     else:
         prompt_template = """
         You are extracting knowledge points from documents. Since no subject categories were provided, analyze the content and determine appropriate subjects.
@@ -105,52 +149,72 @@ def summarize_command():
         {docs}
         ---
         """
-        prompt = prompt_template.format(docs=doc_string)
+        prompt_args = {}
     
     # Rest of your existing code...
-    response = ask_gemini_cli(prompt)
- 
-    try:
-        # Extract JSON from markdown code blocks if present
-        if response.strip().startswith('```json'):
-            # Find the JSON content between ```json and ```
-            start = response.find('```json') + 7
-            end = response.find('```', start)
-            json_content = response[start:end].strip()
-        elif response.strip().startswith('```'):
-            # Handle generic code blocks
-            start = response.find('```') + 3
-            end = response.find('```', start)
-            json_content = response[start:end].strip()
-        else:
-            json_content = response.strip()
-        
-        kp_list = json.loads(json_content)
-        if kp_list:
-            for kp_item in kp_list:
-                # NEW: Save the chunk_id from the JSON response
-                conn.execute(
-                    "INSERT INTO knowledge_points (subject, topic, kp, source_chunk_id) VALUES (?, ?, ?, ?)",
-                    (kp_item.get("subject"), kp_item.get("topic"), kp_item.get("kp"), kp_item.get("chunk_id"))
-                )
-            conn.commit()
-            print(f"[green]Successfully extracted and saved[/] [bold]{len(kp_list)}[/bold] knowledge points.")
-        else:
-            print("[bold red]Error:[/] No knowledge points were extracted.")
-    except json.JSONDecodeError:
-        print(f"[bold red]Error:[/] Failed to parse JSON from Gemini. Raw output: {response[:500]}...")
+    # NOTE: Documents over the token budget are summarized in several calls, each
+    # marked extracted once it has produced knowledge points
+    n_saved = n_dropped = 0
+    max_tokens = tokens.room("summarize", prompt_template.format(docs="", **prompt_args))
+    for batch in tokens.pack(all_chunks, max_tokens, text=lambda row: f"[CHUNK_ID:{row[0]}] {row[1]}\n\n"):
+        # Create document string with chunk IDs
+        doc_string = "".join(text for _, text in batch)
+        fitted = tokens.truncate(doc_string, max_tokens)
+        prompt = prompt_template.format(docs=fitted, **prompt_args)
+        truncated = tokens.estimate(doc_string) - tokens.estimate(fitted)
+        parser = JsonArrayStream(KP_SCHEMA)
+        n_batch = 0
+        pieces = tokens.track_stream(conn, "summarize", prompt, ask_gemini_cli_stream(prompt), truncated)
+        for kp_item in parser.iter(pieces):
+            # NEW: Save the chunk_id from the JSON response
+            conn.execute(
+                "INSERT INTO knowledge_points (subject, topic, kp, source_chunk_id) VALUES (?, ?, ?, ?)",
+                (kp_item.get("subject"), kp_item.get("topic"), kp_item.get("kp"), kp_item.get("chunk_id"))
+            )
+            n_batch += 1
+        if n_batch:
+            mark_extracted(conn, [row[0] for row, _ in batch])
+        conn.commit()
+        n_saved += n_batch
+        n_dropped += parser.dropped
+
+    if n_dropped:
+        metrics.inc("llm_items_dropped_total", n_dropped, call_site="summarize")
+        print(f"[bold yellow]Warning:[/] Skipped {n_dropped} malformed knowledge point(s) from Gemini.")
+    if n_saved:
+        print(f"[green]Successfully extracted and saved[/] [bold]{n_saved}[/bold] knowledge points.")
+    else:
+        print("[bold red]Error:[/] No knowledge points were extracted.")
 
 # NOTE: Command to generate and run a quiz
 @app.command(name="quiz")
 def quiz_command(
     n: int = typer.Option(5, "--num", "-n", help="Number of questions to generate."),
-    kp_id: int = typer.Option(None, "--kp-id", "-k", help="ID of a specific knowledge point to quiz on.")
+    kp_id: int = typer.Option(None, "--kp-id", "-k", help="ID of a specific knowledge point to quiz on."),
+    weakest: bool = typer.Option(False, "--weakest", help="Quiz on the knowledge point you've answered worst so far."),
 ):
     """
     Generates and runs a quiz based on knowledge points.
     """
-    db_conn = get_db()
+    _load_env()
+    from quizzer import iter_quiz, grade_and_log
+
+    try:
+        db_conn = get_db(user=_user)
+    except ValueError as e:
+        print(f"[bold red]Error:[/] {e}")
+        raise typer.Exit(code=1)
     
+    if kp_id is None and weakest:
+        from mastery import weakest_kp
+        import attempt_log
+        attempt_log.flush(db_conn)
+        kp_id = weakest_kp(db_conn)
+        if kp_id is not None:
+            print(f"[bold cyan]Quizzing on your weakest knowledge point (ID: {kp_id}).[/bold cyan]")
+        else:
+            print("[yellow]No answers recorded yet, so there is no weakest knowledge point.[/]")
+
     if kp_id is None:
         # If no specific KP is selected, choose a random one from the database.
         cursor = db_conn.cursor()
@@ -162,18 +226,14 @@ def quiz_command(
         kp_id = result[0]
         print(f"[bold cyan]Quizzing on a random knowledge point (ID: {kp_id}).[/bold cyan]")
     
-    # Generate the quiz questions
-    questions = generate_quiz(db_conn, kp_id, n)
-
-    if not questions:
-        print("[bold yellow]No questions were generated. Exiting quiz.[/bold yellow]")
-        db_conn.close()
-        raise typer.Exit()
+    print("[cyan]Generating questions...[/cyan]")
 
-    print(f"\n[bold]Starting Quiz! (Total questions: {len(questions)})[/bold]")
-
-    # Run the quiz
-    for i, q in enumerate(questions, 1):
+    # Questions are streamed, so the first one can be answered while the rest are generated
+    i = 0
+    for i, q in enumerate(iter_quiz(db_conn, kp_id, n), 1):
+        if i == 1:
+            # NOTE: Only once a question has actually arrived and been saved
+            print("\n[bold]Starting Quiz![/bold]")
         print("\n---")
         print(f"[bold]Question {i}:[/bold] {q.get('stem')}")
         options = q.get('options', {})
@@ -184,18 +244,328 @@ def quiz_command(
         
         grade_and_log(db_conn, q, user_answer)
         
+    if not i:
+        print("[bold yellow]No questions were generated. Exiting quiz.[/bold yellow]")
+        db_conn.close()
+        raise typer.Exit()
+
     print("\n---")
-    print("[bold green]Quiz finished![/bold green]")
+    print(f"[bold green]Quiz finished![/bold green] You answered {i} question(s).")
     db_conn.close()
 
 # CLI Command: Report
 @app.command(name="report")
 def report_command():
     """Generates a Markdown report of all mistakes."""
-    conn = get_db()
-    message = generate_report(conn)
+    from report import generate_report
+
+    try:
+        conn = get_db(user=_user)
+    except ValueError as e:
+        print(f"[bold red]Error:[/] {e}")
+        raise typer.Exit(code=1)
+    message = generate_report(conn, _user)
     print(message)
     conn.close()
 
+# CLI Command: Export
+@app.command(name="export")
+def export_command(
+    path: str = typer.Argument("bank.jsonl.gz", help="File to write (gzip-compressed JSON Lines)."),
+    chunks: bool = typer.Option(False, "--chunks", help="Also export the documents' text the questions link to."),
+):
+    """Exports knowledge points and questions so another install can use them without Gemini."""
+    from bank import export_bank, LABELS
+
+    conn = get_db()
+    counts = export_bank(conn, path, include_chunks=chunks)
+    conn.close()
+    summary = ", ".join(f"{n} {LABELS[kind]}" for kind, n in counts.items()) or "nothing"
+    print(f"[green]Exported {summary} to[/] [bold]{path}[/bold].")
+
+# CLI Command: Import a question bank
+@app.command(name="import-bank")
+def import_bank_command(
+    path: str = typer.Argument(..., help="Bank file written by the 'export' command."),
+):
+    """Imports knowledge points and questions exported from another install."""
+    from bank import import_bank, LABELS
+
+    if not os.path.exists(path):
+        print(f"[bold red]Error:[/] File not found: {path}")
+        raise typer.Exit(code=1)
+    conn = get_db()
+    try:
+        counts = import_bank(conn, path)
+    except (ValueError, OSError) as e:
+        print(f"[bold red]Error:[/] {e}")
+        raise typer.Exit(code=1)
+    finally:
+        conn.close()
+    for kind, label in LABELS.items():
+        added, existing = counts.get(kind, 0), counts.get(f"{kind}_existing", 0)
+        duplicate, conflict = counts.get(f"{kind}_duplicate", 0), counts.get(f"{kind}_conflict", 0)
+        notes = [f"{existing} already present"] * bool(existing) + [f"{duplicate} repeated in the bank"] * bool(duplicate)
+        if added or notes:
+            print(f"[green]Imported {added} {label}[/]" + (f" ({', '.join(notes)})" if notes else ""))
+        if conflict:
+            print(f"[yellow]Kept your own text for {conflict} {label} that differ in the bank.[/]")
+    if not counts:
+        print("[yellow]The bank is empty.[/]")
+
+# CLI Command: Stats
+@app.command(name="stats")
+def stats_command(
+    fmt: str = typer.Option("table", "--format", "-f", help="Output format: table, json or prometheus."),
+    reset: bool = typer.Option(False, "--reset", help="Delete the saved metrics after showing them."),
+):
+    """Shows the timings and counters recorded while STUDY_METRICS=1."""
+    snap = metrics.load()
+    if fmt == "json":
+        import json
+        typer.echo(json.dumps(snap, indent=2))
+    elif fmt in ("prometheus", "prom"):
+        typer.echo(metrics.to_prometheus(snap), nl=False)
+    else:
+        if not snap["counters"] and not snap["histograms"]:
+            print(f"[yellow]No metrics recorded in {metrics.METRICS_PATH}. Run commands with STUDY_METRICS=1 first.[/]")
+        for h in snap["histograms"]:
+            labels = ",".join(f"{k}={v}" for k, v in h["labels"].items())
+            avg = h["sum"] / h["count"] if h["count"] else 0
+            print(f"[bold]{h['name']}[/]{{{labels}}}  count={h['count']}  avg={avg:.4g}  "
+                  f"p50<={metrics.quantile(h, 0.5)}  p95<={metrics.quantile(h, 0.95)}")
+        for c in snap["counters"]:
+            labels = ",".join(f"{k}={v}" for k, v in c["labels"].items())
+            print(f"[bold]{c['name']}[/]{{{labels}}}  {c['value']:g}")
+    if reset and os.path.exists(metrics.METRICS_PATH):
+        os.remove(metrics.METRICS_PATH)
+
+# CLI Command: Usage
+@app.command(name="usage")
+def usage_command(
+    since: str = typer.Option(None, "--since", help="Only calls from this date on (e.g. 2025-01-31)."),
+    fmt: str = typer.Option("table", "--format", "-f", help="Output format: table or json."),
+):
+    """Shows estimated LLM tokens, time and cost per call site."""
+    import tokens
+
+    conn = get_db(user=_user)
+    rows = tokens.usage(conn, since)
+    conn.close()
+    if fmt == "json":
+        import json
+        typer.echo(json.dumps(rows, indent=2))
+        return
+    if not rows:
+        print("[yellow]No LLM calls recorded yet.[/]")
+        return
+    for r in rows:
+        print(f"[bold]{r['call_site']}[/]  calls={r['calls']}  tokens in={r['prompt_tokens']} out={r['response_tokens']}  "
+              f"truncated={r['truncated_tokens']}  time={r['seconds']:.1f}s (avg {r['avg_seconds']:.2f}s)  "
+              f"cost≈${r['cost_usd']:.4f}" + (f"  [red]failed={r['failed']}[/]" if r["failed"] else ""))
+
+def _size(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n is None or n < 1024 or unit == "GB":
+            return "-" if n is None else f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+# CLI Command: Doctor
+@app.command(name="doctor")
+def doctor_command(
+    examples: int = typer.Option(5, "--examples", "-e", help="Problem rows to show per check."),
+    full: bool = typer.Option(False, "--full", help="Run the slower, complete integrity_check."),
+):
+    """Shows database sizes and row counts and checks for damaged, orphaned or duplicate rows."""
+    import itertools
+    import db_checker
+
+    conn = get_db()
+    sections = [("Shared database", conn, True)]
+    if _user:
+        sections.append((f"Learner database ({_user})", get_db(user=_user), False))
+    try:
+        for label, c, shared in sections:
+            st = db_checker.file_stats(c)
+            print(f"[bold]{label}[/] {st['path']}: {_size(st['bytes'])} "
+                  f"({_size(st['free_bytes'])} free, WAL {_size(st['wal_bytes'])}), "
+                  f"journal={st['journal_mode']}, auto_vacuum={st['auto_vacuum']}")
+            for t in db_checker.table_stats(c):
+                rows = f"{t['rows']:>10} rows" if t["rows"] is not None else ""
+                print(f"  {t['type']:<5} {t['name']:<32} {rows:>15}  {_size(t['bytes']):>10}")
+            problems = db_checker.integrity(c, full)
+            if problems:
+                print(f"  [bold red]Integrity check failed:[/] {'; '.join(problems)}")
+            else:
+                print("  [green]Integrity check: ok[/]")
+            if shared:
+                print(f"  Last maintenance: {db_checker.last_run(c) or 'never'}")
+            for check in db_checker.checks_for(c, shared):
+                n = db_checker.count_problems(c, check)
+                if n:
+                    print(f"  [yellow]{db_checker.CHECKS[check][0]}:[/] {n}")
+                    for row_id, detail in itertools.islice(db_checker.iter_problems(c, check), examples):
+                        print(f"    #{row_id} {detail}")
+    finally:
+        for _, c, _ in sections:
+            c.close()
+
+# CLI Command: Maintain
+@app.command(name="maintain")
+def maintain_command(
+    backup: bool = typer.Option(True, "--backup/--no-backup", help="Back up each database file first."),
+    clean: bool = typer.Option(False, "--clean", help="Delete stored chunk text that no chunk uses."),
+    vacuum: bool = typer.Option(False, "--vacuum", help="Rebuild files without incremental vacuum once, so free space can be reclaimed from then on."),
+    full: bool = typer.Option(False, "--full", help="Run the slower, complete integrity_check."),
+    if_due: bool = typer.Option(False, "--if-due", help="Skip if maintenance ran within MAINTAIN_INTERVAL_HOURS (for cron)."),
+):
+    """Checks, backs up, analyzes, vacuums and checkpoints the shared and every learner database."""
+    import datetime
+    import sqlite3
+    import db_checker
+    from db import list_users, user_db_path
+
+    conn = get_db()
+    try:
+        if if_due and not db_checker.is_due(conn):
+            print(f"[green]Maintenance last ran {db_checker.last_run(conn)}; nothing to do.[/]")
+            return
+        started_at = datetime.datetime.now().isoformat()
+        db_path = conn.execute("PRAGMA database_list").fetchone()[2]
+        files = [(None, conn)] + [(u, None) for u in list_users(db_path)]
+        steps, ok = {}, True
+        for user, c in files:
+            c = c or sqlite3.connect(user_db_path(db_path, user))
+            label = f"users/{user}" if user else "shared"
+            try:
+                for step, result in db_checker.maintain(c, name=user, do_backup=backup, do_clean=clean and not user,
+                                                        full_vacuum=vacuum, full_check=full):
+                    steps.setdefault(label, {})[step] = result
+                    if step.endswith("_check") and result != "ok":
+                        ok = False
+                        print(f"[bold red]Error:[/] {label}: integrity check failed: {'; '.join(result)}")
+                    else:
+                        print(f"{label}: {step}: {result}")
+            finally:
+                if user:
+                    c.close()
+        db_checker.log_run(conn, started_at, steps, ok)
+    except sqlite3.Error as e:
+        print(f"[bold red]Error:[/] {e}")
+        raise typer.Exit(code=1)
+    finally:
+        conn.close()
+    if not ok:
+        raise typer.Exit(code=1)
+
+# CLI Command: Compress
+@app.command(name="compress")
+def compress_command(
+    train_dict: bool = typer.Option(False, "--train-dict", help="Train a zstd dictionary on the stored chunks first."),
+):
+    """Re-encodes stored chunks with the current codec (CHUNK_CODEC) and dictionary."""
+    import chunk_store
+
+    conn = get_db()
+    try:
+        if train_dict:
+            dict_id = chunk_store.train_dictionary(conn)
+            print(f"[green]Trained compression dictionary {dict_id}.[/]")
+        rows = chunk_store.recompress(conn)
+        before, after = conn.execute(
+            "SELECT COALESCE(SUM(content_len), 0), COALESCE(SUM(length(content_z)), 0) FROM chunk_bodies"
+        ).fetchone()
+    except (RuntimeError, ValueError) as e:
+        print(f"[bold red]Error:[/] {e}")
+        raise typer.Exit(code=1)
+    finally:
+        conn.close()
+    print(f"[green]Recompressed {rows} unique chunk(s): {before} characters stored in {after} bytes.[/]")
+
+# CLI Command: Queue
+@app.command(name="queue")
+def queue_command(
+    extract: bool = typer.Option(False, "--extract", help="Queue extraction of all text that hasn't been extracted yet."),
+    subject: str = typer.Option(None, "--subject", "-s", help="With --extract, only text of documents with this subject."),
+    generate: int = typer.Option(None, "--generate", "-g", help="Queue this many questions for each knowledge point without any."),
+    kp_id: int = typer.Option(None, "--kp-id", "-k", help="With --generate, only this knowledge point (even if it has questions)."),
+    retry_failed: bool = typer.Option(False, "--retry-failed", help="Give failed tasks another round of attempts."),
+):
+    """Queues extraction and question generation for `worker` processes, and shows the queue."""
+    import work_queue
+
+    conn = get_db()
+    try:
+        if extract:
+            print(f"[green]Queued[/] [bold]{work_queue.enqueue_extraction(conn, subject)}[/bold] extraction task(s).")
+        if generate:
+            n = work_queue.enqueue_questions(conn, None if kp_id is None else [kp_id], generate)
+            print(f"[green]Queued[/] [bold]{n}[/bold] question generation task(s).")
+        if retry_failed:
+            print(f"[green]Requeued[/] [bold]{work_queue.retry_failed(conn)}[/bold] failed task(s).")
+        rows = work_queue.status(conn)
+        if not rows:
+            print("[yellow]The queue is empty.[/]")
+        for r in rows:
+            expired = f"  [yellow]({r['expired']} lease(s) expired)[/]" if r["expired"] else ""
+            print(f"[bold]{r['kind']:<9}[/] {r['status']:<8} {r['tasks']:>8}{expired}")
+        for (error, n) in conn.execute(
+            "SELECT error, COUNT(*) FROM tasks WHERE status = 'failed' GROUP BY error ORDER BY COUNT(*) DESC LIMIT 5"
+        ):
+            print(f"  [red]failed ({n}):[/] {error}")
+    finally:
+        conn.close()
+
+# CLI Command: Worker
+@app.command(name="worker")
+def worker_command(
+    kinds: str = typer.Option("extract,generate", "--kinds", help="Kinds of task to work on, comma-separated."),
+    batch: int = typer.Option(1, "--batch", "-b", help="Tasks to claim at a time; extraction tasks share LLM calls."),
+    threads: int = typer.Option(1, "--threads", "-t", help="Tasks to run at once in this process."),
+    poll: float = typer.Option(5.0, "--poll", help="Seconds to wait before looking again when the queue is empty."),
+    exit_when_idle: bool = typer.Option(False, "--exit-when-idle", help="Stop once there is nothing left to claim."),
+):
+    """Runs queued LLM work (see `queue`); start as many workers as you like, on any machine sharing the database."""
+    _load_env()
+    import time
+    import threading
+    import work_queue
+
+    kinds = tuple(k.strip() for k in kinds.split(",") if k.strip())
+    unknown = set(kinds) - set(work_queue.KINDS)
+    if unknown or not kinds:
+        print(f"[bold red]Error:[/] Unknown task kind(s) {', '.join(sorted(unknown))}; use {', '.join(work_queue.KINDS)}.")
+        raise typer.Exit(code=1)
+
+    get_db().close()  # create/upgrade the database before the threads open it
+    stop = threading.Event()
+    runners = [
+        threading.Thread(target=work_queue.run_worker, name=f"t{i + 1}", daemon=True,
+                         args=("study.db", kinds, max(batch, 1), poll, exit_when_idle, stop))
+        for i in range(max(threads, 1))
+    ]
+    print(f"[cyan]Worker {work_queue.worker_name()} working on {', '.join(kinds)} tasks "
+          f"with {len(runners)} thread(s) (Ctrl+C to stop)...[/]")
+    for t in runners:
+        t.start()
+    # NOTE: Polls instead of join(), which Ctrl+C can leave reporting a running thread as finished.
+    try:
+        while any(t.is_alive() for t in runners):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        print("\n[yellow]Stopping after the current tasks (Ctrl+C again to quit now; "
+              "unfinished tasks are retried when their lease expires).[/]")
+        stop.set()
+        try:
+            while any(t.is_alive() for t in runners):
+                time.sleep(0.2)
+        except KeyboardInterrupt:
+            return
+
+    conn = get_db()
+    left = sum(r["tasks"] for r in work_queue.status(conn) if r["status"] in ("pending", "leased"))
+    conn.close()
+    print(f"[green]Worker stopped;[/] {left} task(s) left in the queue.")
+
 if __name__ == "__main__":
     app()
@@ -0,0 +1,176 @@
+import os
+import atexit
+import sqlite3
+import datetime
+import threading
+
+import metrics
+import mastery
+
+# How graded answers reach the database (GRADE_DURABILITY):
+#   answer  each answer is written and committed (fsynced) before grading returns
+#   batch   answers are queued in memory and written by a background thread in one
+#           transaction per ATTEMPT_BATCH_SIZE answers or ATTEMPT_FLUSH_SECONDS,
+#           and at exit. Much higher grade throughput, but a crash can lose the
+#           answers of the last flush interval.
+GRADE_DURABILITY = os.getenv("GRADE_DURABILITY", "answer")
+ATTEMPT_BATCH_SIZE = int(os.getenv("ATTEMPT_BATCH_SIZE", "100"))
+ATTEMPT_FLUSH_SECONDS = float(os.getenv("ATTEMPT_FLUSH_SECONDS", "1.0"))
+
+
+def attempt(question, user_answer, is_correct, correct_answer):
+    """The event recorded for one graded answer."""
+    return {
+        "question_id": question.get("id"),
+        "kp_id": question.get("kp_id"),
+        "user_answer": user_answer,
+        "is_correct": 1 if is_correct else 0,
+        "correct_answer": correct_answer,
+        "created_at": datetime.datetime.now().isoformat(),
+    }
+
+
+def write(conn, events):
+    """Writes attempt events: attempts rows, the mastery rollup and the mistake log. Does not commit."""
+    for e in events:
+        if e["kp_id"] is None and e["question_id"]:
+            # e.g. questions loaded by id (MCP grade) rather than just generated
+            row = conn.execute("SELECT kp_id FROM questions WHERE id = ?", (e["question_id"],)).fetchone()
+            e["kp_id"] = row[0] if row else None
+    conn.executemany(
+        "INSERT INTO attempts (question_id, user_answer, is_correct, created_at) "
+        "VALUES (:question_id, :user_answer, :is_correct, :created_at)",
+        events,
+    )
+    for e in events:
+        mastery.record(conn, e["kp_id"], e["is_correct"], e["created_at"])
+    conn.executemany("""
+        INSERT INTO mistakes (question_id, wrong_answer, correct_answer, kp_id, first_seen_at, last_seen_at, times)
+        VALUES (:question_id, :user_answer, :correct_answer, :kp_id, :created_at, :created_at, 1)
+        ON CONFLICT(question_id) DO UPDATE SET
+          wrong_answer = excluded.wrong_answer,
+          correct_answer = excluded.correct_answer,
+          last_seen_at = excluded.last_seen_at,
+          times = times + 1
+    """, [e for e in events if not e["is_correct"]])
+
+
+def _db_files(conn):
+    """(main file, shared file or None) of a connection from db.get_db."""
+    files = {name: path for _, name, path in conn.execute("PRAGMA database_list")}
+    return files["main"], files.get("shared")
+
+
+class WriteBehindLog:
+    """Queues attempt events for one database file and writes them in batches from a background thread."""
+
+    def __init__(self, path, shared_path=None, batch_size=None, flush_seconds=None):
+        self.path = path
+        self.shared_path = shared_path
+        self.batch_size = batch_size or ATTEMPT_BATCH_SIZE
+        self.flush_seconds = ATTEMPT_FLUSH_SECONDS if flush_seconds is None else flush_seconds
+        self._queue = []
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._closed = False
+        self._conn = None
+        self._thread = threading.Thread(target=self._run, name=f"attempt-log:{path}", daemon=True)
+        self._thread.start()
+
+    def submit(self, event):
+        with self._cond:
+            self._queue.append(event)
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+
+    def _connect(self):
+        # Used by the writer thread and by flush() callers, one at a time (_write_lock)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        if self.shared_path:
+            conn.execute("ATTACH DATABASE ? AS shared", (self.shared_path,))
+        return conn
+
+    def flush(self):
+        """Writes everything queued so far in one transaction. Returns the number of events written."""
+        with self._write_lock:
+            with self._cond:
+                events, self._queue = self._queue, []
+            if not events:
+                return 0
+            if self._conn is None:
+                self._conn = self._connect()
+            try:
+                with metrics.timer("db_write_seconds", op="attempt_log_flush"):
+                    write(self._conn, events)
+                    self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                with self._cond:
+                    # Put them back in front; they're retried on the next flush
+                    self._queue[:0] = events
+                raise
+            metrics.observe("attempt_log_batch_size", len(events), buckets=(1, 10, 50, 100, 500, 1000))
+            return len(events)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._queue) < self.batch_size:
+                    self._cond.wait(self.flush_seconds)
+                closed = self._closed
+            try:
+                self.flush()
+            except Exception as e:
+                metrics.inc("errors_total", where="attempt_log_flush")
+                print(f"Warning: Could not save answers yet ({e}); will retry.")
+            if closed:
+                return
+
+    def close(self):
+        """Flushes what's left and stops the writer thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def _log_for(conn, create=True):
+    path, shared_path = _db_files(conn)
+    with _logs_lock:
+        log = _logs.get(path)
+        if log is None and create:
+            log = _logs[path] = WriteBehindLog(path, shared_path)
+        return log
+
+
+def record(conn, event):
+    """Records one attempt event according to GRADE_DURABILITY."""
+    if GRADE_DURABILITY == "batch":
+        _log_for(conn).submit(event)
+        return
+    write(conn, [event])
+    conn.commit()
+
+
+def flush(conn):
+    """Writes any queued answers for this connection's database, so reads see them."""
+    log = _log_for(conn, create=False)
+    if log is not None:
+        log.flush()
+
+
+@atexit.register
+def close_all():
+    """Flushes and stops every write-behind log (also run at exit)."""
+    with _logs_lock:
+        logs = list(_logs.values())
+        _logs.clear()
+    for log in logs:
+        log.close()
@@ -0,0 +1,248 @@
+import gzip
+import json
+import datetime
+
+import metrics
+from chunk_store import put_body, link_chunk
+
+# A question bank file is gzip-compressed JSON Lines: a header, then one record per
+# line, each with a "type". Records only refer to ids of records earlier in the file,
+# so both export and import stream it row by row in constant memory:
+#   header    {"format", "version", "created_at", "chunks"}
+#   body      {"hash", "text", "extracted"}                    (only with chunks)
+#   document  {"id", "path", "title", "subject"}               (only with chunks)
+#   chunk     {"id", "document_id", "page_from", "page_to", "hash"}  (only with chunks)
+#   kp        {"id", "subject", "topic", "kp", "importance", "source"}
+#   question  {"id", "kp_id", "qtype", "stem", "options", "answer", "explanation", "source", "created_at"}
+# "source" is {"chunk_id", "hash"} of the linked chunk, or null. Without chunk records,
+# import links to a local chunk with the same text (e.g. the same slides imported on
+# both machines), if there is one.
+
+BANK_FORMAT = "study-partner-bank"
+BANK_VERSION = 1
+BATCH_SIZE = 1000
+
+# Record types as shown to users
+LABELS = {"body": "chunk texts", "document": "documents", "chunk": "chunks",
+          "kp": "knowledge points", "question": "questions"}
+
+
+def _source(chunk_id, digest):
+    return {"chunk_id": chunk_id, "hash": digest} if chunk_id is not None else None
+
+
+def iter_bank(conn, include_chunks=False):
+    """Yields the records of a question bank export (see the format above)."""
+    yield {"type": "header", "format": BANK_FORMAT, "version": BANK_VERSION,
+           "created_at": datetime.datetime.now().isoformat(), "chunks": include_chunks}
+    if include_chunks:
+        for digest, text, extracted_at in conn.execute(
+            "SELECT hash, chunk_text(content_z), extracted_at FROM chunk_bodies ORDER BY id"
+        ):
+            yield {"type": "body", "hash": digest, "text": text, "extracted": extracted_at is not None}
+        for doc_id, path, title, subject in conn.execute("SELECT id, path, title, subject FROM documents ORDER BY id"):
+            yield {"type": "document", "id": doc_id, "path": path, "title": title, "subject": subject}
+        for chunk_id, doc_id, page_from, page_to, digest in conn.execute("""
+            SELECT c.id, c.document_id, c.page_from, c.page_to, b.hash
+            FROM chunks c JOIN chunk_bodies b ON b.id = c.body_id ORDER BY c.id
+        """):
+            yield {"type": "chunk", "id": chunk_id, "document_id": doc_id,
+                   "page_from": page_from, "page_to": page_to, "hash": digest}
+    for kp_id, subject, topic, kp, importance, chunk_id, digest in conn.execute("""
+        SELECT k.id, k.subject, k.topic, k.kp, k.importance, k.source_chunk_id, b.hash
+        FROM knowledge_points k
+        LEFT JOIN chunks c ON c.id = k.source_chunk_id
+        LEFT JOIN chunk_bodies b ON b.id = c.body_id
+        ORDER BY k.id
+    """):
+        yield {"type": "kp", "id": kp_id, "subject": subject, "topic": topic, "kp": kp,
+               "importance": importance, "source": _source(chunk_id, digest)}
+    for (q_id, kp_id, qtype, stem, options, answer, explanation, chunk_id, created_at,
+         digest) in conn.execute("""
+        SELECT q.id, q.kp_id, q.qtype, q.stem, q.options, q.answer, q.explanation,
+               q.source_chunk_id, q.created_at, b.hash
+        FROM questions q
+        LEFT JOIN chunks c ON c.id = q.source_chunk_id
+        LEFT JOIN chunk_bodies b ON b.id = c.body_id
+        ORDER BY q.id
+    """):
+        yield {"type": "question", "id": q_id, "kp_id": kp_id, "qtype": qtype, "stem": stem,
+               "options": json.loads(options) if options else None, "answer": answer,
+               "explanation": explanation, "source": _source(chunk_id, digest), "created_at": created_at}
+
+
+@metrics.timed("bank_seconds", op="export")
+def export_bank(conn, path, include_chunks=False):
+    """Writes the question bank (and optionally the chunks it links to) to path. Returns counts by type."""
+    counts = {}
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for record in iter_bank(conn, include_chunks):
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            counts[record["type"]] = counts.get(record["type"], 0) + 1
+    counts.pop("header", None)
+    return counts
+
+
+class _Importer:
+    """Applies bank records to a database, remapping ids through a temp table."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.counts = {}
+        self._added = {"kp": set(), "question": set()}  # ids inserted by this import
+        conn.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS bank_ids (
+              kind TEXT, old_id INTEGER, new_id INTEGER, PRIMARY KEY(kind, old_id)
+            )
+        """)
+        conn.execute("DELETE FROM temp.bank_ids")
+
+    def _map(self, kind, old_id, new_id):
+        self.conn.execute("INSERT OR REPLACE INTO temp.bank_ids VALUES(?,?,?)", (kind, old_id, new_id))
+
+    def _lookup(self, kind, old_id):
+        row = self.conn.execute(
+            "SELECT new_id FROM temp.bank_ids WHERE kind=? AND old_id=?", (kind, old_id)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _chunk_for(self, source):
+        """Local chunk id for a record's source: the imported chunk, else any chunk with the same text."""
+        if not source:
+            return None
+        chunk_id = self._lookup("chunk", source.get("chunk_id"))
+        if chunk_id is None and source.get("hash"):
+            row = self.conn.execute(
+                "SELECT MIN(c.id) FROM chunks c JOIN chunk_bodies b ON b.id = c.body_id WHERE b.hash=?",
+                (source["hash"],),
+            ).fetchone()
+            chunk_id = row[0]
+        return chunk_id
+
+    def _count(self, kind, added, outcome="existing"):
+        """Counts a record as added, or under "<kind>_<outcome>" (existing, duplicate, conflict)."""
+        key = kind if added else f"{kind}_{outcome}"
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def _outcome(self, kind, row_id):
+        """existing if the row was already in the database, duplicate if this bank added it earlier."""
+        return "duplicate" if row_id in self._added[kind] else "existing"
+
+    def body(self, r):
+        existed = self.conn.execute("SELECT 1 FROM chunk_bodies WHERE hash=?", (r["hash"],)).fetchone()
+        body_id = put_body(self.conn, r["text"])
+        if r.get("extracted"):
+            self.conn.execute(
+                "UPDATE chunk_bodies SET extracted_at = ? WHERE id = ? AND extracted_at IS NULL",
+                (datetime.datetime.now().isoformat(), body_id),
+            )
+        self._count("body", not existed)
+
+    def document(self, r):
+        cur = self.conn.execute(
+            "INSERT OR IGNORE INTO documents(path, title, subject, imported_at) VALUES(?,?,?,?)",
+            (r["path"], r["title"], r["subject"], datetime.datetime.now().isoformat()),
+        )
+        doc_id = self.conn.execute("SELECT id FROM documents WHERE path=?", (r["path"],)).fetchone()[0]
+        self._map("document", r["id"], doc_id)
+        self._count("document", cur.rowcount > 0)
+
+    def chunk(self, r):
+        doc_id = self._lookup("document", r["document_id"])
+        row = self.conn.execute("SELECT id FROM chunk_bodies WHERE hash=?", (r["hash"],)).fetchone()
+        if doc_id is None or row is None:
+            return
+        local = self.conn.execute(
+            "SELECT id, body_id FROM chunks WHERE document_id=? AND page_from=? AND page_to=?",
+            (doc_id, r["page_from"], r["page_to"]),
+        ).fetchone()
+        if local and local[1] != row[0]:
+            # NOTE: This install has its own text for the page; keep it. The bank's
+            # questions are linked by their text instead (see _chunk_for).
+            self._count("chunk", False, "conflict")
+            return
+        self._map("chunk", r["id"], local[0] if local else
+                  link_chunk(self.conn, doc_id, r["page_from"], r["page_to"], row[0]))
+        self._count("chunk", local is None)
+
+    def kp(self, r):
+        row = self.conn.execute(
+            "SELECT id, source_chunk_id FROM knowledge_points WHERE kp=? AND subject IS ? AND topic IS ?",
+            (r["kp"], r.get("subject"), r.get("topic")),
+        ).fetchone()
+        if row:
+            kp_id = row[0]
+            if row[1] is None:
+                # Link it now if its source text has arrived since it was first imported
+                self.conn.execute("UPDATE knowledge_points SET source_chunk_id=? WHERE id=?",
+                                  (self._chunk_for(r.get("source")), kp_id))
+        else:
+            kp_id = self.conn.execute(
+                "INSERT INTO knowledge_points (subject, topic, kp, source_chunk_id, importance) VALUES (?, ?, ?, ?, ?)",
+                (r.get("subject"), r.get("topic"), r["kp"], self._chunk_for(r.get("source")), r.get("importance") or 1),
+            ).lastrowid
+            self._added["kp"].add(kp_id)
+        self._map("kp", r["id"], kp_id)
+        self._count("kp", row is None, row and self._outcome("kp", row[0]))
+
+    def question(self, r):
+        kp_id = self._lookup("kp", r["kp_id"])
+        row = self.conn.execute(
+            "SELECT id, source_chunk_id FROM questions WHERE kp_id IS ? AND stem=?", (kp_id, r["stem"])
+        ).fetchone()
+        if row and row[1] is None:
+            self.conn.execute("UPDATE questions SET source_chunk_id=? WHERE id=?",
+                              (self._chunk_for(r.get("source")), row[0]))
+        elif not row:
+            self._added["question"].add(self.conn.execute(
+                "INSERT INTO questions (kp_id, qtype, stem, options, answer, explanation, source_chunk_id, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (kp_id, r.get("qtype"), r["stem"], json.dumps(r.get("options")), r.get("answer"),
+                 r.get("explanation"), self._chunk_for(r.get("source")), r.get("created_at")),
+            ).lastrowid)
+        self._count("question", row is None, row and self._outcome("question", row[0]))
+
+
+@metrics.timed("bank_seconds", op="import")
+def import_bank(conn, path, batch_size=BATCH_SIZE):
+    """
+    Loads a bank written by export_bank into the database, committing every batch_size
+    records. Knowledge points and questions that are already present are reused rather
+    than duplicated, so importing the same bank twice is harmless. Local chunks are never
+    overwritten. Returns counts by type ("<type>_existing" for records that were already
+    there, "<type>_duplicate" for ones repeated within the bank, "chunk_conflict" for
+    pages this database has different text for).
+    """
+    importer = _Importer(conn)
+    handlers = {
+        "body": importer.body,
+        "document": importer.document,
+        "chunk": importer.chunk,
+        "kp": importer.kp,
+        "question": importer.question,
+    }
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("format") != BANK_FORMAT:
+            raise ValueError(f"{path} is not a Study Partner question bank")
+        if header.get("version", 0) > BANK_VERSION:
+            raise ValueError(f"{path} was written by a newer version (bank format {header['version']})")
+        n = 0
+        try:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                handler = handlers.get(record.get("type"))
+                if handler is None:
+                    continue  # record types from newer versions
+                handler(record)
+                n += 1
+                if n % batch_size == 0:
+                    conn.commit()
+            conn.commit()
+        except BaseException:
+            # Batches already committed stay; re-running the import fills in the rest
+            conn.rollback()
+            raise
+    return importer.counts
@@ -0,0 +1,134 @@
+"""
+Synthetic study corpus generator for the benchmarks.
+
+Writes N documents of P pages each as PDFs and/or text files. Page text is built
+from a fixed vocabulary of study topics with a seeded RNG, so the same arguments
+always produce the same corpus. A fraction of pages can be repeated verbatim across
+documents to mimic lecture decks that reuse slides.
+
+Usage:
+    python benchmarks/corpus.py OUT_DIR --docs 10 --pages 20 --kind pdf
+"""
+import argparse
+import os
+import random
+
+TOPICS = {
+    "Cryptography": ["hash function", "digital signature", "public key", "private key",
+                     "collision resistance", "Merkle tree", "elliptic curve", "nonce"],
+    "Blockchain": ["UTXO", "block header", "proof of work", "mempool", "consensus",
+                   "transaction fee", "double spend", "fork choice rule"],
+    "Physics": ["momentum", "kinetic energy", "wave function", "entropy",
+                "electric field", "inertia", "angular velocity", "photon"],
+    "Biology": ["mitochondria", "ribosome", "cell membrane", "natural selection",
+                "DNA replication", "enzyme", "homeostasis", "photosynthesis"],
+}
+
+TEMPLATES = [
+    "The {a} is closely related to the {b} because both depend on {c}.",
+    "A {a} guarantees that an adversary cannot easily find a {b}.",
+    "In practice the {a} is used together with the {b} to reduce {c} costs.",
+    "Students often confuse the {a} with the {b}, but only the former involves {c}.",
+    "Every {a} must be verified before the {b} can be accepted.",
+    "The key property of a {a} is that it changes whenever the {b} changes.",
+]
+
+
+def page_text(rng, subject, sentences=12):
+    """Returns one page of synthetic prose about subject."""
+    terms = TOPICS[subject]
+    lines = [f"{subject} - Lecture notes"]
+    for _ in range(sentences):
+        a, b, c = rng.sample(terms, 3)
+        lines.append(rng.choice(TEMPLATES).format(a=a, b=b, c=c))
+    return "\n".join(lines)
+
+
+def _pdf_escape(line):
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages):
+    """Writes a minimal multi-page PDF (Helvetica text, no external dependencies)."""
+    objects = []  # object bodies, object number = index + 1
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    pages_obj = add(None)
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    kids = []
+    for text in pages:
+        ops = ["BT", "/F1 10 Tf", "14 TL", "40 760 Td"]
+        for line in text.splitlines():
+            ops.append(f"({_pdf_escape(line)}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+        contents = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_obj, font, contents)
+        ))
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_obj
+    objects[pages_obj - 1] = (b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % k for k in kids)
+                              + b"] /Count %d >>" % len(kids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def generate_corpus(out_dir, n_docs=5, pages=10, kind="pdf", dup_ratio=0.0, seed=0):
+    """
+    Writes n_docs documents of `pages` pages into out_dir.
+
+    kind is "pdf", "txt" or "mixed" (alternating). dup_ratio is the fraction of pages
+    copied verbatim from a shared pool instead of freshly generated.
+    Returns the list of written file paths.
+    """
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    subjects = sorted(TOPICS)
+    shared = [page_text(rng, rng.choice(subjects)) for _ in range(max(1, pages))]
+    paths = []
+    for i in range(n_docs):
+        subject = subjects[i % len(subjects)]
+        doc_pages = [rng.choice(shared) if rng.random() < dup_ratio else page_text(rng, subject)
+                     for _ in range(pages)]
+        doc_kind = kind if kind != "mixed" else ("pdf" if i % 2 == 0 else "txt")
+        path = os.path.join(out_dir, f"{subject.lower()}_{i:04d}.{doc_kind}")
+        if doc_kind == "pdf":
+            write_pdf(path, doc_pages)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("\n\n".join(doc_pages))
+        paths.append(path)
+    return paths
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate a synthetic study corpus.")
+    ap.add_argument("out_dir")
+    ap.add_argument("--docs", type=int, default=5)
+    ap.add_argument("--pages", type=int, default=10)
+    ap.add_argument("--kind", choices=["pdf", "txt", "mixed"], default="pdf")
+    ap.add_argument("--dup-ratio", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    paths = generate_corpus(args.out_dir, args.docs, args.pages, args.kind, args.dup_ratio, args.seed)
+    print(f"Wrote {len(paths)} documents to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Local fake LLM for benchmarks.
+
+Answers the app's prompts with canned, schema-valid JSON after a configurable delay,
+so the benchmarks measure our own code paths rather than network or model time.
+`install()` makes it the active llm backend. For content-derived answers with
+failure injection and rate limits, use llm_standin.LocalBackend instead.
+"""
+import json
+import re
+import time
+
+from llm import LLMBackend, set_backend
+
+_CHUNK_ID = re.compile(r"\[CHUNK_ID:(\d+)\]")
+_N_QUESTIONS = re.compile(r"generate (\d+) multiple-choice")
+
+
+class FakeLLM(LLMBackend):
+    name = "fake"
+
+    def __init__(self, latency=0.0, kps_per_call=8, piece_size=64):
+        self.latency = latency
+        self.kps_per_call = kps_per_call
+        self.piece_size = piece_size
+        self.calls = 0
+        self.prompt_chars = 0
+
+    def respond(self, prompt):
+        """Returns the canned JSON response text for a prompt."""
+        lowered = prompt.lower()
+        if "quiz master" in lowered:
+            match = _N_QUESTIONS.search(prompt)
+            n = int(match.group(1)) if match else 5
+            return json.dumps([
+                {
+                    "qtype": "choice",
+                    "stem": f"Benchmark question {i + 1}?",
+                    "options": {"A": "Alpha", "B": "Beta", "C": "Gamma", "D": "Delta"},
+                    "answer": "B",
+                    "explanation": "Canned benchmark explanation.",
+                }
+                for i in range(n)
+            ])
+        if "grader" in lowered:
+            correct = "student answer: b" in lowered
+            return json.dumps({"is_correct": correct, "correct_answer": "B",
+                               "explanation": "Canned benchmark grading."})
+        if "knowledge point" in lowered:
+            chunk_ids = _CHUNK_ID.findall(prompt) or [None]
+            return json.dumps([
+                {
+                    "subject": "Benchmark",
+                    "topic": f"Topic {i % 3}",
+                    "kp": f"Benchmark knowledge point {i + 1}.",
+                    "chunk_id": int(chunk_ids[i % len(chunk_ids)]) if chunk_ids[0] else None,
+                }
+                for i in range(self.kps_per_call)
+            ])
+        return json.dumps({"summary": "Canned benchmark summary."})
+
+    def complete(self, prompt, system_instruction=""):
+        self.calls += 1
+        self.prompt_chars += len(prompt)
+        if self.latency:
+            time.sleep(self.latency)
+        return self.respond(prompt)
+
+    def stream(self, prompt, system_instruction=""):
+        text = self.complete(prompt, system_instruction)
+        for i in range(0, len(text), self.piece_size):
+            yield text[i:i + self.piece_size]
+
+
+def install(fake):
+    """Routes every LLM call to fake."""
+    set_backend(fake)
@@ -0,0 +1,82 @@
+"""
+Pages/sec of each installed PDF extraction backend (see pdf_extract.py).
+
+Runs every available backend over the same PDFs, either an existing folder (e.g. your
+course material) or a generated synthetic corpus, and reports throughput, extracted
+characters and the process's memory growth. Results can be written as JSON.
+
+Usage:
+    python benchmarks/pdf_backends.py --dir ~/courses/crypto
+    python benchmarks/pdf_backends.py --docs 10 --pages 50 --out pdf_backends.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.dirname(HERE), HERE]
+
+from corpus import generate_corpus  # noqa: E402
+import pdf_extract  # noqa: E402
+
+
+def bench_backend(name, pdfs):
+    # Warm up so the backend's import cost isn't counted against its throughput
+    for _ in pdf_extract.iter_pages(pdfs[0], backend=name, max_seconds=0, max_memory_mb=0):
+        break
+    pages = chars = 0
+    base_mb = pdf_extract._rss_mb()
+    start = time.perf_counter()
+    for path in pdfs:
+        for _, text in pdf_extract.iter_pages(path, backend=name, max_seconds=0, max_memory_mb=0):
+            pages += 1
+            chars += len(text)
+    seconds = time.perf_counter() - start
+    return {
+        "backend": name,
+        "files": len(pdfs),
+        "pages": pages,
+        "chars": chars,
+        "seconds": round(seconds, 4),
+        "pages_per_sec": round(pages / seconds, 1) if seconds else None,
+        "rss_growth_mb": round(pdf_extract._rss_mb() - base_mb, 1),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare PDF extraction backends.")
+    ap.add_argument("--dir", help="Folder of PDFs to use instead of a synthetic corpus.")
+    ap.add_argument("--docs", type=int, default=5)
+    ap.add_argument("--pages", type=int, default=40)
+    ap.add_argument("--out", help="Write results as JSON to this path.")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = args.dir
+        if not folder:
+            generate_corpus(tmp, args.docs, args.pages, "pdf")
+            folder = tmp
+        pdfs = sorted(
+            os.path.join(root, f)
+            for root, _, files in os.walk(folder)
+            for f in files if f.lower().endswith(".pdf")
+        )
+        if not pdfs:
+            sys.exit(f"No PDFs found in {folder}")
+        # rss_growth_mb is measured in one process, so memory a backend keeps after
+        # it finishes also counts against the ones that run after it.
+        results = [bench_backend(name, pdfs) for name in pdf_extract.available_backends()]
+
+    for r in results:
+        print(f"{r['backend']:<10} {r['pages_per_sec']:>9} pages/s  {r['pages']:>6} pages  "
+              f"{r['seconds']:8.2f} s  +{r['rss_growth_mb']} MB")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"pdfs": len(pdfs), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
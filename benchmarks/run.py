@@ -0,0 +1,229 @@
+"""
+End-to-end benchmarks for ingestion, KP extraction, quiz generation, grading,
+reports and the MCP tools.
+
+Each scale gets a fresh synthetic corpus (benchmarks/corpus.py) and a fresh database
+in a temporary directory, and every LLM call goes to the fake backend
+(benchmarks/fake_llm.py, or the content-derived stand-in with --llm local).
+Results are written as JSON so runs can be compared.
+
+Usage:
+    python benchmarks/run.py                              # default scales
+    python benchmarks/run.py --scales 5x5,50x20 --latency 0.05 --out results.json
+    python benchmarks/run.py --compare benchmarks/results/baseline.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [ROOT, HERE]
+
+from corpus import generate_corpus  # noqa: E402
+from fake_llm import FakeLLM, install  # noqa: E402
+
+import chunk_store  # noqa: E402
+import db  # noqa: E402
+import kp_extractor  # noqa: E402
+import parser as study_parser  # noqa: E402
+import quizzer  # noqa: E402
+import report  # noqa: E402
+
+try:
+    import mcp_server
+except ImportError:  # mcp is optional for benchmarking the library paths
+    mcp_server = None
+
+DEFAULT_SCALES = "2x5,10x20,40x40"
+
+
+@contextmanager
+def _quiet():
+    """Silences the progress output the app prints while timing."""
+    with open(os.devnull, "w") as devnull:
+        saved = sys.stdout
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = saved
+
+
+class Timer:
+    def __init__(self, scale):
+        self.scale = scale
+        self.results = []
+
+    @contextmanager
+    def time(self, op, items=1):
+        start = time.perf_counter()
+        box = {"items": items}
+        with _quiet():
+            yield box
+        seconds = time.perf_counter() - start
+        n = box["items"] or 1
+        self.results.append({
+            "scale": self.scale,
+            "op": op,
+            "seconds": round(seconds, 6),
+            "items": box["items"],
+            "ms_per_item": round(seconds * 1000 / n, 4),
+        })
+
+
+def bench_library(timer, corpus_dir, db_path, questions_per_kp):
+    conn = db.get_db(db_path)
+
+    with timer.time("import_path") as box:
+        _, n_chunks = study_parser.import_path(conn, corpus_dir)
+        box["items"] = n_chunks
+
+    doc = "".join(f"[CHUNK_ID:{cid}] {content}\n\n" for cid, content, _ in chunk_store.iter_chunks(conn))
+    with timer.time("extract_knowledge_points") as box:
+        kps = kp_extractor.extract_knowledge_points(doc)
+        box["items"] = len(kps)
+    with timer.time("save_knowledge_points", items=len(kps)):
+        kp_extractor.save_knowledge_points(conn, kps)
+
+    kp_ids = [r[0] for r in conn.execute("SELECT id FROM knowledge_points")]
+    questions = []
+    with timer.time("generate_quiz", items=len(kp_ids)):
+        for kp_id in kp_ids:
+            questions += quizzer.generate_quiz(conn, kp_id, questions_per_kp)
+
+    with timer.time("grade_and_log", items=len(questions)):
+        for i, q in enumerate(questions):
+            quizzer.grade_and_log(conn, q, "B" if i % 2 else "A")
+
+    with timer.time("generate_report"):
+        report.generate_report(conn)
+    conn.close()
+
+
+def bench_mcp(timer, corpus_dir, db_path, questions_per_kp):
+    mcp_server.DB_PATH = db_path
+
+    with timer.time("mcp.import_documents") as box:
+        box["items"] = mcp_server.import_documents(corpus_dir)["chunks"]
+    with timer.time("mcp.extract_kps") as box:
+        box["items"] = mcp_server.extract_kps().get("inserted", 0)
+    with timer.time("mcp.list_kps") as box:
+        kps = mcp_server.list_kps(limit=1000)
+        box["items"] = len(kps)
+
+    question_ids = []
+    with timer.time("mcp.generate_quiz_tool", items=len(kps)):
+        for kp in kps:
+            question_ids += [q["id"] for q in mcp_server.generate_quiz_tool(kp["id"], questions_per_kp)]
+    with timer.time("mcp.grade", items=len(question_ids)):
+        for i, qid in enumerate(question_ids):
+            mcp_server.grade(qid, "B" if i % 2 else "A")
+    with timer.time("mcp.export_report_tool"):
+        mcp_server.export_report_tool()
+
+    conn = sqlite3.connect(db_path)
+    chunk_ids = [r[0] for r in conn.execute("SELECT id FROM chunks")]
+    conn.close()
+    with timer.time("mcp.get_chunk", items=len(chunk_ids)):
+        for cid in chunk_ids:
+            mcp_server.get_chunk(cid)
+
+
+def run(scales, latency, kind, questions_per_kp, dup_ratio, llm_name="fake"):
+    if llm_name == "local":
+        from llm_standin import Limits, LocalBackend
+        backend = LocalBackend(Limits(latency=latency))
+    else:
+        backend = FakeLLM(latency=latency)
+    install(backend)
+    results = []
+    cwd = os.getcwd()
+    for scale in scales:
+        n_docs, pages = (int(x) for x in scale.split("x"))
+        with tempfile.TemporaryDirectory() as tmp:
+            corpus_dir = os.path.join(tmp, "corpus")
+            generate_corpus(corpus_dir, n_docs, pages, kind, dup_ratio)
+            os.chdir(tmp)  # generate_report writes into ./reports
+            try:
+                timer = Timer(scale)
+                bench_library(timer, corpus_dir, os.path.join(tmp, "lib.db"), questions_per_kp)
+                if mcp_server is not None:
+                    bench_mcp(timer, corpus_dir, os.path.join(tmp, "mcp.db"), questions_per_kp)
+            finally:
+                os.chdir(cwd)
+        for r in timer.results:
+            print(f"{r['scale']:>8}  {r['op']:<28} {r['seconds'] * 1000:10.1f} ms  "
+                  f"{r['ms_per_item']:9.3f} ms/item  ({r['items']} items)")
+        results += timer.results
+    return {
+        "meta": {
+            "created_at": datetime.datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sqlite": sqlite3.sqlite_version,
+            "llm": llm_name,
+            "latency": latency,
+            "kind": kind,
+            "questions_per_kp": questions_per_kp,
+            "dup_ratio": dup_ratio,
+            "llm_calls": getattr(backend, "calls", None),
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline_path, threshold):
+    """Prints ops that got slower than baseline by more than threshold; returns True if none did."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["scale"], r["op"]): r for r in json.load(f)["results"]}
+    ok = True
+    for r in current["results"]:
+        base = baseline.get((r["scale"], r["op"]))
+        if not base or not base["ms_per_item"]:
+            continue
+        change = r["ms_per_item"] / base["ms_per_item"] - 1
+        if change > threshold:
+            ok = False
+            print(f"REGRESSION {r['scale']} {r['op']}: {base['ms_per_item']:.3f} -> "
+                  f"{r['ms_per_item']:.3f} ms/item (+{change:.0%})")
+    if ok:
+        print(f"No regressions over {threshold:.0%} against {baseline_path}")
+    return ok
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Run the Study Partner benchmarks.")
+    ap.add_argument("--scales", default=DEFAULT_SCALES, help="Comma-separated DOCSxPAGES list.")
+    ap.add_argument("--llm", choices=["fake", "local"], default="fake",
+                    help="fake: canned JSON; local: content-derived stand-in (llm_standin.py).")
+    ap.add_argument("--latency", type=float, default=0.0, help="LLM latency per call, in seconds.")
+    ap.add_argument("--kind", choices=["pdf", "txt", "mixed"], default="pdf")
+    ap.add_argument("--questions-per-kp", type=int, default=3)
+    ap.add_argument("--dup-ratio", type=float, default=0.0, help="Fraction of repeated pages in the corpus.")
+    ap.add_argument("--out", default=None, help="Results JSON path (default: benchmarks/results/<timestamp>.json).")
+    ap.add_argument("--compare", default=None, help="Baseline results JSON to compare against.")
+    ap.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown before flagging a regression.")
+    args = ap.parse_args()
+
+    data = run(args.scales.split(","), args.latency, args.kind, args.questions_per_kp, args.dup_ratio, args.llm)
+
+    out = args.out or os.path.join(HERE, "results", datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    print(f"Results written to {out}")
+
+    if args.compare and not compare(data, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Startup-time budget check for the CLI and MCP server.
+
+Runs `python -X importtime` on each entry point and fails if its import time goes
+over budget or if it eagerly loads a module that should only be imported by the
+commands/tools that need it.
+
+Usage:
+    python benchmarks/startup.py                 # check app.py and mcp_server.py
+    python benchmarks/startup.py --budget-ms 200 --runs 5   # same budget for every entry point
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules each entry point must not import at load time
+LAZY_MODULES = ["PyPDF2", "pdf_extract", "google.generativeai", "parser", "llm", "quizzer", "kp_extractor", "report", "watcher", "classifier", "work_queue"]
+
+# The MCP server has to import the mcp SDK itself, which dominates its budget.
+ENTRY_POINTS = {
+    "app": {"budget_ms": 250, "forbidden": LAZY_MODULES + ["mcp", "dotenv"], "help": ["app.py", "--help"]},
+    "mcp_server": {"budget_ms": 1000, "forbidden": LAZY_MODULES, "help": None},
+}
+
+
+def import_profile(module):
+    """Returns ({module: cumulative_us}, total_us) for a fresh `import module`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr.strip().splitlines()[-1]}")
+    cumulative = {}
+    total = 0
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cum, name = line.split("|", 2)
+        try:
+            cum_us = int(cum.strip())
+        except ValueError:
+            continue  # header line
+        depth = len(name) - len(name.lstrip(" "))
+        name = name.strip()
+        cumulative[name] = cum_us
+        if depth <= 1:
+            total += cum_us
+    return cumulative, total
+
+
+def wall_time(argv, runs):
+    """Median wall-clock seconds for running `python <argv>`."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + argv, cwd=ROOT, capture_output=True)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def check(runs, budget_ms=None):
+    ok = True
+    for module, spec in ENTRY_POINTS.items():
+        budget = budget_ms or spec["budget_ms"]
+        try:
+            profile, total_us = min((import_profile(module) for _ in range(runs)), key=lambda p: p[1])
+        except RuntimeError as e:
+            print(f"SKIP {module}: {e}")
+            continue
+        loaded = [m for m in spec["forbidden"] if m in profile]
+        status = "OK"
+        if loaded or total_us / 1000 > budget:
+            status = "FAIL"
+            ok = False
+        print(f"{status} import {module}: {total_us / 1000:.1f} ms (budget {budget:g} ms)")
+        if loaded:
+            print(f"     eagerly imports: {', '.join(loaded)}")
+        slowest = sorted(profile.items(), key=lambda kv: kv[1], reverse=True)[:5]
+        for name, cum_us in slowest:
+            print(f"     {cum_us / 1000:8.1f} ms  {name}")
+        if spec["help"]:
+            print(f"     `python {' '.join(spec['help'])}`: {wall_time(spec['help'], runs) * 1000:.0f} ms wall")
+    return ok
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--budget-ms", type=float, default=None,
+                    help="Override the per-entry-point import time budget.")
+    ap.add_argument("--runs", type=int, default=3, help="Runs per measurement (best/median is kept).")
+    args = ap.parse_args()
+    sys.exit(0 if check(args.runs, args.budget_ms) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import os
+import re
+import zlib
+import hashlib
+import datetime
+import unicodedata
+
+import metrics
+
+# Chunks are content-addressed: each chunks row maps a (document, page range) to a
+# shared row in chunk_bodies, keyed by a hash of the normalized text, so a slide or
+# page repeated across documents is stored, and sent to the LLM for extraction, once.
+#
+# Bodies are stored compressed in chunk_bodies.content_z. Each blob starts with a
+# one-byte codec tag so rows written with different codecs/dictionaries can coexist:
+#   b"Z" + zlib data
+#   b"S" + zstd data
+#   b"D" + 4-byte dictionary id + zstd data compressed with that trained dictionary
+# preview and content_len are stored alongside, so callers that only need those
+# never decompress. Every connection from db.get_db() has SQL functions registered
+# for this: chunk_pack(text), chunk_text(content_z) and, for rows from before the
+# compression migration, chunk_text(content, content_z).
+
+PREVIEW_CHARS = 200
+CHUNK_CODEC = os.getenv("CHUNK_CODEC", "auto")   # auto, zlib or zstd
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _codec():
+    if CHUNK_CODEC == "zstd" and zstandard is None:
+        raise RuntimeError("CHUNK_CODEC=zstd needs the 'zstandard' package (pip install zstandard)")
+    if CHUNK_CODEC == "zlib" or zstandard is None:
+        return "zlib"
+    return "zstd"
+
+
+class _Codec:
+    """Per-connection compressor state: the active dictionary and decompressors by dictionary id."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.codec = _codec()
+        self.dicts = {}
+        self.active_dict = None
+        if self.codec == "zstd":
+            row = conn.execute(
+                "SELECT id FROM compression_dicts WHERE codec='zstd' ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+            if row:
+                self.active_dict = row[0]
+                self._dict(row[0])
+            self._plain = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+            self._dict_compressor = (
+                zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=self.dicts[self.active_dict])
+                if self.active_dict else None
+            )
+
+    def _dict(self, dict_id):
+        if dict_id not in self.dicts:
+            row = self.conn.execute("SELECT data FROM compression_dicts WHERE id=?", (dict_id,)).fetchone()
+            if not row:
+                raise ValueError(f"compression dictionary {dict_id} is missing")
+            self.dicts[dict_id] = zstandard.ZstdCompressionDict(row[0])
+        return self.dicts[dict_id]
+
+    def pack(self, text):
+        if text is None:
+            return None
+        data = text.encode("utf-8")
+        if self.codec == "zlib":
+            return b"Z" + zlib.compress(data, ZLIB_LEVEL)
+        if self._dict_compressor is not None:
+            return b"D" + self.active_dict.to_bytes(4, "big") + self._dict_compressor.compress(data)
+        return b"S" + self._plain.compress(data)
+
+    def unpack(self, blob):
+        if blob is None:
+            return None
+        tag, body = blob[:1], blob[1:]
+        if tag == b"Z":
+            return zlib.decompress(body).decode("utf-8")
+        if zstandard is None:
+            raise RuntimeError("This chunk was compressed with zstd; install the 'zstandard' package to read it")
+        if tag == b"S":
+            return zstandard.ZstdDecompressor().decompress(body).decode("utf-8")
+        if tag == b"D":
+            dict_id = int.from_bytes(body[:4], "big")
+            return zstandard.ZstdDecompressor(dict_data=self._dict(dict_id)).decompress(body[4:]).decode("utf-8")
+        raise ValueError(f"unknown chunk codec tag {tag!r}")
+
+
+def register(conn):
+    """Registers chunk_pack()/chunk_text() on a connection (done by db.get_db)."""
+    codec = _Codec(conn)
+    conn.create_function("chunk_pack", 1, codec.pack)
+    conn.create_function("chunk_text", 1, codec.unpack, deterministic=True)
+    # Rows written before compression keep their text in `content`
+    conn.create_function(
+        "chunk_text", 2,
+        lambda content, content_z: content if content is not None else codec.unpack(content_z),
+        deterministic=True,
+    )
+
+
+def preview(text, n=PREVIEW_CHARS):
+    """The stored preview of a chunk: its first n characters."""
+    return text[:n] if text else text
+
+
+def content_hash(text):
+    """
+    Hash identifying a chunk body. Unicode forms and whitespace are normalized first, so
+    the same slide extracted with different line breaks or spacing maps to one body.
+    """
+    normalized = re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def put_body(conn, text):
+    """Returns the id of the body holding text, storing it first if it is new. Does not commit."""
+    digest = content_hash(text)
+    row = conn.execute("SELECT id FROM chunk_bodies WHERE hash=?", (digest,)).fetchone()
+    if row:
+        metrics.inc("chunk_dedup_hits_total")
+        return row[0]
+    cur = conn.execute(
+        "INSERT INTO chunk_bodies(hash, content_z, content_len, preview) VALUES(?,chunk_pack(?),?,?)",
+        (digest, text, len(text), preview(text)),
+    )
+    return cur.lastrowid
+
+
+# ---------- Accessors ----------
+
+def put_chunk(conn, doc_id, page_from, page_to, text):
+    """
+    Stores a chunk, reusing the body of an identical chunk if there is one; returns
+    the chunk's id. If the document already has a chunk for these pages (the file is
+    being re-imported) it is pointed at the new text, keeping its id so knowledge
+    points and questions linked to it stay valid. Does not commit.
+    """
+    return link_chunk(conn, doc_id, page_from, page_to, put_body(conn, text))
+
+
+def link_chunk(conn, doc_id, page_from, page_to, body_id):
+    """put_chunk() for text already stored with put_body(). Does not commit."""
+    row = conn.execute(
+        "SELECT id FROM chunks WHERE document_id=? AND page_from=? AND page_to=?",
+        (doc_id, page_from, page_to),
+    ).fetchone()
+    if row:
+        conn.execute("UPDATE chunks SET body_id=? WHERE id=?", (body_id, row[0]))
+        return row[0]
+    cur = conn.execute(
+        "INSERT INTO chunks(document_id, page_from, page_to, body_id) VALUES(?,?,?,?)",
+        (doc_id, page_from, page_to, body_id),
+    )
+    return cur.lastrowid
+
+
+def get_chunk_text(conn, chunk_id):
+    """Returns the full text of a chunk, or None if it doesn't exist."""
+    row = conn.execute(
+        "SELECT chunk_text(b.content_z) FROM chunks c JOIN chunk_bodies b ON b.id = c.body_id WHERE c.id=?",
+        (chunk_id,),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def get_chunk_info(conn, chunk_id):
+    """Returns {id, document_id, page_from, page_to, body_id, content_len, preview} without decompressing."""
+    row = conn.execute(
+        "SELECT c.id, c.document_id, c.page_from, c.page_to, c.body_id, b.content_len, b.preview "
+        "FROM chunks c JOIN chunk_bodies b ON b.id = c.body_id WHERE c.id=?",
+        (chunk_id,),
+    ).fetchone()
+    if not row:
+        return None
+    keys = ("id", "document_id", "page_from", "page_to", "body_id", "content_len", "preview")
+    return dict(zip(keys, row))
+
+
+def iter_chunks(conn, subject=None, chunk_ids=None, unextracted=False):
+    """
+    Yields (chunk_id, text, document_subject) for all chunks, the chunks of documents
+    with the given subject, or the given chunk ids. Rows are decompressed one at a time.
+
+    Each body is yielded once, under its lowest matching chunk id, so text repeated
+    across documents isn't sent to the LLM twice. With unextracted=True, bodies already
+    marked by mark_extracted() are skipped.
+    """
+    sql = ("SELECT MIN(c.id), chunk_text(b.content_z), MIN(d.subject) "
+           "FROM chunks c JOIN chunk_bodies b ON b.id = c.body_id "
+           "JOIN documents d ON d.id = c.document_id")
+    params = ()
+    clauses = []
+    if subject is not None:
+        clauses.append("d.subject = ?")
+        params += (subject,)
+    if chunk_ids is not None:
+        chunk_ids = list(chunk_ids)
+        if not chunk_ids:
+            return
+        clauses.append(f"c.id IN ({','.join('?' * len(chunk_ids))})")
+        params += tuple(chunk_ids)
+    if unextracted:
+        clauses.append("b.extracted_at IS NULL")
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    yield from conn.execute(sql + " GROUP BY b.id ORDER BY MIN(c.id)", params)
+
+
+def mark_extracted(conn, chunk_ids):
+    """Marks the bodies of the given chunks as processed by KP extraction. Does not commit."""
+    chunk_ids = list(chunk_ids)
+    if chunk_ids:
+        conn.execute(
+            f"UPDATE chunk_bodies SET extracted_at = ? WHERE extracted_at IS NULL AND id IN "
+            f"(SELECT body_id FROM chunks WHERE id IN ({','.join('?' * len(chunk_ids))}))",
+            (datetime.datetime.now().isoformat(), *chunk_ids),
+        )
+
+
+# ---------- Maintenance ----------
+
+def compress_legacy_rows(conn, batch_size=500):
+    """
+    Compresses chunks still stored in plain `content`, committing every batch. Returns
+    rows done. Only used by the migrations; bodies now live in chunk_bodies.
+    """
+    done = 0
+    while True:
+        ids = [r[0] for r in conn.execute(
+            "SELECT id FROM chunks WHERE content IS NOT NULL LIMIT ?", (batch_size,)
+        )]
+        if not ids:
+            return done
+        marks = ",".join("?" * len(ids))
+        conn.execute(
+            f"UPDATE chunks SET content_z = chunk_pack(content), content_len = length(content), "
+            f"preview = substr(content, 1, {PREVIEW_CHARS}), content = NULL WHERE id IN ({marks})",
+            ids,
+        )
+        conn.commit()
+        done += len(ids)
+
+
+def move_to_bodies(conn, batch_size=500):
+    """
+    Moves the text of chunks without a body_id into shared chunk_bodies rows,
+    committing every batch. Returns rows done. Only used by the migrations.
+    """
+    done = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, chunk_text(content, content_z) FROM chunks WHERE body_id IS NULL LIMIT ?", (batch_size,)
+        ).fetchall()
+        if not rows:
+            return done
+        for chunk_id, text in rows:
+            conn.execute(
+                "UPDATE chunks SET body_id = ?, content = NULL, content_z = NULL, content_len = NULL, "
+                "preview = NULL WHERE id = ?",
+                (put_body(conn, text or ""), chunk_id),
+            )
+        conn.commit()
+        done += len(rows)
+
+
+def train_dictionary(conn, sample_limit=2000, dict_size=110 * 1024):
+    """
+    Trains a zstd dictionary on a random sample of chunk bodies, makes it the one new
+    chunks are compressed with, and returns its id. Run recompress() afterwards to
+    apply it to existing rows.
+    """
+    if zstandard is None:
+        raise RuntimeError("Dictionary training needs the 'zstandard' package (pip install zstandard)")
+    samples = [
+        text.encode("utf-8")
+        for (text,) in conn.execute(
+            "SELECT chunk_text(content_z) FROM chunk_bodies ORDER BY RANDOM() LIMIT ?", (sample_limit,)
+        )
+        if text
+    ]
+    if len(samples) < 10:
+        raise ValueError("Need at least 10 distinct chunks to train a compression dictionary")
+    trained = zstandard.train_dictionary(dict_size, samples)
+    cur = conn.execute(
+        "INSERT INTO compression_dicts(codec, data, created_at) VALUES('zstd', ?, ?)",
+        (trained.as_bytes(), datetime.datetime.now().isoformat()),
+    )
+    conn.commit()
+    register(conn)
+    return cur.lastrowid
+
+
+def recompress(conn, batch_size=500):
+    """Re-encodes every chunk body with the current codec and dictionary. Returns rows rewritten."""
+    done = 0
+    last_id = 0
+    while True:
+        ids = [r[0] for r in conn.execute(
+            "SELECT id FROM chunk_bodies WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+        )]
+        if not ids:
+            return done
+        marks = ",".join("?" * len(ids))
+        conn.execute(
+            f"UPDATE chunk_bodies SET content_z = chunk_pack(chunk_text(content_z)) WHERE id IN ({marks})",
+            ids,
+        )
+        conn.commit()
+        done += len(ids)
+        last_id = ids[-1]
@@ -0,0 +1,250 @@
+import os
+import re
+import sys
+import math
+from collections import Counter
+
+import metrics
+
+# Assigns a subject and topic to imported documents and their chunks without asking the
+# LLM, from TF-IDF centroids of what is already labelled: documents whose subject was
+# given at import (or chosen by the LLM), and extracted knowledge points with their
+# subject/topic. A document is labelled when the best subject beats the runner-up by at
+# least CLASSIFY_THRESHOLD (cosine similarity); the others are sent to the LLM together
+# in one short prompt, and their answers train the next import.
+#
+# CLASSIFY_MODE: auto (local, then LLM below the threshold), local (never ask the LLM;
+# unsure documents keep no subject, as before) or off.
+
+CLASSIFY_MODE = os.getenv("CLASSIFY_MODE", "auto")
+CLASSIFY_THRESHOLD = float(os.getenv("CLASSIFY_THRESHOLD", "0.1"))
+TRAIN_CHUNKS_PER_SUBJECT = 200  # labelled chunks read per subject when training
+EXCERPT_TOKENS = 300  # text per document sent to the LLM
+
+CLASSIFY_PROMPT = """
+You are organizing a student's study material. Choose a subject and a topic for each document below.
+{known}
+Return a JSON array with one object per document:
+- "doc_id": The ID from [DOC_ID:X] markers
+- "subject": The main subject (e.g., "Physics", "Computer Science")
+- "topic": The sub-topic or chapter the document covers
+
+Documents:
+---
+{docs}
+---
+"""
+
+LABEL_SCHEMA = {
+    "doc_id": (int, True),
+    "subject": (str, True),
+    "topic": (str, False),
+}
+
+_WORD = re.compile(r"[^\W\d_]{3,}")
+_CJK = re.compile("[\u3400-\u4dbf\u4e00-\u9fff]+")
+STOPWORDS = frozenset("""
+the and for are but not you all any can had her was one our out has him his how its may new now
+old see two way who did get let put say she too use that with have this will your from they been
+were said each which their there what about would these other into than then them some could
+when also more very what where while such only over most just many should those because being
+""".split())
+
+
+def terms(text):
+    """Lowercased words (minus stopwords) and CJK character pairs of text."""
+    text = text.lower()
+    out = [w for w in _WORD.findall(text) if w not in STOPWORDS]
+    for run in _CJK.findall(text):
+        out += [run[i:i + 2] for i in range(len(run) - 1)] or [run]
+    return out
+
+
+def _unit(vec):
+    norm = math.sqrt(sum(v * v for v in vec.values()))
+    return {t: v / norm for t, v in vec.items()} if norm else {}
+
+
+class Model:
+    """Subject centroids, and topic centroids within each subject, over TF-IDF term weights."""
+
+    def __init__(self, samples):
+        # samples: (subject, topic or None, Counter of terms)
+        n_docs = len(samples)
+        df = Counter(t for _, _, counts in samples for t in counts)
+        self.idf = {t: math.log((1 + n_docs) / (1 + n)) + 1 for t, n in df.items()}
+        subjects, topics = {}, {}
+        for subject, topic, counts in samples:
+            vec = self.vector(counts)
+            for target, key in ((subjects, subject), (topics.setdefault(subject, {}), topic)):
+                if key is None:
+                    continue
+                acc = target.setdefault(key, Counter())
+                acc.update(vec)
+        self.subjects = {s: _unit(v) for s, v in subjects.items()}
+        self.topics = {s: {t: _unit(v) for t, v in ts.items()} for s, ts in topics.items()}
+
+    def vector(self, counts):
+        return _unit({t: (1 + math.log(n)) * self.idf.get(t, 0) for t, n in counts.items() if t in self.idf})
+
+    @staticmethod
+    def _best(vec, centroids):
+        scores = sorted(
+            ((sum(w * c.get(t, 0) for t, w in vec.items()), label) for label, c in centroids.items()),
+            reverse=True,
+        )
+        if not scores or scores[0][0] <= 0:
+            return None, 0.0
+        if len(scores) < 2:
+            # NOTE: Nothing to tell it apart from (e.g. a library with one subject so
+            # far); any text would match it, so the label comes with no confidence
+            return scores[0][1], 0.0
+        return scores[0][1], round(scores[0][0] - scores[1][0], 4)
+
+    def predict(self, counts, subject=None):
+        """(subject, confidence, topic, topic confidence); with subject given only the topic is predicted."""
+        vec = self.vector(counts)
+        confidence = None
+        if subject is None:
+            subject, confidence = self._best(vec, self.subjects)
+        topic, topic_confidence = self._best(vec, self.topics.get(subject, {}))
+        return subject, confidence, topic, topic_confidence
+
+
+def _samples(conn):
+    samples = []
+    for subject, topic, kp in conn.execute(
+        "SELECT subject, topic, kp FROM knowledge_points WHERE subject IS NOT NULL AND kp IS NOT NULL"
+    ):
+        samples.append((subject, topic, Counter(terms(f"{topic or ''} {kp}"))))
+    labelled = [r[0] for r in conn.execute(
+        "SELECT DISTINCT subject FROM documents WHERE subject IS NOT NULL AND subject_source IN ('user', 'llm')"
+    )]
+    for subject in labelled:
+        for text, topic in conn.execute("""
+            SELECT chunk_text(b.content_z), COALESCE(c.topic, d.topic)
+            FROM documents d JOIN chunks c ON c.document_id = d.id JOIN chunk_bodies b ON b.id = c.body_id
+            WHERE d.subject = ? AND d.subject_source IN ('user', 'llm')
+            ORDER BY c.id LIMIT ?
+        """, (subject, TRAIN_CHUNKS_PER_SUBJECT)):
+            samples.append((subject, topic, Counter(terms(f"{subject} {text}"))))
+    return samples
+
+
+_model = None
+_model_key = None
+
+
+def model(conn):
+    """The model for the labels currently in the database (retrained only when they change)."""
+    global _model, _model_key
+    # NOTE: Keyed on the labels themselves, so e.g. a subject changed on re-import retrains it
+    key = (
+        conn.execute("PRAGMA database_list").fetchone()[2],
+        tuple(conn.execute(
+            "SELECT subject, topic, COUNT(*), MAX(id) FROM knowledge_points WHERE subject IS NOT NULL "
+            "GROUP BY subject, topic").fetchall()),
+        tuple(conn.execute(
+            "SELECT subject, topic, COUNT(*), MAX(id) FROM documents WHERE subject_source IN ('user', 'llm') "
+            "GROUP BY subject, topic").fetchall()),
+        conn.execute("SELECT MAX(id) FROM chunks").fetchone(),
+    )
+    if key != _model_key:
+        with metrics.timer("classify_seconds", step="train"):
+            _model, _model_key = Model(_samples(conn)), key
+    return _model
+
+
+def _label_chunks(conn, m, doc_id, chunk_counts, subject, topic, confidence, keep_subject=False):
+    """
+    Labels each chunk on its own where the model is sure, else with the document's
+    labels. With keep_subject, every chunk keeps the document's subject and only gets its own topic.
+    """
+    for chunk_id, counts in chunk_counts:
+        c_subject, c_conf, c_topic, _ = (None, 0.0, None, 0.0) if keep_subject else m.predict(counts)
+        if c_subject is None or c_conf < CLASSIFY_THRESHOLD:
+            c_subject, c_conf = subject, confidence
+            c_topic = m.predict(counts, subject)[2] if subject else None
+        conn.execute("UPDATE chunks SET subject = ?, topic = ?, confidence = ? WHERE id = ?",
+                     (c_subject, c_topic or topic, c_conf, chunk_id))
+
+
+def classify_documents(conn, doc_ids):
+    """
+    Labels the given documents and their chunks: the local model first, then (in auto
+    mode) one LLM call for the documents it isn't sure about. Documents whose subject was
+    given at import keep it; only their topics are filled in. Returns counts by source.
+    """
+    counts = {"classifier": 0, "llm": 0, "unlabelled": 0}
+    doc_ids = list(doc_ids)
+    if CLASSIFY_MODE == "off" or not doc_ids:
+        return counts
+    m = model(conn)
+    unsure = []
+    with metrics.timer("classify_seconds", step="local"):
+        for doc_id in doc_ids:
+            row = conn.execute("SELECT subject, subject_source FROM documents WHERE id = ?", (doc_id,)).fetchone()
+            if row is None:
+                continue
+            given = row[0] if row[1] == "user" else None
+            chunk_counts = [(chunk_id, Counter(terms(text))) for chunk_id, text in conn.execute(
+                "SELECT c.id, chunk_text(b.content_z) FROM chunks c JOIN chunk_bodies b ON b.id = c.body_id "
+                "WHERE c.document_id = ? ORDER BY c.id", (doc_id,)
+            )]
+            total = sum((c for _, c in chunk_counts), Counter())
+            subject, confidence, topic, _ = m.predict(total, given)
+            if given:
+                conn.execute("UPDATE documents SET topic = ? WHERE id = ?", (topic, doc_id))
+            elif subject is not None and confidence >= CLASSIFY_THRESHOLD:
+                conn.execute(
+                    "UPDATE documents SET subject = ?, topic = ?, subject_confidence = ?, subject_source = 'classifier' "
+                    "WHERE id = ?", (subject, topic, confidence, doc_id))
+                counts["classifier"] += 1
+            else:
+                unsure.append(doc_id)
+                continue
+            _label_chunks(conn, m, doc_id, chunk_counts, subject, topic, confidence, keep_subject=bool(given))
+    conn.commit()
+    metrics.inc("classify_documents_total", counts["classifier"], source="classifier")
+    if unsure and CLASSIFY_MODE == "auto":
+        for doc_id, subject, topic in _ask_llm(conn, unsure, sorted(m.subjects)):
+            conn.execute(
+                "UPDATE documents SET subject = ?, topic = ?, subject_confidence = NULL, subject_source = 'llm' "
+                "WHERE id = ?", (subject, topic, doc_id))
+            conn.execute("UPDATE chunks SET subject = ?, topic = ?, confidence = NULL WHERE document_id = ?",
+                         (subject, topic, doc_id))
+            counts["llm"] += 1
+        conn.commit()
+        metrics.inc("classify_documents_total", counts["llm"], source="llm")
+    counts["unlabelled"] = len(unsure) - counts["llm"]
+    return counts
+
+
+def _ask_llm(conn, doc_ids, known_subjects):
+    """Yields (doc_id, subject, topic) chosen by the LLM, batching documents into as few calls as fit the budget."""
+    import tokens
+    from llm import ask_gemini_cli_stream
+    from response_parser import JsonArrayStream
+
+    excerpts = []
+    for doc_id in doc_ids:
+        title = conn.execute("SELECT title FROM documents WHERE id = ?", (doc_id,)).fetchone()[0]
+        text = " ".join(t for t, in conn.execute(
+            "SELECT chunk_text(b.content_z) FROM chunks c JOIN chunk_bodies b ON b.id = c.body_id "
+            "WHERE c.document_id = ? ORDER BY c.id LIMIT 3", (doc_id,)
+        ))
+        excerpts.append((doc_id, f"[DOC_ID:{doc_id}] {title}\n{tokens.truncate(text, EXCERPT_TOKENS)}\n\n"))
+    known = f"Prefer these existing subjects when one fits: {', '.join(known_subjects)}" if known_subjects else ""
+    ids = set(doc_ids)
+    for batch in tokens.pack(excerpts, tokens.room("classify", CLASSIFY_PROMPT, known), text=lambda e: e[1]):
+        prompt = CLASSIFY_PROMPT.format(known=known, docs="".join(text for _, text in batch))
+        parser = JsonArrayStream(LABEL_SCHEMA)
+        try:
+            for item in parser.iter(tokens.track_stream(conn, "classify", prompt, ask_gemini_cli_stream(prompt))):
+                if item["doc_id"] in ids:
+                    ids.discard(item["doc_id"])
+                    yield item["doc_id"], item["subject"], item.get("topic")
+        except Exception as e:
+            metrics.inc("errors_total", where="classify_llm")
+            print(f"Warning: Could not classify documents with the LLM ({e}); their subject is left open.",
+                  file=sys.stderr)
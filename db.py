@@ -1,7 +1,13 @@
 import sqlite3
 import os
+import re
 
-SCHEMA = """
+import chunk_store
+import mastery
+
+# Study material (documents, chunks, knowledge points, questions) is shared by
+# everyone using a database; a learner's own history (attempts, mistakes) is USER_SCHEMA.
+SHARED_SCHEMA = """
 -- documents: stores metadata for source files
 CREATE TABLE IF NOT EXISTS documents (
   id INTEGER PRIMARY KEY,
@@ -46,7 +52,9 @@ CREATE TABLE IF NOT EXISTS questions (
   FOREIGN KEY(kp_id) REFERENCES knowledge_points(id),
   FOREIGN KEY(source_chunk_id) REFERENCES chunks(id)
 );
+"""
 
+USER_SCHEMA = """
 -- attempts: record of user's answers
 CREATE TABLE IF NOT EXISTS attempts (
   id INTEGER PRIMARY KEY,
@@ -72,19 +80,268 @@ CREATE TABLE IF NOT EXISTS mistakes (
 );
 """
 
-def get_db(path: str = "study.db"):
+SCHEMA = SHARED_SCHEMA + USER_SCHEMA
+
+# ---------- Migrations ----------
+# SCHEMA above is the original layout; each migration below upgrades it one step and
+# PRAGMA user_version records how many have been applied. Add new schema changes
+# as a new function at the end of MIGRATIONS, never by editing SCHEMA. Steps that
+# change attempts/mistakes must also be added to USER_MIGRATIONS, which upgrades the
+# per-user files (see get_db); write those so they only touch USER_SCHEMA tables.
+
+def _m1_compressed_chunks(conn):
+    """Store chunk bodies compressed, with a preview and length readable without decompressing."""
+    conn.executescript("""
+        ALTER TABLE chunks ADD COLUMN content_z BLOB;
+        ALTER TABLE chunks ADD COLUMN content_len INTEGER;
+        ALTER TABLE chunks ADD COLUMN preview TEXT;
+
+        -- compression_dicts: trained zstd dictionaries referenced by compressed chunks
+        CREATE TABLE IF NOT EXISTS compression_dicts (
+          id INTEGER PRIMARY KEY,
+          codec TEXT,
+          data BLOB,
+          created_at TEXT
+        );
+    """)
+    chunk_store.register(conn)
+    chunk_store.compress_legacy_rows(conn)
+
+def _m2_chunk_bodies(conn):
+    """Deduplicate chunk text: chunks point at shared, content-addressed chunk_bodies rows."""
+    conn.executescript("""
+        -- chunk_bodies: unique chunk text, keyed by a hash of its normalized form
+        CREATE TABLE IF NOT EXISTS chunk_bodies (
+          id INTEGER PRIMARY KEY,
+          hash TEXT UNIQUE,
+          content_z BLOB,
+          content_len INTEGER,
+          preview TEXT,
+          extracted_at TEXT
+        );
+
+        ALTER TABLE chunks ADD COLUMN body_id INTEGER REFERENCES chunk_bodies(id);
+        CREATE INDEX IF NOT EXISTS idx_chunks_body ON chunks(body_id);
+    """)
+    chunk_store.register(conn)
+    chunk_store.move_to_bodies(conn)
+    # Bodies that already have knowledge points don't need extracting again
+    conn.execute("""
+        UPDATE chunk_bodies SET extracted_at = datetime('now')
+        WHERE id IN (SELECT c.body_id FROM knowledge_points k JOIN chunks c ON c.id = k.source_chunk_id)
+    """)
+
+def _m3_incremental_import(conn):
+    """Remember each file's mtime/size so re-imports and watch mode skip unchanged files."""
+    conn.executescript("""
+        ALTER TABLE documents ADD COLUMN mtime REAL;
+        ALTER TABLE documents ADD COLUMN size INTEGER;
+        CREATE INDEX IF NOT EXISTS idx_chunks_doc_page ON chunks(document_id, page_from);
+    """)
+
+def _m4_bank_indexes(conn):
+    """Indexes used to match knowledge points and questions when importing a question bank."""
+    conn.executescript("""
+        CREATE INDEX IF NOT EXISTS idx_kp_text ON knowledge_points(kp);
+        CREATE INDEX IF NOT EXISTS idx_questions_kp ON questions(kp_id, stem);
+    """)
+
+def _m5_kp_mastery(conn):
+    """Per-KP mastery rollup of the learner's attempts (see mastery.py)."""
+    conn.executescript("""
+        -- kp_mastery: the user's attempts, correct answers and current streak per knowledge point
+        CREATE TABLE IF NOT EXISTS main.kp_mastery (
+          kp_id INTEGER PRIMARY KEY,
+          subject TEXT,
+          topic TEXT,
+          attempts INTEGER DEFAULT 0,
+          correct INTEGER DEFAULT 0,
+          streak INTEGER DEFAULT 0,
+          last_seen_at TEXT,
+          score REAL,
+          FOREIGN KEY(kp_id) REFERENCES knowledge_points(id)
+        );
+        CREATE INDEX IF NOT EXISTS main.idx_kp_mastery_score ON kp_mastery(score, last_seen_at);
+    """)
+    mastery.rebuild(conn)
+
+def _m6_unique_mistakes(conn):
+    """One mistakes row per question, so the attempt log can UPSERT it."""
+    conn.executescript("""
+        -- the row kept per question takes over the others' counts, dates and latest answers
+        UPDATE main.mistakes SET
+          times = (SELECT SUM(COALESCE(x.times, 1)) FROM main.mistakes x WHERE x.question_id = mistakes.question_id),
+          first_seen_at = (SELECT MIN(x.first_seen_at) FROM main.mistakes x WHERE x.question_id = mistakes.question_id),
+          last_seen_at = (SELECT MAX(COALESCE(x.last_seen_at, x.first_seen_at)) FROM main.mistakes x
+                          WHERE x.question_id = mistakes.question_id),
+          wrong_answer = (SELECT x.wrong_answer FROM main.mistakes x WHERE x.question_id = mistakes.question_id
+                          ORDER BY COALESCE(x.last_seen_at, x.first_seen_at) DESC, x.id DESC LIMIT 1),
+          correct_answer = (SELECT x.correct_answer FROM main.mistakes x WHERE x.question_id = mistakes.question_id
+                            ORDER BY COALESCE(x.last_seen_at, x.first_seen_at) DESC, x.id DESC LIMIT 1)
+        WHERE id IN (SELECT MIN(id) FROM main.mistakes WHERE question_id IS NOT NULL
+                     GROUP BY question_id HAVING COUNT(*) > 1);
+        DELETE FROM main.mistakes WHERE question_id IS NOT NULL AND id NOT IN (
+          SELECT MIN(id) FROM main.mistakes GROUP BY question_id
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS main.idx_mistakes_question ON mistakes(question_id);
+    """)
+
+def _m7_llm_calls(conn):
+    """Estimated tokens, latency and cost of each LLM call (see tokens.py)."""
+    conn.executescript("""
+        -- llm_calls: one row per LLM call; calls made for a learner (quiz, grading) go in their file
+        CREATE TABLE IF NOT EXISTS main.llm_calls (
+          id INTEGER PRIMARY KEY,
+          call_site TEXT,
+          backend TEXT,
+          prompt_tokens INTEGER,
+          response_tokens INTEGER,
+          truncated_tokens INTEGER DEFAULT 0,
+          seconds REAL,
+          cost_usd REAL,
+          status TEXT,
+          created_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS main.idx_llm_calls_created ON llm_calls(created_at);
+    """)
+
+def _m8_maintenance_log(conn):
+    """When `maintain` ran and what it did, for `maintain --if-due` (see db_checker.py)."""
+    conn.executescript("""
+        -- maintenance_log: one row per maintain run
+        CREATE TABLE IF NOT EXISTS maintenance_log (
+          id INTEGER PRIMARY KEY,
+          started_at TEXT,
+          finished_at TEXT,
+          steps TEXT,
+          ok INTEGER
+        );
+    """)
+
+def _m9_labels(conn):
+    """Subject/topic labels per document and chunk, with where they came from (see classifier.py)."""
+    conn.executescript("""
+        ALTER TABLE documents ADD COLUMN topic TEXT;
+        ALTER TABLE documents ADD COLUMN subject_confidence REAL;
+        ALTER TABLE documents ADD COLUMN subject_source TEXT;  -- user, llm or classifier
+        ALTER TABLE chunks ADD COLUMN subject TEXT;
+        ALTER TABLE chunks ADD COLUMN topic TEXT;
+        ALTER TABLE chunks ADD COLUMN confidence REAL;
+        UPDATE documents SET subject_source = 'user' WHERE subject IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS idx_documents_subject ON documents(subject);
+    """)
+
+def _m10_tasks(conn):
+    """Leased work queue for extraction and question generation (see work_queue.py)."""
+    conn.executescript("""
+        -- tasks: one row per unit of LLM work; workers lease them (lease, lease_until) and
+        -- finish them only while they still hold the lease
+        CREATE TABLE IF NOT EXISTS tasks (
+          id INTEGER PRIMARY KEY,
+          kind TEXT NOT NULL,        -- extract (target: chunk) or generate (target: knowledge point)
+          target_id INTEGER NOT NULL,
+          params TEXT,               -- JSON, e.g. {"n": 5}
+          status TEXT NOT NULL DEFAULT 'pending',  -- pending, leased, done or failed
+          attempts INTEGER NOT NULL DEFAULT 0,
+          worker TEXT,
+          lease TEXT,
+          lease_until REAL,          -- unix time; for pending tasks, when they may be retried
+          result TEXT,               -- JSON, once done
+          error TEXT,                -- last failure
+          created_at TEXT,
+          updated_at TEXT
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_open ON tasks(kind, target_id)
+          WHERE status IN ('pending', 'leased');
+        CREATE INDEX IF NOT EXISTS idx_tasks_claim ON tasks(status, kind, lease_until);
+    """)
+
+MIGRATIONS = [
+    _m1_compressed_chunks,
+    _m2_chunk_bodies,
+    _m3_incremental_import,
+    _m4_bank_indexes,
+    _m5_kp_mastery,
+    _m6_unique_mistakes,
+    _m7_llm_calls,
+    _m8_maintenance_log,
+    _m9_labels,
+    _m10_tasks,
+]
+
+USER_MIGRATIONS = [
+    _m5_kp_mastery,
+    _m6_unique_mistakes,
+    _m7_llm_calls,
+]
+
+def migrate(conn, steps=None):
+    """Applies any migrations the database hasn't had yet."""
+    steps = MIGRATIONS if steps is None else steps
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for i, step in enumerate(steps[version:], version + 1):
+        step(conn)
+        conn.execute(f"PRAGMA user_version = {i}")
+        conn.commit()
+
+# ---------- Users ----------
+# With a user, get_db() opens that user's own file (attempts, mistakes) as the main
+# database and ATTACHes the shared one as "shared". SQLite resolves unqualified table
+# names through main first, then attached databases, so every query works unchanged,
+# and a user's quiz writes lock only their own file, never the shared one or another
+# user's.
+
+USER_DB_DIR = os.getenv("USER_DB_DIR")  # default: users/ next to the shared database
+_USER_NAME = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]{0,63}")
+
+def user_db_path(path: str, user: str) -> str:
+    """Path of a user's own database file for the shared database at `path`."""
+    if not _USER_NAME.fullmatch(user):
+        raise ValueError(f"Invalid user name '{user}': use up to 64 letters, digits, '.', '_' or '-'.")
+    folder = USER_DB_DIR or os.path.join(os.path.dirname(os.path.abspath(path)), "users")
+    return os.path.join(folder, f"{user}.db")
+
+def list_users(path: str = "study.db"):
+    """Names of the users that have their own database next to the shared one."""
+    folder = USER_DB_DIR or os.path.join(os.path.dirname(os.path.abspath(path)), "users")
+    if not os.path.isdir(folder):
+        return []
+    return sorted(f[:-3] for f in os.listdir(folder) if f.endswith(".db"))
+
+def get_db(path: str = "study.db", user: str = None):
     """
-    Connects to the SQLite database and initializes the schema if the file does not exist.
+    Connects to the SQLite database, initializing the schema if the file does not exist
+    and applying any pending migrations.
     
     Args:
-        path (str): The path to the database file.
+        path (str): The path to the (shared) database file.
+        user (str): Optional learner name; their attempts and mistakes are kept in a
+            separate file (see user_db_path) instead of the shared database.
         
     Returns:
         sqlite3.Connection: The database connection object.
     """
+    if user:
+        get_db(path).close()  # create/upgrade the shared database first
+        user_path = user_db_path(path, user)
+        os.makedirs(os.path.dirname(user_path), exist_ok=True)
+        init = not os.path.exists(user_path)
+        conn = sqlite3.connect(user_path)
+        if init:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")  # lets `maintain` shrink the file in place
+            conn.executescript(USER_SCHEMA)
+            conn.commit()
+        conn.execute("ATTACH DATABASE ? AS shared", (os.path.abspath(path),))
+        migrate(conn, USER_MIGRATIONS)
+        chunk_store.register(conn)
+        return conn
+
     init = not os.path.exists(path)
     conn = sqlite3.connect(path)
     if init:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")  # lets `maintain` shrink the file in place
         conn.executescript(SCHEMA)
         conn.commit()
+    migrate(conn)
+    chunk_store.register(conn)
     return conn
@@ -1,41 +1,282 @@
-import sqlite3
 import os
+import sys
+import glob
+import json
+import sqlite3
+import datetime
 
-DB_PATH = "study.db"
+import metrics
+
+# Health checks and routine maintenance for the study database (`python app.py doctor`
+# and `python app.py maintain`). Problem rows are read a page at a time by id, so the
+# checks run in constant memory however large the database gets.
+
+DB_PATH = os.getenv("DB_PATH", "study.db")
+PAGE_SIZE = 500
+MAINTAIN_INTERVAL_HOURS = float(os.getenv("MAINTAIN_INTERVAL_HOURS", "24"))
+BACKUP_DIR = os.getenv("BACKUP_DIR")  # default: backups/ next to the database
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+BACKUP_STEP_PAGES = 1024  # pages copied per backup step; writers can get in between steps
+VACUUM_MIN_FREE = 0.2  # share of free pages above which maintain suggests --vacuum
+
+AUTO_VACUUM = {0: "none", 1: "full", 2: "incremental"}
+
+# name: (description, tables it needs, query returning (id, detail) per problem row)
+CHECKS = {
+    "orphaned_chunks": (
+        "Chunks whose document no longer exists",
+        ("chunks", "documents"),
+        "SELECT c.id AS id, 'document ' || c.document_id AS detail FROM chunks c "
+        "WHERE NOT EXISTS (SELECT 1 FROM documents d WHERE d.id = c.document_id)",
+    ),
+    "unused_chunk_bodies": (
+        "Stored chunk text that no chunk uses (removed by maintain --clean)",
+        ("chunk_bodies", "chunks"),
+        "SELECT b.id AS id, b.content_len || ' chars: ' || substr(b.preview, 1, 60) AS detail "
+        "FROM chunk_bodies b WHERE NOT EXISTS (SELECT 1 FROM chunks c WHERE c.body_id = b.id)",
+    ),
+    "questions_without_kp": (
+        "Questions without a (still existing) knowledge point",
+        ("questions", "knowledge_points"),
+        "SELECT q.id AS id, substr(q.stem, 1, 80) AS detail FROM questions q "
+        "WHERE q.kp_id IS NULL OR NOT EXISTS (SELECT 1 FROM knowledge_points k WHERE k.id = q.kp_id)",
+    ),
+    "kps_with_missing_source": (
+        "Knowledge points linked to a chunk that no longer exists",
+        ("knowledge_points", "chunks"),
+        "SELECT k.id AS id, 'chunk ' || k.source_chunk_id AS detail FROM knowledge_points k "
+        "WHERE k.source_chunk_id IS NOT NULL "
+        "AND NOT EXISTS (SELECT 1 FROM chunks c WHERE c.id = k.source_chunk_id)",
+    ),
+    "duplicate_kps": (
+        "Knowledge points repeating an earlier one (same subject, topic and text)",
+        ("knowledge_points",),
+        "SELECT k.id AS id, substr(k.kp, 1, 80) AS detail FROM knowledge_points k WHERE EXISTS ("
+        "SELECT 1 FROM knowledge_points o WHERE o.kp = k.kp AND o.subject IS k.subject "
+        "AND o.topic IS k.topic AND o.id < k.id)",
+    ),
+    "duplicate_questions": (
+        "Questions repeating an earlier one for the same knowledge point",
+        ("questions",),
+        "SELECT q.id AS id, substr(q.stem, 1, 80) AS detail FROM questions q WHERE EXISTS ("
+        "SELECT 1 FROM questions o WHERE o.kp_id IS q.kp_id AND o.stem = q.stem AND o.id < q.id)",
+    ),
+    "attempts_without_question": (
+        "Answers to questions that no longer exist",
+        ("attempts", "questions"),
+        "SELECT a.id AS id, 'question ' || a.question_id AS detail FROM attempts a "
+        "WHERE NOT EXISTS (SELECT 1 FROM questions q WHERE q.id = a.question_id)",
+    ),
+}
+
+# Checks of the shared study material; a learner's file only gets the rest
+SHARED_CHECKS = ("orphaned_chunks", "unused_chunk_bodies", "questions_without_kp",
+                 "kps_with_missing_source", "duplicate_kps", "duplicate_questions")
+
+
+def _tables(conn):
+    schemas = [name for _, name, _ in conn.execute("PRAGMA database_list")]
+    return {name for schema in schemas for name, in conn.execute(
+        f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table'"
+    )}
 
-def check_knowledge_points():
-    """Connects to the database and prints all knowledge points."""
-    if not os.path.exists(DB_PATH):
-        print(f"Error: Database file not found at {DB_PATH}")
-        return
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+def file_stats(conn):
+    """Size and settings of the connection's main database file."""
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    page_size = conn.execute("PRAGMA main.page_size").fetchone()[0]
+    pages = conn.execute("PRAGMA main.page_count").fetchone()[0]
+    free = conn.execute("PRAGMA main.freelist_count").fetchone()[0]
+    wal = path + "-wal"
+    return {
+        "path": path,
+        "bytes": page_size * pages,
+        "free_bytes": page_size * free,
+        "wal_bytes": os.path.getsize(wal) if os.path.exists(wal) else 0,
+        "page_size": page_size,
+        "pages": pages,
+        "free_pages": free,
+        "journal_mode": conn.execute("PRAGMA main.journal_mode").fetchone()[0],
+        "auto_vacuum": AUTO_VACUUM.get(conn.execute("PRAGMA main.auto_vacuum").fetchone()[0]),
+    }
 
+
+def table_stats(conn):
+    """Yields name, type, rows (tables only) and bytes on disk of each table and index in the main file."""
     try:
-        cursor.execute("SELECT id, subject, topic, kp, source_chunk_id FROM knowledge_points")
-        rows = cursor.fetchall()
+        sizes = dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat WHERE schema = 'main' GROUP BY name"))
+    except sqlite3.OperationalError:
+        sizes = {}  # SQLite built without the dbstat table
+    objects = conn.execute(
+        "SELECT name, type FROM main.sqlite_master WHERE type IN ('table', 'index') ORDER BY type DESC, name"
+    ).fetchall()
+    for name, kind in objects:
+        rows = conn.execute(f'SELECT COUNT(*) FROM main."{name}"').fetchone()[0] if kind == "table" else None
+        yield {"name": name, "type": kind, "rows": rows, "bytes": sizes.get(name)}
+
+
+def checks_for(conn, shared=True):
+    """Names of the checks to run on this connection: those whose tables all exist."""
+    tables = _tables(conn)
+    return [name for name, (_, needs, _) in CHECKS.items()
+            if (shared or name not in SHARED_CHECKS) and all(t in tables for t in needs)]
+
+
+def count_problems(conn, check):
+    """Number of rows failing a check."""
+    with metrics.timer("maintenance_seconds", step=check):
+        return conn.execute(f"SELECT COUNT(*) FROM ({CHECKS[check][2]})").fetchone()[0]
 
-        if not rows:
-            print("No knowledge points found in the database.")
+
+def iter_problems(conn, check, page_size=PAGE_SIZE):
+    """Yields (id, detail) for each row failing a check, reading page_size rows at a time."""
+    sql = f"SELECT id, detail FROM ({CHECKS[check][2]}) WHERE id > ? ORDER BY id LIMIT ?"
+    last = 0
+    while True:
+        rows = conn.execute(sql, (last, page_size)).fetchall()
+        yield from rows
+        if len(rows) < page_size:
             return
+        last = rows[-1][0]
+
+
+def integrity(conn, full=False, max_errors=20):
+    """Problems found by PRAGMA quick_check (or the slower integrity_check); empty if the file is fine."""
+    pragma = "integrity_check" if full else "quick_check"
+    with metrics.timer("maintenance_seconds", step=pragma):
+        rows = [r[0] for r in conn.execute(f"PRAGMA main.{pragma}({max_errors})")]
+    return [] if rows == ["ok"] else rows
+
+
+# ---------- Maintenance ----------
 
-        print("--- Knowledge Points in Database ---")
-        for row in rows:
-            kp_id, subject, topic, kp, chunk_id = row
-            print(f"ID: {kp_id}")
-            print(f"  Subject: {subject}")
-            print(f"  Topic: {topic}")
-            print(f"  KP: {kp}")
-            print(f"  Source Chunk ID: {chunk_id}")
-            print("---")
-
-    except sqlite3.OperationalError as e:
-        print(f"Error: {e}. Is the 'knowledge_points' table created?")
+def backup(conn, name=None, folder=None, keep=BACKUP_KEEP):
+    """
+    Copies the main database with SQLite's online backup API, a few pages at a time so
+    other connections can keep writing, and deletes all but the newest `keep` backups
+    of the same name. Returns the backup's path.
+    """
+    src = conn.execute("PRAGMA database_list").fetchone()[2]
+    folder = folder or BACKUP_DIR or os.path.join(os.path.dirname(os.path.abspath(src)), "backups")
+    name = name or os.path.splitext(os.path.basename(src))[0]
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{name}-{datetime.datetime.now():%Y%m%d-%H%M%S}.db")
+    dest = sqlite3.connect(path)
+    try:
+        with metrics.timer("maintenance_seconds", step="backup"):
+            conn.backup(dest, pages=BACKUP_STEP_PAGES)
     finally:
-        conn.close()
+        dest.close()
+    for old in sorted(glob.glob(os.path.join(folder, f"{glob.escape(name)}-*.db")))[:-max(keep, 1)]:
+        os.remove(old)
+    return path
+
+
+def clean(conn):
+    """Deletes chunk text that no chunk uses any more. Returns the number of bodies removed."""
+    with metrics.timer("maintenance_seconds", step="clean"):
+        n = conn.execute(
+            "DELETE FROM chunk_bodies WHERE NOT EXISTS (SELECT 1 FROM chunks c WHERE c.body_id = chunk_bodies.id)"
+        ).rowcount
+        conn.commit()
+    return n
+
+
+def optimize(conn):
+    """Refreshes the query planner's statistics (a sampled ANALYZE, then PRAGMA optimize)."""
+    with metrics.timer("maintenance_seconds", step="analyze"):
+        conn.execute("PRAGMA analysis_limit = 1000")  # sample large indexes instead of reading them whole
+        conn.execute("ANALYZE main")
+        conn.execute("PRAGMA main.optimize")
+        conn.commit()
+
+
+def vacuum(conn, full=False):
+    """
+    Returns free pages to the file system: incrementally if the file has auto_vacuum
+    = incremental, else only with full=True, which rebuilds the file once (needing as
+    much free disk space as the file) and switches it to incremental. Returns pages freed.
+    """
+    mode = conn.execute("PRAGMA main.auto_vacuum").fetchone()[0]
+    free = conn.execute("PRAGMA main.freelist_count").fetchone()[0]
+    with metrics.timer("maintenance_seconds", step="vacuum"):
+        if mode == 2:
+            # NOTE: execute() would stop after the first page; executescript() runs it to the end
+            conn.executescript("PRAGMA main.incremental_vacuum;")
+        elif full:
+            conn.execute("PRAGMA main.auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM main")
+        else:
+            return 0
+    return free - conn.execute("PRAGMA main.freelist_count").fetchone()[0]
+
+
+def checkpoint(conn):
+    """Copies the write-ahead log into the database and truncates it. None if the file isn't in WAL mode."""
+    if conn.execute("PRAGMA main.journal_mode").fetchone()[0] != "wal":
+        return None
+    with metrics.timer("maintenance_seconds", step="checkpoint"):
+        busy, log_pages, done = conn.execute("PRAGMA main.wal_checkpoint(TRUNCATE)").fetchone()
+    return {"busy": bool(busy), "log_pages": log_pages, "checkpointed": done}
 
-if __name__ == "__main__":
-    check_knowledge_points()
 
+def last_run(conn):
+    """When maintain last finished on this database (ISO timestamp), or None."""
+    row = conn.execute("SELECT MAX(finished_at) FROM maintenance_log WHERE ok = 1").fetchone()
+    return row[0] if row else None
 
+
+def is_due(conn, hours=MAINTAIN_INTERVAL_HOURS):
+    """True if maintain hasn't run in the last `hours` hours."""
+    last = last_run(conn)
+    return last is None or datetime.datetime.fromisoformat(last) < datetime.datetime.now() - datetime.timedelta(hours=hours)
+
+
+def maintain(conn, name=None, do_backup=True, do_clean=False, full_vacuum=False, full_check=False):
+    """
+    Runs the maintenance steps on the connection's main file, yielding (step, result)
+    as each one finishes: integrity check, backup, clean (optional), analyze, vacuum,
+    checkpoint. Stops after the integrity check if it finds problems.
+    """
+    problems = integrity(conn, full_check)
+    yield "integrity_check" if full_check else "quick_check", problems or "ok"
+    if problems:
+        return
+    if do_backup:
+        yield "backup", backup(conn, name)
+    if do_clean and "chunk_bodies" in _tables(conn):
+        yield "clean", clean(conn)
+    optimize(conn)
+    yield "analyze", "ok"
+    freed = vacuum(conn, full_vacuum)
+    stats = file_stats(conn)
+    if not freed and stats["auto_vacuum"] == "none" and stats["free_pages"] > VACUUM_MIN_FREE * stats["pages"]:
+        yield "vacuum", f"{stats['free_pages']} free pages; run with --vacuum once to reclaim them"
+    else:
+        yield "vacuum", f"{freed} pages freed"
+    yield "checkpoint", checkpoint(conn) or "not in WAL mode"
+
+
+def log_run(conn, started_at, steps, ok=True):
+    """Records a maintain run in maintenance_log."""
+    conn.execute(
+        "INSERT INTO maintenance_log (started_at, finished_at, steps, ok) VALUES (?, ?, ?, ?)",
+        (started_at, datetime.datetime.now().isoformat(), json.dumps(steps, default=str), 1 if ok else 0),
+    )
+    conn.commit()
+
+
+if __name__ == "__main__":
+    # Quick look at a database without the CLI: python db_checker.py [path]
+    path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    if not os.path.exists(path):
+        print(f"Error: Database file not found at {path}")
+        sys.exit(1)
+    conn = sqlite3.connect(path)
+    print(file_stats(conn))
+    for t in table_stats(conn):
+        print(t)
+    for check in checks_for(conn):
+        print(check, count_problems(conn, check))
+    print("integrity:", integrity(conn) or "ok")
+    conn.close()
@@ -1,6 +1,9 @@
-import json
-from llm import ask_gemini_cli
+from llm import ask_gemini_cli_stream
+from response_parser import JsonArrayStream
+from chunk_store import iter_chunks, mark_extracted
 from db import get_db
+import metrics
+import tokens
 
 PROMPT = """
 You are a subject matter expert. Your task is to analyze the provided text documents and extract key knowledge points. The output must be a single JSON array, where each object has the following keys:
@@ -18,38 +21,42 @@ Example of expected output:
 Text to analyze:\n{content}
 """
 
+# Fields expected for each extracted knowledge point; chunk_id is only present
+# when the prompt carried [CHUNK_ID:X] markers.
+KP_SCHEMA = {
+    "subject": (str, False),
+    "topic": (str, False),
+    "kp": (str, True),
+    "chunk_id": (int, False),
+}
+
+def iter_knowledge_points(text_content, conn=None):
+    """
+    Streams knowledge points from the Gemini CLI, yielding each one as soon as
+    it has been received and validated. Text over the call's token budget is
+    truncated; pass conn to record the call in llm_calls.
+    """
+    fitted = tokens.truncate(text_content, tokens.room("extract_knowledge_points", PROMPT))
+    prompt_with_content = PROMPT.format(content=fitted)
+    parser = JsonArrayStream(KP_SCHEMA)
+    yield from parser.iter(tokens.track_stream(
+        conn, "extract_knowledge_points", prompt_with_content, ask_gemini_cli_stream(prompt_with_content),
+        truncated=tokens.estimate(text_content) - tokens.estimate(fitted),
+    ))
+    if parser.dropped:
+        metrics.inc("llm_items_dropped_total", parser.dropped, call_site="extract_knowledge_points")
+        print(f"[bold yellow]Warning:[/] Skipped {parser.dropped} malformed knowledge point(s) from Gemini.")
+
 def extract_knowledge_points(text_content, limit=5):
     """
     Extracts knowledge points from text using the Gemini CLI.
     """
-    prompt_with_content = PROMPT.format(content=text_content)
-    response = ask_gemini_cli(prompt_with_content)
-    
-    try:
-        # Extract JSON from markdown code blocks if present
-        if response.strip().startswith('```json'):
-            # Find the JSON content between ```json and ```
-            start = response.find('```json') + 7
-            end = response.find('```', start)
-            json_content = response[start:end].strip()
-        elif response.strip().startswith('```'):
-            # Handle generic code blocks
-            start = response.find('```') + 3
-            end = response.find('```', start)
-            json_content = response[start:end].strip()
-        else:
-            json_content = response.strip()
-        
-        knowledge_points = json.loads(json_content)
-        if isinstance(knowledge_points, list):
-            return knowledge_points
-        else:
-            print("[bold red]Error:[/] Gemini response was not a JSON array.")
-            return []
-    except json.JSONDecodeError:
-        print("[bold red]Error:[/] Failed to parse JSON from Gemini. Check the model's output for invalid characters.")
-        return []
+    knowledge_points = list(iter_knowledge_points(text_content))
+    if not knowledge_points:
+        print("[bold red]Error:[/] Gemini response did not contain any valid knowledge points.")
+    return knowledge_points
 
+@metrics.timed("db_write_seconds", op="save_knowledge_points")
 def save_knowledge_points(conn, kp_list):
     """Saves extracted knowledge points to the database."""
     n_inserted = 0
@@ -61,3 +68,45 @@ def save_knowledge_points(conn, kp_list):
         n_inserted += 1
     conn.commit()
     return n_inserted
+
+def iter_extracted(conn, chunk_ids=None, subject=None, unextracted=True):
+    """
+    Runs extraction on chunk text that hasn't been extracted yet (optionally only the
+    given chunks, or those of documents with the given subject), as many LLM calls as
+    the token budget needs, without writing anything. Yields (chunk ids sent, knowledge
+    points) per call.
+    """
+    rows = [(chunk_id, text) for chunk_id, text, _ in
+            iter_chunks(conn, subject=subject, chunk_ids=chunk_ids, unextracted=unextracted)]
+    for batch in tokens.pack(rows, tokens.room("extract_knowledge_points", PROMPT),
+                             text=lambda row: f"[CHUNK_ID:{row[0]}] {row[1]}\n\n"):
+        known_ids = {chunk_id for (chunk_id, _), _ in batch}
+        kp_items = list(iter_knowledge_points("".join(text for _, text in batch), conn))
+        for kp_item in kp_items:
+            if kp_item.get("chunk_id") not in known_ids:
+                kp_item["chunk_id"] = None
+        yield known_ids, kp_items
+
+def save_extracted(conn, chunk_ids, kp_items):
+    """Saves knowledge points linked to their source chunk and, if there were any, marks the chunks extracted. Does not commit."""
+    for kp_item in kp_items:
+        conn.execute(
+            "INSERT INTO knowledge_points (subject, topic, kp, source_chunk_id) VALUES (?, ?, ?, ?)",
+            (kp_item.get("subject"), kp_item.get("topic"), kp_item.get("kp"), kp_item.get("chunk_id"))
+        )
+    if kp_items:
+        mark_extracted(conn, chunk_ids)
+    return len(kp_items)
+
+def extract_pending(conn, chunk_ids=None):
+    """
+    Extracts knowledge points from chunk text that hasn't been extracted yet (optionally
+    only from the given chunks), saves them linked to their source chunk and marks the
+    text as extracted. Text over the token budget is sent in several calls, each saved
+    as it finishes. Returns the number of knowledge points saved.
+    """
+    n_inserted = 0
+    for ids, kp_items in iter_extracted(conn, chunk_ids):
+        n_inserted += save_extracted(conn, ids, kp_items)
+        conn.commit()
+    return n_inserted
@@ -38,17 +38,36 @@
 import os
 import subprocess
 import json
+import time
 import tempfile
 
+import metrics
+
+# A successful gcloud auth check is reused for this many seconds; spawning gcloud
+# costs far more than the Gemini call setup itself.
+AUTH_CHECK_TTL = 300
+_auth_ok_until = 0.0
+
 def check_auth_status():
     """Check if user has valid Google Cloud authentication"""
+    global _auth_ok_until
+    if time.monotonic() < _auth_ok_until:
+        metrics.inc("auth_checks_total", result="cache_hit")
+        return True
     try:
-        result = subprocess.run([
-            'gcloud', 'auth', 'application-default', 'print-access-token'
-        ], capture_output=True, text=True, timeout=10)
-        return result.returncode == 0
+        with metrics.timer("auth_check_seconds"):
+            result = subprocess.run([
+                'gcloud', 'auth', 'application-default', 'print-access-token'
+            ], capture_output=True, text=True, timeout=10)
     except (subprocess.TimeoutExpired, FileNotFoundError):
+        metrics.inc("auth_checks_total", result="unavailable")
         return False
+    if result.returncode == 0:
+        _auth_ok_until = time.monotonic() + AUTH_CHECK_TTL
+        metrics.inc("auth_checks_total", result="ok")
+        return True
+    metrics.inc("auth_checks_total", result="failed")
+    return False
 
 def setup_authentication():
     """Guide user through authentication setup"""
@@ -67,7 +86,7 @@ def setup_authentication():
         
         return result.returncode == 0
         
-    except subprocess.CalledProcessError:
+    except (subprocess.CalledProcessError, FileNotFoundError):
         print("Error: Google Cloud CLI not found.")
         print("Please install from: https://cloud.google.com/sdk/docs/install")
         return False
@@ -75,13 +94,105 @@ def setup_authentication():
         print("Authentication timed out.")
         return False
 
+# ---------- Pluggable backends ----------
+# ask_gemini_cli / ask_gemini_cli_stream dispatch to the active backend. The default
+# talks to Gemini; LLM_BACKEND=local or http selects the offline stand-in in
+# llm_standin.py (for load testing), and LLM_BACKEND=mock the canned demo answers.
+
+class LLMBackend:
+    """Interface for LLM providers: implement complete(), and stream() if the provider can."""
+    name = "base"
+
+    def complete(self, prompt: str, system_instruction: str = "") -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, system_instruction: str = ""):
+        yield self.complete(prompt, system_instruction)
+
+class GeminiBackend(LLMBackend):
+    """Gemini CLI with GEMINI_API_KEY, else Google Cloud auth, else mock responses."""
+    name = "gemini"
+
+    def complete(self, prompt, system_instruction=""):
+        return _ask_gemini(prompt, system_instruction)
+
+    def stream(self, prompt, system_instruction=""):
+        return _stream_gemini(prompt, system_instruction)
+
+class MockBackend(LLMBackend):
+    """The fixed demo responses used when Gemini is unavailable."""
+    name = "mock"
+
+    def complete(self, prompt, system_instruction=""):
+        return _get_mock_response(prompt)
+
+def _local_backend():
+    from llm_standin import LocalBackend
+    return LocalBackend.from_env()
+
+def _http_backend():
+    from llm_standin import HTTPBackend
+    return HTTPBackend.from_env()
+
+BACKENDS = {
+    "gemini": GeminiBackend,
+    "mock": MockBackend,
+    "local": _local_backend,
+    "http": _http_backend,
+}
+
+# Failed backend calls are retried this many times, with exponential backoff
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+
+_backend = None
+
+def register_backend(name: str, factory):
+    """Makes a backend selectable through LLM_BACKEND=name; factory takes no arguments."""
+    BACKENDS[name] = factory
+
+def get_backend() -> LLMBackend:
+    """Returns the active backend, creating it from LLM_BACKEND on first use."""
+    global _backend
+    if _backend is None:
+        name = os.getenv("LLM_BACKEND", "gemini")
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown LLM_BACKEND '{name}'. Choose from: {', '.join(BACKENDS)}")
+        _backend = BACKENDS[name]()
+    return _backend
+
+def set_backend(backend):
+    """Replaces the active backend with an LLMBackend instance or a registered name."""
+    global _backend
+    _backend = BACKENDS[backend]() if isinstance(backend, str) else backend
+
+def _retry_delay(attempt: int):
+    metrics.inc("llm_retries_total")
+    time.sleep(RETRY_BACKOFF * (2 ** attempt))
+
 def ask_gemini_cli(prompt: str, system_instruction: str = "") -> str:
     """
     Call Gemini using Google Cloud authentication or fallback to mock
     """
+    backend = get_backend()
+    metrics.observe("llm_prompt_chars", len(prompt) + len(system_instruction), buckets=metrics.SIZE_BUCKETS)
+    with metrics.timer("llm_call_seconds", mode="blocking", backend=backend.name):
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                response = backend.complete(prompt, system_instruction)
+                break
+            except Exception:
+                if attempt == MAX_RETRIES:
+                    raise
+                _retry_delay(attempt)
+    metrics.observe("llm_response_chars", len(response), buckets=metrics.SIZE_BUCKETS)
+    return response
+
+def _ask_gemini(prompt: str, system_instruction: str) -> str:
     # First try environment variable (backwards compatibility)
     api_key = os.getenv("GEMINI_API_KEY")
     if api_key:
+        metrics.inc("llm_calls_total", transport="gemini_cli")
         return _call_gemini_with_api_key(prompt, system_instruction, api_key)
     
     # Try Google Cloud authentication
@@ -89,14 +200,70 @@ def ask_gemini_cli(prompt: str, system_instruction: str = "") -> str:
         print("Google Cloud authentication required.")
         if not setup_authentication():
             print("Warning: Using mock responses for demo. Set up authentication for real Gemini calls.")
+            metrics.inc("llm_calls_total", transport="mock")
             return _get_mock_response(prompt)
     
     try:
+        metrics.inc("llm_calls_total", transport="gcloud")
         return _call_gemini_with_gcloud(prompt, system_instruction)
     except Exception as e:
         print(f"Warning: Gemini call failed ({e}), using mock response")
+        metrics.inc("llm_fallbacks_total", transport="gcloud")
         return _get_mock_response(prompt)
 
+def ask_gemini_cli_stream(prompt: str, system_instruction: str = ""):
+    """
+    Like ask_gemini_cli, but yields the response text in pieces as it arrives
+    so callers can start using the first items before the model is done.
+    A failed call is only retried if it failed before producing any text.
+    """
+    backend = get_backend()
+    metrics.observe("llm_prompt_chars", len(prompt) + len(system_instruction), buckets=metrics.SIZE_BUCKETS)
+    n_chars = 0
+    start = time.perf_counter()
+    with metrics.timer("llm_call_seconds", mode="stream", backend=backend.name):
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                for piece in backend.stream(prompt, system_instruction):
+                    if not n_chars:
+                        metrics.observe("llm_first_piece_seconds", time.perf_counter() - start)
+                    n_chars += len(piece)
+                    yield piece
+                break
+            except Exception:
+                if n_chars or attempt == MAX_RETRIES:
+                    raise
+                _retry_delay(attempt)
+    metrics.observe("llm_response_chars", n_chars, buckets=metrics.SIZE_BUCKETS)
+
+def _stream_gemini(prompt: str, system_instruction: str):
+    api_key = os.getenv("GEMINI_API_KEY")
+    if api_key:
+        metrics.inc("llm_calls_total", transport="gemini_cli")
+        yield from _stream_gemini_with_api_key(prompt, system_instruction, api_key)
+        return
+
+    if not check_auth_status():
+        print("Google Cloud authentication required.")
+        if not setup_authentication():
+            print("Warning: Using mock responses for demo. Set up authentication for real Gemini calls.")
+            metrics.inc("llm_calls_total", transport="mock")
+            yield _get_mock_response(prompt)
+            return
+
+    emitted = False
+    metrics.inc("llm_calls_total", transport="gcloud")
+    try:
+        for piece in _stream_gemini_with_gcloud(prompt, system_instruction):
+            emitted = True
+            yield piece
+    except Exception as e:
+        if emitted:
+            raise
+        print(f"Warning: Gemini call failed ({e}), using mock response")
+        metrics.inc("llm_fallbacks_total", transport="gcloud")
+        yield _get_mock_response(prompt)
+
 def _call_gemini_with_api_key(prompt: str, system_instruction: str, api_key: str) -> str:
     """Call Gemini CLI with API key"""
     try:
@@ -136,6 +303,46 @@ def _call_gemini_with_gcloud(prompt: str, system_instruction: str) -> str:
     except Exception as e:
         raise RuntimeError(f"Gemini API call failed: {e}")
 
+def _stream_gemini_with_api_key(prompt: str, system_instruction: str, api_key: str):
+    """Stream Gemini CLI stdout with API key"""
+    full_prompt = f"System: {system_instruction}\n\nUser: {prompt}" if system_instruction else prompt
+
+    env = os.environ.copy()
+    env['GEMINI_API_KEY'] = api_key
+
+    try:
+        proc = subprocess.Popen([
+            'gemini', '-p', full_prompt
+        ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=env)
+    except Exception as e:
+        raise RuntimeError(f"Gemini API call failed: {e}")
+
+    try:
+        for line in proc.stdout:
+            yield line
+        proc.wait(timeout=60)
+        if proc.returncode != 0:
+            raise RuntimeError(f"Gemini CLI failed: {proc.stderr.read()}")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+def _stream_gemini_with_gcloud(prompt: str, system_instruction: str):
+    """Stream Gemini using Google Cloud SDK"""
+    try:
+        import google.generativeai as genai
+    except ImportError:
+        raise RuntimeError("google-generativeai package not installed")
+
+    genai.configure()
+    model = genai.GenerativeModel('gemini-pro')
+
+    full_prompt = f"System: {system_instruction}\n\nUser: {prompt}" if system_instruction else prompt
+    for chunk in model.generate_content(full_prompt, stream=True):
+        if chunk.text:
+            yield chunk.text
+
 def _get_mock_response(prompt: str) -> str:
     """Mock responses for development/demo"""
     if "quiz" in prompt.lower() or "generate" in prompt.lower():
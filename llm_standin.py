@@ -0,0 +1,408 @@
+"""
+Offline stand-in for Gemini, for load testing without network access.
+
+It answers the app's own prompts (knowledge point extraction, quiz generation and
+grading) with schema-valid JSON derived from the text in the prompt, after a
+configurable latency, failing a configurable fraction of calls and capping
+throughput at a configurable rate.
+
+Use it in-process with LLM_BACKEND=local, or run it as a localhost HTTP server
+and point the app at it with LLM_BACKEND=http:
+
+    python llm_standin.py --port 8765 --latency 0.3 --error-rate 0.05 --rps 20
+    LLM_BACKEND=http LLM_STANDIN_URL=http://127.0.0.1:8765 python app.py quiz
+
+Settings (environment variables, also used as the server's defaults):
+    LLM_STANDIN_LATENCY     seconds before the first piece of a response (default 0)
+    LLM_STANDIN_ERROR_RATE  fraction of calls that fail (default 0)
+    LLM_STANDIN_RPS         max calls per second, 0 for unlimited (default 0)
+    LLM_STANDIN_SEED        seed for latency jitter and injected failures
+    LLM_STANDIN_URL         server address for LLM_BACKEND=http
+"""
+import os
+import re
+import json
+import time
+import codecs
+import random
+import hashlib
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm import LLMBackend
+
+STOPWORDS = set("""
+a about above after again against all also am an and any are as at be because been before being
+below between both but by can could did do does doing down during each either few for from further
+had has have having he her here hers him his how i if in into is it its itself just least less may
+me might more most must my no nor not now of off on once only or other our out over own per same
+she should so some such than that the their them then there these they this those through to too
+under until up upon very was we were what when where which while who whom why will with within
+without would you your used using use often every must one two three however therefore thus
+""".split())
+
+_WORD = re.compile(r"[A-Za-z][A-Za-z0-9'\-]+")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+|\n+")
+_CHUNK_MARKER = re.compile(r"\[CHUNK_ID:(\d+)\]")
+_DOC_MARKER = re.compile(r"\[DOC_ID:(\d+)\]")
+_FALLBACK_DISTRACTORS = ["protocol", "variable", "process", "structure", "function", "system"]
+
+
+def _keywords(text):
+    return [w for w in _WORD.findall(text) if w.lower() not in STOPWORDS and len(w) > 3]
+
+
+def _sentences(text):
+    out = []
+    for s in _SENTENCE.split(text):
+        s = " ".join(s.split())
+        if 6 <= len(s.split()) <= 60:
+            out.append(s)
+    return out
+
+
+def _between(prompt, start, end=None):
+    i = prompt.find(start)
+    if i < 0:
+        return ""
+    i += len(start)
+    j = prompt.find(end, i) if end else -1
+    return prompt[i:j if j >= 0 else len(prompt)].strip()
+
+
+class StandInModel:
+    """Produces content-derived answers for the app's prompt types."""
+
+    def respond(self, prompt):
+        lowered = prompt.lower()
+        if "quiz master" in lowered:
+            return json.dumps(self.questions(prompt))
+        if "grader" in lowered or "judge" in lowered:
+            return json.dumps(self.grade(prompt))
+        if "knowledge point" in lowered:
+            return json.dumps(self.knowledge_points(prompt))
+        if "[doc_id:" in lowered:
+            return json.dumps(self.labels(prompt))
+        return json.dumps({"summary": " ".join(_sentences(prompt)[:3])})
+
+    # -- knowledge points --
+
+    def knowledge_points(self, prompt):
+        subjects = re.findall(r"'([^']+)'", _between(prompt, "categorized into subjects:", "\n"))
+        body = _between(prompt, "Documents:", None) or _between(prompt, "Text to analyze:", None) or prompt
+        parts = _CHUNK_MARKER.split(body)
+        if len(parts) > 1:
+            chunks = [(int(parts[i]), parts[i + 1]) for i in range(1, len(parts) - 1, 2)]
+        else:
+            chunks = [(None, body)]
+
+        # Take the most keyword-dense sentence of each chunk in turn, then the
+        # runners-up, so the points spread over the material; at least 5, at most 10
+        candidates = []
+        for chunk_id, text in chunks:
+            ranked = sorted(_sentences(text), key=lambda s: len(_keywords(s)) / len(s.split()), reverse=True)
+            for rank, sentence in enumerate(ranked):
+                candidates.append((rank, chunk_id, sentence, text))
+        candidates.sort(key=lambda c: c[0])
+        n = max(5, min(10, len(chunks)))
+        seen = set()
+        kps = []
+        for _, chunk_id, sentence, text in candidates:
+            if sentence in seen:
+                continue
+            seen.add(sentence)
+            common = Counter(w.lower() for w in _keywords(text)).most_common(2)
+            topic = common[0][0].title() if common else "General"
+            if subjects:
+                subject = subjects[len(kps) % len(subjects)]
+            else:
+                first_line = text.strip().splitlines()[0] if text.strip() else ""
+                subject = (first_line.split(" - ")[0].strip()[:40] if " - " in first_line
+                           else (common[-1][0].title() if common else "General"))
+            item = {"subject": subject, "topic": topic, "kp": sentence}
+            if chunk_id is not None:
+                item["chunk_id"] = chunk_id
+            kps.append(item)
+            if len(kps) >= n:
+                break
+        return kps
+
+    # -- document labels --
+
+    def labels(self, prompt):
+        known = [s.strip() for s in _between(prompt, "existing subjects when one fits:", "\n").split(",") if s.strip()]
+        parts = _DOC_MARKER.split(_between(prompt, "Documents:", None) or prompt)
+        out = []
+        for i in range(1, len(parts) - 1, 2):
+            words = Counter(w.lower() for w in _keywords(parts[i + 1])).most_common(2)
+            match = [s for s in known if s.lower() in parts[i + 1].lower()]
+            subject = match[0] if match else (words[0][0].title() if words else "General")
+            topic = words[-1][0].title() if words else "General"
+            out.append({"doc_id": int(parts[i]), "subject": subject, "topic": topic})
+        return out
+
+    # -- questions --
+
+    def questions(self, prompt):
+        m = re.search(r"generate (\d+) multiple-choice", prompt)
+        n = int(m.group(1)) if m else 5
+        kp = _between(prompt, "Knowledge Point:", None) or "This knowledge point is empty."
+        keywords = list(dict.fromkeys(_keywords(kp))) or ["concept"]
+        rng = random.Random(hashlib.sha256(kp.encode()).hexdigest())
+        questions = []
+        for i in range(n):
+            answer = keywords[i % len(keywords)]
+            pattern = re.compile(re.escape(answer))
+            stem = pattern.sub("_____", kp, count=1)
+            others = [w for w in keywords if w.lower() != answer.lower()]
+            pool = others + [w for w in _FALLBACK_DISTRACTORS if w not in others and w != answer]
+            distractors = rng.sample(pool, 3)
+            letters = ["A", "B", "C", "D"]
+            correct = letters[rng.randrange(4)]
+            options, k = {}, 0
+            for letter in letters:
+                if letter == correct:
+                    options[letter] = answer
+                else:
+                    options[letter] = distractors[k]
+                    k += 1
+            questions.append({
+                "qtype": "choice",
+                "stem": f"Which term best completes the statement: \"{stem}\"",
+                "options": options,
+                "answer": correct,
+                "explanation": f"The original statement reads: \"{kp}\"",
+            })
+        return questions
+
+    # -- grading --
+
+    def grade(self, prompt):
+        standard = _between(prompt, "Standard Answer:", "\n")
+        student = _between(prompt, "Student Answer:", "\n")
+        source = _between(prompt, "Original Source Material:", None)
+        correct = student.strip().strip(").").lower() == standard.strip().strip(").").lower()
+        evidence = (_sentences(source) or ["the source material"])[0]
+        verdict = "matches" if correct else "does not match"
+        return {
+            "is_correct": correct,
+            "correct_answer": standard,
+            "explanation": f"Your answer {verdict} the standard answer {standard}. Source: {evidence}",
+        }
+
+
+class SimulatedFailure(RuntimeError):
+    pass
+
+
+class Limits:
+    """Latency, failure injection and a token-bucket throughput cap, shared across threads."""
+
+    def __init__(self, latency=0.0, error_rate=0.0, rps=0.0, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rps = rps
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = max(rps, 1.0)
+        self._last = time.monotonic()
+
+    @classmethod
+    def from_env(cls):
+        seed = os.getenv("LLM_STANDIN_SEED")
+        return cls(
+            latency=float(os.getenv("LLM_STANDIN_LATENCY", "0")),
+            error_rate=float(os.getenv("LLM_STANDIN_ERROR_RATE", "0")),
+            rps=float(os.getenv("LLM_STANDIN_RPS", "0")),
+            seed=int(seed) if seed else None,
+        )
+
+    def acquire(self, block=True):
+        """Takes one call from the rate budget; returns False if over it and not blocking."""
+        if not self.rps:
+            return True
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(max(self.rps, 1.0), self._tokens + (now - self._last) * self.rps)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rps
+            if not block:
+                return False
+            time.sleep(wait)
+
+    def delay(self):
+        """Sleeps for the configured latency (with +/-20% jitter)."""
+        if self.latency:
+            with self._lock:
+                jitter = self._rng.uniform(0.8, 1.2)
+            time.sleep(self.latency * jitter)
+
+    def should_fail(self):
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+
+class LocalBackend(LLMBackend):
+    """In-process stand-in backend (LLM_BACKEND=local)."""
+    name = "local"
+    piece_size = 80
+
+    def __init__(self, limits=None):
+        self.limits = limits or Limits()
+        self.model = StandInModel()
+
+    @classmethod
+    def from_env(cls):
+        return cls(Limits.from_env())
+
+    def complete(self, prompt, system_instruction=""):
+        return "".join(self.stream(prompt, system_instruction))
+
+    def stream(self, prompt, system_instruction=""):
+        self.limits.acquire()
+        self.limits.delay()
+        if self.limits.should_fail():
+            raise SimulatedFailure("stand-in LLM: simulated failure")
+        text = self.model.respond(prompt)
+        for i in range(0, len(text), self.piece_size):
+            yield text[i:i + self.piece_size]
+
+
+class HTTPBackend(LLMBackend):
+    """Client for the stand-in HTTP server (LLM_BACKEND=http)."""
+    name = "http"
+
+    def __init__(self, url="http://127.0.0.1:8765", timeout=60):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.getenv("LLM_STANDIN_URL", "http://127.0.0.1:8765"))
+
+    def _post(self, prompt, system_instruction, stream):
+        body = json.dumps({"prompt": prompt, "system_instruction": system_instruction, "stream": stream})
+        req = urllib.request.Request(f"{self.url}/v1/complete", data=body.encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+        try:
+            return urllib.request.urlopen(req, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"stand-in LLM returned HTTP {e.code}: {e.read().decode('utf-8', 'replace')}")
+        except urllib.error.URLError as e:
+            raise RuntimeError(f"stand-in LLM unreachable at {self.url}: {e.reason}")
+
+    def complete(self, prompt, system_instruction=""):
+        with self._post(prompt, system_instruction, stream=False) as resp:
+            return json.loads(resp.read())["text"]
+
+    def stream(self, prompt, system_instruction=""):
+        # NOTE: Reads can end inside a multi-byte character; the incremental decoder
+        # holds its first bytes back until the rest arrives
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        with self._post(prompt, system_instruction, stream=True) as resp:
+            while True:
+                piece = resp.read1(4096)
+                if not piece:
+                    break
+                text = decoder.decode(piece)
+                if text:
+                    yield text
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                yield tail
+
+
+# ---------- HTTP server ----------
+
+def make_handler(limits, model):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.0"
+
+        def _json(self, status, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/healthz":
+                self._json(200, {"ok": True})
+            else:
+                self._json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/v1/complete":
+                self._json(404, {"error": "not found"})
+                return
+            try:
+                req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                prompt = req["prompt"]
+            except (ValueError, KeyError):
+                self._json(400, {"error": "expected JSON body with 'prompt'"})
+                return
+            if not limits.acquire(block=False):
+                self._json(429, {"error": "rate limit exceeded"})
+                return
+            limits.delay()
+            if limits.should_fail():
+                self._json(503, {"error": "simulated failure"})
+                return
+            text = model.respond(prompt)
+            if not req.get("stream"):
+                self._json(200, {"text": text})
+                return
+            # HTTP/1.0 without Content-Length: the body ends when the connection closes
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.end_headers()
+            for i in range(0, len(text), LocalBackend.piece_size):
+                self.wfile.write(text[i:i + LocalBackend.piece_size].encode("utf-8"))
+                self.wfile.flush()
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=8765, limits=None):
+    """Runs the stand-in HTTP server until interrupted."""
+    server = ThreadingHTTPServer((host, port), make_handler(limits or Limits(), StandInModel()))
+    server.daemon_threads = True
+    print(f"Stand-in LLM listening on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    env = Limits.from_env()
+    ap = argparse.ArgumentParser(description="Run the offline stand-in LLM server.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=env.latency)
+    ap.add_argument("--error-rate", type=float, default=env.error_rate)
+    ap.add_argument("--rps", type=float, default=env.rps)
+    ap.add_argument("--seed", type=int, default=env.seed)
+    args = ap.parse_args()
+    serve(args.host, args.port, Limits(args.latency, args.error_rate, args.rps, args.seed))
+
+
+if __name__ == "__main__":
+    main()
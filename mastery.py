@@ -0,0 +1,89 @@
+import datetime
+
+# kp_mastery holds one row per knowledge point the learner has answered questions on,
+# updated with every graded attempt (see quizzer._log_attempt), so finding weak areas
+# reads one row per KP instead of aggregating the whole attempt history.
+#
+# score is the smoothed accuracy (correct + 1) / (attempts + 2): a KP answered wrong
+# once (0.33) ranks weaker than one never missed, but one lucky answer (0.67) doesn't
+# count as mastered. It is stored, and indexed, so "weakest first" is an index scan.
+
+LEVELS = ("kp", "topic", "subject")
+
+
+def record(conn, kp_id, is_correct, when=None):
+    """Adds one graded attempt on kp_id to the rollup. Does not commit."""
+    if kp_id is None:
+        return
+    when = when or datetime.datetime.now().isoformat()
+    correct = 1 if is_correct else 0
+    conn.execute("""
+        INSERT INTO kp_mastery (kp_id, subject, topic, attempts, correct, streak, last_seen_at, score)
+        SELECT id, subject, topic, 1, ?, ?, ?, (? + 1.0) / 3.0 FROM knowledge_points WHERE id = ?
+        ON CONFLICT(kp_id) DO UPDATE SET
+          attempts = attempts + 1,
+          correct = correct + excluded.correct,
+          streak = CASE WHEN excluded.correct THEN streak + 1 ELSE 0 END,
+          last_seen_at = excluded.last_seen_at,
+          score = (correct + excluded.correct + 1.0) / (attempts + 3.0)
+    """, (correct, correct, when, correct, kp_id))
+
+
+def rebuild(conn):
+    """Recomputes the rollup from the attempt history (used when the table is created). Does not commit."""
+    conn.execute("DELETE FROM kp_mastery")
+    rows = conn.cursor().execute("""
+        SELECT q.kp_id, a.is_correct, a.created_at
+        FROM attempts a JOIN questions q ON q.id = a.question_id
+        WHERE q.kp_id IS NOT NULL
+        ORDER BY a.id
+    """)
+    for kp_id, is_correct, created_at in rows:
+        record(conn, kp_id, is_correct, created_at)
+
+
+def weak_areas(conn, level="kp", limit=10, min_attempts=1):
+    """
+    Weakest knowledge points (or topics / subjects, aggregated from the per-KP rows)
+    first. Only KPs with at least min_attempts graded attempts are considered.
+    """
+    if level not in LEVELS:
+        raise ValueError(f"level must be one of: {', '.join(LEVELS)}")
+    if level == "kp":
+        rows = conn.execute("""
+            SELECT m.kp_id, m.subject, m.topic, k.kp, m.attempts, m.correct, m.streak, m.last_seen_at, m.score
+            FROM kp_mastery m LEFT JOIN knowledge_points k ON k.id = m.kp_id
+            WHERE m.attempts >= ?
+            ORDER BY m.score, m.last_seen_at
+            LIMIT ?
+        """, (min_attempts, limit)).fetchall()
+        keys = ("kp_id", "subject", "topic", "kp", "attempts", "correct", "streak", "last_seen_at", "score")
+    else:
+        group = "subject" if level == "subject" else "subject, topic"
+        rows = conn.execute(f"""
+            SELECT {group}, COUNT(*), SUM(attempts), SUM(correct), MAX(last_seen_at),
+                   (SUM(correct) + 1.0) / (SUM(attempts) + 2.0) AS score
+            FROM kp_mastery
+            WHERE attempts >= ?
+            GROUP BY {group}
+            ORDER BY score, MAX(last_seen_at)
+            LIMIT ?
+        """, (min_attempts, limit)).fetchall()
+        keys = (("subject",) if level == "subject" else ("subject", "topic")) + (
+            "kps", "attempts", "correct", "last_seen_at", "score")
+    out = []
+    for row in rows:
+        item = dict(zip(keys, row))
+        item["accuracy"] = round(item["correct"] / item["attempts"], 3) if item["attempts"] else None
+        item["score"] = round(item["score"], 3)
+        out.append(item)
+    return out
+
+
+def weakest_kp(conn):
+    """Id of the knowledge point with the lowest mastery score, or None if nothing was answered yet."""
+    row = conn.execute("""
+        SELECT m.kp_id FROM kp_mastery m JOIN knowledge_points k ON k.id = m.kp_id
+        ORDER BY m.score, m.last_seen_at LIMIT 1
+    """).fetchone()
+    return row[0] if row else None
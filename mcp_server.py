@@ -2,95 +2,129 @@
 # mcp_server.py
 # Minimal MCP wrapper for your existing Study Partner modules.
 # Run with: python mcp_server.py  (stdio server)
+#      or:  python mcp_server.py --transport http --port 8000  (long-lived local service)
 # Requires: pip install mcp
 
 import os
 import json
 import sqlite3
+import functools
+import threading
 from typing import Optional, Dict, Any, List
 
 from mcp.server.fastmcp import FastMCP
 
 # Import your local modules
+# Tool-specific modules (PDF parsing, LLM, quiz, report) are imported inside each
+# tool so that starting the server doesn't load stacks a session may never use.
 from db import get_db
-from parser import import_path
-from kp_extractor import extract_knowledge_points as kp_extract_llm, save_knowledge_points
-from quizzer import generate_quiz, grade_and_log
-from report import generate_report
+import metrics
 
 DB_PATH = os.getenv("DB_PATH", "study.db")
+# Learner whose attempts/mistakes tools use when they aren't passed a user (see db.get_db)
+DEFAULT_USER = os.getenv("STUDY_USER") or None
+
+# Tools block (LLM calls, PDF parsing, SQLite), so they run on a pool of worker
+# threads instead of the event loop; MCP_WORKERS caps how many run at once. The
+# workers share this process's LLM backend, caches and database connections.
+MCP_WORKERS = int(os.getenv("MCP_WORKERS", "8"))
 
 mcp = FastMCP("Study Partner")
 
-def _conn() -> sqlite3.Connection:
-    # Your get_db() already initializes schema if needed
-    return get_db(DB_PATH)
+_workers = None
+_local = threading.local()
+
+def _conn(user: Optional[str] = None) -> sqlite3.Connection:
+    # Your get_db() already initializes schema if needed.
+    # NOTE: Connections are pooled per worker thread (SQLite connections can't move
+    # between threads), so the schema check and connection setup happen once per worker.
+    pool = _local.__dict__.setdefault("conns", {})
+    key = (DB_PATH, user)
+    conn = pool.get(key)
+    if conn is None:
+        conn = pool[key] = get_db(DB_PATH, user)
+    elif conn.in_transaction:
+        # Left open by a tool call that failed half-way; don't hold the write lock
+        conn.rollback()
+    return conn
+
+def _limiter():
+    global _workers
+    if _workers is None:
+        import anyio
+        _workers = anyio.CapacityLimiter(MCP_WORKERS)
+    return _workers
+
+def _offload(fn):
+    """Wraps a blocking tool so MCP runs it on the worker pool."""
+    @functools.wraps(fn)
+    async def run(*args, **kwargs):
+        import anyio
+        return await anyio.to_thread.run_sync(functools.partial(fn, *args, **kwargs), limiter=_limiter())
+    return run
+
+def _tool(*args, **kwargs):
+    """mcp.tool() for a blocking function; the function itself stays directly callable."""
+    def decorator(fn):
+        mcp.tool(*args, **kwargs)(_offload(fn))
+        return fn
+    return decorator
+
+def _resource(uri: str):
+    """mcp.resource() for a blocking function; the function itself stays directly callable."""
+    def decorator(fn):
+        mcp.resource(uri)(_offload(fn))
+        return fn
+    return decorator
 
 # ---------- Tools ----------
 
-@mcp.tool()
+@_tool()
+@metrics.timed("mcp_tool_seconds", tool="import_documents")
 def import_documents(path: str, subject: Optional[str] = None) -> Dict[str, int]:
     """Walk a path, parse PDF/MD/TXT into SQLite (documents/chunks). Return counts."""
+    from parser import import_path
     conn = _conn()
     docs, chunks = import_path(conn, path, subject)
     return {"docs": docs, "chunks": chunks}
 
-@mcp.tool()
-def extract_kps(subject: Optional[str] = None, limit: int = 50) -> Dict[str, int]:
-    """Aggregate DB chunks -> LLM extraction -> save into knowledge_points (with source_chunk_id when available)."""
+@_tool()
+@metrics.timed("mcp_tool_seconds", tool="extract_kps")
+def extract_kps(subject: Optional[str] = None, limit: int = 50, include_extracted: bool = False) -> Dict[str, int]:
+    """
+    Aggregate DB chunks -> LLM extraction -> save into knowledge_points (with source_chunk_id when available).
+    Chunk text already extracted (or repeated from another document) is skipped unless include_extracted.
+    """
+    from kp_extractor import iter_extracted, save_extracted
     conn = _conn()
-    cur = conn.cursor()
-    if subject:
-        cur.execute(
-            """SELECT c.id, c.content
-               FROM chunks c
-               JOIN documents d ON d.id = c.document_id
-               WHERE d.subject = ?""",
-            (subject,)
-        )
-    else:
-        cur.execute("SELECT id, content FROM chunks")
-    rows = cur.fetchall()
-    if not rows:
-        return {"inserted": 0, "note": "No chunks found. Run import_documents first."}
-
-    # Build a big string that preserves chunk ids (your extractor can use this)
-    doc = ""
-    for chunk_id, content in rows:
-        doc += f"[CHUNK_ID:{chunk_id}] {content}\n\n"
-
-    kp_list = []
+    # NOTE: Text over the token budget is sent in several calls (see kp_extractor.iter_extracted),
+    # and only the chunks of calls that were made and returned knowledge points are marked.
+    inserted, calls = 0, 0
     try:
-        kp_list = kp_extract_llm(doc, limit=limit) or []
+        for chunk_ids, kp_items in iter_extracted(conn, subject=subject or None, unextracted=not include_extracted):
+            calls += 1
+            kp_items = kp_items[:max(limit - inserted, 0)]
+            if subject:
+                # Chunks picked by subject (given at import or by the classifier) keep that subject
+                for item in kp_items:
+                    item["subject"] = subject
+            inserted += save_extracted(conn, chunk_ids, kp_items)
+            conn.commit()
+            if inserted >= limit:
+                break
     except Exception as e:
-        return {"inserted": 0, "error": f"extractor failed: {e}"}
-
-    # Prefer storing source_chunk_id if provided by the extractor
-    inserted = 0
-    for item in kp_list:
-        subject_val = item.get("subject")
-        topic_val = item.get("topic")
-        kp_text = item.get("kp")
-        chunk_id = item.get("chunk_id")  # optional
-
-        if chunk_id is not None:
-            conn.execute(
-                "INSERT INTO knowledge_points (subject, topic, kp, source_chunk_id) VALUES (?, ?, ?, ?)",
-                (subject_val, topic_val, kp_text, int(chunk_id))
-            )
-        else:
-            # fall back to legacy saver (no chunk linkage)
-            conn.execute(
-                "INSERT INTO knowledge_points (subject, topic, kp) VALUES (?, ?, ?)",
-                (subject_val, topic_val, kp_text)
-            )
-        inserted += 1
-    conn.commit()
+        return {"inserted": inserted, "error": f"extractor failed: {e}"}
+    if not calls:
+        if not include_extracted and conn.execute("SELECT 1 FROM chunks LIMIT 1").fetchone():
+            return {"inserted": 0, "note": "All chunks have been extracted already."}
+        return {"inserted": 0, "note": "No chunks found. Run import_documents first."}
     return {"inserted": inserted}
 
-@mcp.tool()
+@_tool()
+@metrics.timed("mcp_tool_seconds", tool="generate_quiz_tool")
 def generate_quiz_tool(kp_id: int, n: int = 5) -> List[Dict[str, Any]]:
     """Generate questions for a given knowledge point id. Returns question metadata (answer hidden)."""
+    from quizzer import generate_quiz
     conn = _conn()
     items = generate_quiz(conn, kp_id=kp_id, n=n) or []
     # Hide answers to avoid leaking through UI
@@ -104,10 +138,12 @@ def generate_quiz_tool(kp_id: int, n: int = 5) -> List[Dict[str, Any]]:
         })
     return out
 
-@mcp.tool()
-def grade(question_id: int, user_answer: str) -> Dict[str, Any]:
-    """Grade an answer and log to attempts/mistakes. Returns correctness and brief explanation."""
-    conn = _conn()
+@_tool()
+@metrics.timed("mcp_tool_seconds", tool="grade")
+def grade(question_id: int, user_answer: str, user: Optional[str] = None) -> Dict[str, Any]:
+    """Grade an answer and log to the user's attempts/mistakes. Returns correctness and brief explanation."""
+    from quizzer import grade_and_log
+    conn = _conn(user or DEFAULT_USER)
     row = conn.execute(
         "SELECT id, stem, options, answer, explanation FROM questions WHERE id=?",
         (question_id,)
@@ -125,11 +161,14 @@ def grade(question_id: int, user_answer: str) -> Dict[str, Any]:
     is_right = grade_and_log(conn, q, user_answer)
     return {"is_correct": bool(is_right)}
 
-@mcp.tool()
-def export_report_tool() -> Dict[str, str]:
-    """Render the Markdown mistakes report and return its file path."""
-    conn = _conn()
-    message = generate_report(conn)  # your function returns a human message containing the path
+@_tool()
+@metrics.timed("mcp_tool_seconds", tool="export_report_tool")
+def export_report_tool(user: Optional[str] = None) -> Dict[str, str]:
+    """Render the user's Markdown mistakes report and return its file path."""
+    from report import generate_report
+    user = user or DEFAULT_USER
+    conn = _conn(user)
+    message = generate_report(conn, user)  # your function returns a human message containing the path
     # Attempt to extract a path
     path = None
     for token in message.split():
@@ -138,7 +177,8 @@ def export_report_tool() -> Dict[str, str]:
             break
     return {"message": message, "path": path or ""}
 
-@mcp.tool()
+@_tool()
+@metrics.timed("mcp_tool_seconds", tool="list_kps")
 def list_kps(subject: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
     """List knowledge points for easier selection in clients."""
     conn = _conn()
@@ -157,9 +197,67 @@ def list_kps(subject: Optional[str] = None, limit: int = 20) -> List[Dict[str, A
         for r in rows
     ]
 
+@_tool()
+@metrics.timed("mcp_tool_seconds", tool="weak_areas")
+def weak_areas(user: Optional[str] = None, level: str = "kp", limit: int = 10,
+               min_attempts: int = 1) -> List[Dict[str, Any]]:
+    """Weakest knowledge points (level="kp"), topics or subjects for the user, from their mastery rollup."""
+    from mastery import weak_areas as mastery_weak_areas
+    import attempt_log
+    conn = _conn(user or DEFAULT_USER)
+    attempt_log.flush(conn)
+    return mastery_weak_areas(conn, level=level, limit=limit, min_attempts=min_attempts)
+
+@_tool(name="metrics")
+def metrics_tool(format: str = "json") -> Dict[str, Any]:
+    """Return this server's timers and counters (enable with STUDY_METRICS=1). format: json or prometheus."""
+    if format == "prometheus":
+        return {"enabled": metrics.ENABLED, "text": metrics.to_prometheus()}
+    return {"enabled": metrics.ENABLED, **metrics.snapshot()}
+
+# Folder watchers started by start_watch, by path
+_watchers: Dict[str, Any] = {}
+
+def _watch_info(path: str) -> Dict[str, Any]:
+    w = _watchers[path]
+    return {"path": path, "running": w.running, "extract": w.extract, **w.stats}
+
+@_tool()
+@metrics.timed("mcp_tool_seconds", tool="start_watch")
+def start_watch(path: str, subject: Optional[str] = None, extract: bool = False,
+                debounce: Optional[float] = None) -> Dict[str, Any]:
+    """Import a folder, then keep importing new/changed files in the background (optionally extracting KPs)."""
+    from watcher import Watcher
+    if not os.path.isdir(path):
+        return {"error": f"Not a directory: {path}"}
+    if path in _watchers and _watchers[path].running:
+        return _watch_info(path)
+    _watchers[path] = Watcher(path, DB_PATH, subject=subject, extract=extract, debounce=debounce).start()
+    return _watch_info(path)
+
+@_tool()
+@metrics.timed("mcp_tool_seconds", tool="stop_watch")
+def stop_watch(path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Stop watching a folder (or every watched folder). Returns the final status of each."""
+    paths = [path] if path else list(_watchers)
+    out = []
+    for p in paths:
+        if p in _watchers:
+            _watchers[p].stop()
+            out.append(_watch_info(p))
+            del _watchers[p]
+    return out
+
+@_tool()
+@metrics.timed("mcp_tool_seconds", tool="watch_status")
+def watch_status() -> List[Dict[str, Any]]:
+    """List watched folders with their import counts and last error."""
+    return [_watch_info(p) for p in _watchers]
+
 # ---------- Resources (read-only) ----------
 
-@mcp.resource("study://kp/{kp_id}")
+@_resource("study://kp/{kp_id}")
+@metrics.timed("mcp_tool_seconds", tool="get_kp")
 def get_kp(kp_id: int) -> Dict[str, Any]:
     """Return a knowledge point object (with chunk linkage)."""
     conn = _conn()
@@ -171,13 +269,16 @@ def get_kp(kp_id: int) -> Dict[str, Any]:
         return {}
     return {"id": r[0], "subject": r[1], "topic": r[2], "kp": r[3], "source_chunk_id": r[4]}
 
-@mcp.resource("study://chunks/{chunk_id}")
+@_resource("study://chunks/{chunk_id}")
+@metrics.timed("mcp_tool_seconds", tool="get_chunk")
 def get_chunk(chunk_id: int) -> Dict[str, Any]:
     """Return chunk text, page numbers and source file path."""
     conn = _conn()
     r = conn.execute(
-        """SELECT c.id, c.content, c.page_from, c.page_to, d.path
-           FROM chunks c JOIN documents d ON d.id = c.document_id
+        """SELECT c.id, chunk_text(b.content_z), c.page_from, c.page_to, d.path
+           FROM chunks c
+           JOIN chunk_bodies b ON b.id = c.body_id
+           JOIN documents d ON d.id = c.document_id
            WHERE c.id=?""",
         (chunk_id,)
     ).fetchone()
@@ -185,7 +286,76 @@ def get_chunk(chunk_id: int) -> Dict[str, Any]:
         return {}
     return {"id": r[0], "content": r[1], "page_from": r[2], "page_to": r[3], "path": r[4]}
 
+# ---------- HTTP service ----------
+# Health/readiness endpoints for the network transports (not used over stdio).
+
+_state = {"ready": False, "shutting_down": False}
+
+@mcp.custom_route("/healthz", methods=["GET"])
+async def healthz(request):
+    """Liveness: the process is up and serving requests."""
+    from starlette.responses import JSONResponse
+    return JSONResponse({"status": "ok"})
+
+@mcp.custom_route("/readyz", methods=["GET"])
+async def readyz(request):
+    """Readiness: warmed up, the database answers, and not shutting down."""
+    from starlette.responses import JSONResponse
+    import anyio
+    if _state["shutting_down"] or not _state["ready"]:
+        return JSONResponse({"status": "shutting down" if _state["shutting_down"] else "starting"}, status_code=503)
+    try:
+        await anyio.to_thread.run_sync(lambda: _conn().execute("SELECT 1").fetchone(), limiter=_limiter())
+    except Exception as e:
+        return JSONResponse({"status": "database unavailable", "error": str(e)}, status_code=503)
+    return JSONResponse({"status": "ready", "workers": MCP_WORKERS, "watchers": len(_watchers)})
+
+def _warm_up():
+    """Imports the tool modules and creates the LLM backend once, before taking traffic."""
+    import parser, quizzer, kp_extractor, report  # noqa: F401
+    from llm import get_backend
+    get_backend()
+    get_db(DB_PATH).close()  # create/upgrade the database now rather than on the first call
+
+def serve(transport: str = "http", host: str = "127.0.0.1", port: int = 8000, shutdown_timeout: float = 30):
+    """
+    Runs the server as a long-lived local service over streamable HTTP (at /mcp) or
+    SSE (at /sse). On SIGINT/SIGTERM, /readyz starts failing, in-flight calls get up
+    to shutdown_timeout seconds to finish, then watchers and queued answers are flushed.
+    """
+    import uvicorn
+    import attempt_log
+
+    class Server(uvicorn.Server):
+        def handle_exit(self, sig, frame):
+            _state["shutting_down"] = True
+            super().handle_exit(sig, frame)
+
+    app = mcp.sse_app() if transport == "sse" else mcp.streamable_http_app()
+    config = uvicorn.Config(app, host=host, port=port, log_level="info",
+                            timeout_graceful_shutdown=shutdown_timeout)
+    _warm_up()
+    _state["ready"] = True
+    try:
+        Server(config).run()
+    finally:
+        _state["ready"] = False
+        stop_watch()
+        attempt_log.close_all()
+
 if __name__ == "__main__":
-    import asyncio
-    # Start stdio server (works well for local dev and Gemini CLI)
-    asyncio.run(mcp.run(transport="stdio"))
+    import argparse
+    ap = argparse.ArgumentParser(description="Study Partner MCP server.")
+    ap.add_argument("--transport", choices=["stdio", "http", "sse"], default=os.getenv("MCP_TRANSPORT", "stdio"),
+                    help="stdio (default; one process per client) or a local http/sse service.")
+    ap.add_argument("--host", default=os.getenv("MCP_HOST", "127.0.0.1"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("MCP_PORT", "8000")))
+    ap.add_argument("--workers", type=int, default=MCP_WORKERS, help="Tool calls run at once (threads).")
+    ap.add_argument("--shutdown-timeout", type=float, default=30, help="Seconds in-flight calls get on shutdown.")
+    args = ap.parse_args()
+    MCP_WORKERS = args.workers
+    if args.transport == "stdio":
+        # Start stdio server (works well for local dev and Gemini CLI)
+        mcp.run(transport="stdio")
+    else:
+        serve(args.transport, args.host, args.port, args.shutdown_timeout)
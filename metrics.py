@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import atexit
+import threading
+import functools
+from contextlib import contextmanager
+
+# Metrics are off unless STUDY_METRICS is set; every recording function returns
+# immediately in that case, so instrumented code pays only a function call.
+ENABLED = os.getenv("STUDY_METRICS", "").lower() not in ("", "0", "false", "no")
+METRICS_PATH = os.getenv("METRICS_PATH", "metrics.json")
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> {"buckets", "counts", "sum", "count"}
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def enable(flag: bool = True, path: str = None):
+    """Turns recording on or off at runtime; enabled processes save on exit."""
+    global ENABLED, METRICS_PATH
+    ENABLED = flag
+    if path:
+        METRICS_PATH = path
+    if flag:
+        _register_save()
+
+
+def inc(name: str, value: float = 1, **labels):
+    """Adds value to a counter."""
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, value: float, buckets=LATENCY_BUCKETS, **labels):
+    """Records one observation in a histogram."""
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = {"buckets": list(buckets), "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(h["buckets"]):
+            if value <= bound:
+                h["counts"][i] += 1
+                break
+        h["sum"] += value
+        h["count"] += 1
+
+
+@contextmanager
+def timer(name: str, **labels):
+    """Times the enclosed block into histogram `name`; failures also count in errors_total."""
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        inc("errors_total", where=name, **labels)
+        raise
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(name: str, **labels):
+    """Decorator form of timer()."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with timer(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_iter(name: str, iterable, **labels):
+    """Wraps a generator so the time until it is exhausted is recorded."""
+    if not ENABLED:
+        yield from iterable
+        return
+    with timer(name, **labels):
+        yield from iterable
+
+
+# ---------- Export ----------
+
+def snapshot() -> dict:
+    """Returns the current in-process metrics as a JSON-serialisable dict."""
+    with _lock:
+        return {
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(_counters.items())
+            ],
+            "histograms": [
+                {"name": name, "labels": dict(labels), "buckets": list(h["buckets"]),
+                 "counts": list(h["counts"]), "sum": h["sum"], "count": h["count"]}
+                for (name, labels), h in sorted(_histograms.items())
+            ],
+        }
+
+
+def merge(base: dict, extra: dict) -> dict:
+    """Adds the counts of snapshot `extra` into snapshot `base` and returns the result."""
+    counters = {_key(c["name"], c["labels"]): c["value"] for c in base.get("counters", [])}
+    for c in extra.get("counters", []):
+        key = _key(c["name"], c["labels"])
+        counters[key] = counters.get(key, 0) + c["value"]
+    hists = {_key(h["name"], h["labels"]): h for h in base.get("histograms", [])}
+    for h in extra.get("histograms", []):
+        key = _key(h["name"], h["labels"])
+        cur = hists.get(key)
+        if cur is None or cur["buckets"] != h["buckets"]:
+            hists[key] = dict(h)
+            continue
+        cur["counts"] = [a + b for a, b in zip(cur["counts"], h["counts"])]
+        cur["sum"] += h["sum"]
+        cur["count"] += h["count"]
+    return {
+        "counters": [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(counters.items())],
+        "histograms": [{**h, "name": n, "labels": dict(l)} for (n, l), h in sorted(hists.items())],
+    }
+
+
+def _fmt_labels(labels: dict, extra: dict = None) -> str:
+    items = {**labels, **(extra or {})}
+    if not items:
+        return ""
+    def esc(v):
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    body = ",".join(f'{k}="{esc(v)}"' for k, v in sorted(items.items()))
+    return "{" + body + "}"
+
+
+def to_prometheus(snap: dict = None) -> str:
+    """Renders a snapshot in the Prometheus text exposition format."""
+    snap = snap if snap is not None else snapshot()
+    lines = []
+    typed = set()
+    for c in snap["counters"]:
+        if c["name"] not in typed:
+            lines.append(f"# TYPE {c['name']} counter")
+            typed.add(c["name"])
+        lines.append(f"{c['name']}{_fmt_labels(c['labels'])} {c['value']}")
+    for h in snap["histograms"]:
+        name = h["name"]
+        if name not in typed:
+            lines.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        cumulative = 0
+        for bound, count in zip(h["buckets"], h["counts"]):
+            cumulative += count
+            lines.append(f"{name}_bucket{_fmt_labels(h['labels'], {'le': bound})} {cumulative}")
+        lines.append(f"{name}_bucket{_fmt_labels(h['labels'], {'le': '+Inf'})} {h['count']}")
+        lines.append(f"{name}_sum{_fmt_labels(h['labels'])} {h['sum']}")
+        lines.append(f"{name}_count{_fmt_labels(h['labels'])} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def quantile(hist: dict, q: float):
+    """Estimates a quantile from histogram buckets (upper bound of the matching bucket)."""
+    if not hist["count"]:
+        return None
+    target = q * hist["count"]
+    seen = 0
+    for bound, count in zip(hist["buckets"], hist["counts"]):
+        seen += count
+        if seen >= target:
+            return bound
+    return float("inf")
+
+
+def load(path: str = None) -> dict:
+    """Reads a saved snapshot file; returns an empty snapshot if there is none."""
+    path = path or METRICS_PATH
+    if not os.path.exists(path):
+        return {"counters": [], "histograms": []}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save(path: str = None):
+    """Merges this process's metrics into the snapshot file and clears them."""
+    path = path or METRICS_PATH
+    snap = snapshot()
+    if not snap["counters"] and not snap["histograms"]:
+        return
+    merged = merge(load(path), snap)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(merged, f, indent=1)
+    os.replace(tmp, path)
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+_save_registered = False
+
+def _register_save():
+    global _save_registered
+    if not _save_registered:
+        atexit.register(save)
+        _save_registered = True
+
+
+if ENABLED:
+    _register_save()
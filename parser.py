@@ -1,28 +1,118 @@
 import os
+import sys
 import sqlite3
 import datetime
-from PyPDF2 import PdfReader
 from db import get_db
+from chunk_store import put_chunk
+from pdf_extract import iter_pages, PdfBudgetExceeded
+import metrics
 
 def _insert_doc(conn, path, subject):
     """Inserts a document into the database if it doesn't exist."""
     cur = conn.cursor()
-    cur.execute("INSERT OR IGNORE INTO documents(path, title, subject, imported_at) VALUES(?,?,?,?)",
-                (path, os.path.basename(path), subject, datetime.datetime.now().isoformat()))
-    conn.commit()
+    with metrics.timer("db_write_seconds", op="insert_doc"):
+        cur.execute("INSERT OR IGNORE INTO documents(path, title, subject, subject_source, imported_at) VALUES(?,?,?,?,?)",
+                    (path, os.path.basename(path), subject, "user" if subject else None,
+                     datetime.datetime.now().isoformat()))
+        if cur.rowcount == 0 and subject:
+            # Re-import of a known file; an explicitly given subject wins
+            cur.execute("UPDATE documents SET subject=?, subject_source='user' WHERE path=?", (subject, path))
+        conn.commit()
     cur.execute("SELECT id FROM documents WHERE path=?", (path,))
     return cur.fetchone()[0]
 
 def _insert_chunk(conn, doc_id, page_from, page_to, content):
-    """Inserts a text chunk into the database."""
-    conn.execute("INSERT INTO chunks(document_id, page_from, page_to, content) VALUES(?,?,?,?)",
-                 (doc_id, page_from, page_to, content))
+    """Inserts a text chunk into the database (compressed, see chunk_store)."""
+    with metrics.timer("db_write_seconds", op="insert_chunk"):
+        put_chunk(conn, doc_id, page_from, page_to, content)
+        conn.commit()
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.md', '.txt')
+
+def _is_unchanged(conn, path, st):
+    """True if the file was imported before and its mtime and size haven't changed."""
+    row = conn.execute("SELECT mtime, size FROM documents WHERE path=?", (path,)).fetchone()
+    return row is not None and row == (st.st_mtime, st.st_size)
+
+def _finish_doc(conn, doc_id, st, pages_seen=None):
+    """Records the file's mtime/size; with pages_seen, drops chunks for pages the file no longer has."""
+    if pages_seen is not None:
+        marks = ",".join("?" * len(pages_seen))
+        gone = f"SELECT id FROM chunks WHERE document_id=? AND page_from NOT IN ({marks})"
+        # Knowledge points and questions from removed pages stay, without a source
+        for table in ("knowledge_points", "questions"):
+            conn.execute(f"UPDATE {table} SET source_chunk_id=NULL WHERE source_chunk_id IN ({gone})",
+                         (doc_id, *pages_seen))
+        conn.execute(f"DELETE FROM chunks WHERE id IN ({gone})", (doc_id, *pages_seen))
+    conn.execute("UPDATE documents SET mtime=?, size=? WHERE id=?", (st.st_mtime, st.st_size, doc_id))
     conn.commit()
 
+def import_file(conn, p, subject=None):
+    """
+    Imports one file. Returns the number of chunks stored, or None if the file was
+    skipped (unsupported, unreadable, or unchanged since it was last imported).
+    Re-importing a changed file updates its chunks in place.
+    """
+    if not p.lower().endswith(SUPPORTED_EXTENSIONS):
+        return None
+    try:
+        st = os.stat(p)
+    except OSError:
+        return None
+    if _is_unchanged(conn, p, st):
+        metrics.inc("import_files_skipped_total")
+        return None
+
+    n_chunks = 0
+    if p.lower().endswith('.pdf'):
+        doc_id = None
+        pages_seen = []
+        try:
+            for i, text in iter_pages(p):
+                if doc_id is None:
+                    doc_id = _insert_doc(conn, p, subject)
+                if text.strip():
+                    _insert_chunk(conn, doc_id, i, i, text)
+                    pages_seen.append(i)
+                    n_chunks += 1
+            if doc_id is None:
+                doc_id = _insert_doc(conn, p, subject)
+            _finish_doc(conn, doc_id, st, pages_seen)
+        except PdfBudgetExceeded as e:
+            # Keep the pages extracted before the budget ran out
+            metrics.inc("import_errors_total", kind="pdf_budget")
+            print(f"Warning: Stopped reading PDF {p} early ({e.reason}); imported {e.pages_done} page(s).")
+            if doc_id is not None:
+                # No mtime/size, so the next import reads the file again for the rest of its pages
+                conn.execute("UPDATE documents SET mtime=NULL, size=NULL WHERE id=?", (doc_id,))
+                conn.commit()
+        except Exception as e:
+            metrics.inc("import_errors_total", kind="pdf")
+            print(f"Warning: Could not process PDF {p}. Skipping. Error: {e}")
+            return None
+    else:
+        doc_id = _insert_doc(conn, p, subject)
+        try:
+            with open(p, 'r', encoding='utf-8', errors='ignore') as rf:
+                text = rf.read()
+            _insert_chunk(conn, doc_id, 1, 1, text)
+            _finish_doc(conn, doc_id, st)
+            n_chunks += 1
+        except Exception as e:
+            metrics.inc("import_errors_total", kind="text")
+            print(f"Warning: Could not process text file {p}. Skipping. Error: {e}")
+            return None
+    return n_chunks
+
 def import_path(conn, path, subject=None):
-    """Parses files from a given path and imports them into the database."""
+    """
+    Parses files from a given path and imports them into the database. Files that
+    haven't changed since they were last imported are skipped. Imported documents
+    and chunks are then labelled with a subject and topic (see classifier.py).
+    """
     n_docs = 0
     n_chunks = 0
+    doc_ids = []
 
     if subject:
         print(f"Importing documents with subject: {subject}")
@@ -32,26 +122,26 @@ def import_path(conn, path, subject=None):
     for root, _, files in os.walk(path):
         for f in files:
             p = os.path.join(root, f)
-            if f.lower().endswith('.pdf'):
-                try:
-                    reader = PdfReader(p)
-                    doc_id = _insert_doc(conn, p, subject)
-                    for i, page in enumerate(reader.pages, 1):
-                        text = page.extract_text() or ""
-                        if text.strip():
-                            _insert_chunk(conn, doc_id, i, i, text)
-                            n_chunks += 1
-                    n_docs += 1
-                except Exception as e:
-                    print(f"Warning: Could not process PDF {p}. Skipping. Error: {e}")
-            elif f.lower().endswith(('.md', '.txt')):
-                doc_id = _insert_doc(conn, p, subject)
-                try:
-                    with open(p, 'r', encoding='utf-8', errors='ignore') as rf:
-                        text = rf.read()
-                    _insert_chunk(conn, doc_id, 1, 1, text)
-                    n_docs += 1
-                    n_chunks += 1
-                except Exception as e:
-                    print(f"Warning: Could not process text file {p}. Skipping. Error: {e}")
+            n = import_file(conn, p, subject)
+            if n is not None:
+                n_docs += 1
+                n_chunks += n
+                doc_ids += [r[0] for r in conn.execute("SELECT id FROM documents WHERE path=?", (p,))]
+    classify(conn, doc_ids)
     return n_docs, n_chunks
+
+def classify(conn, doc_ids):
+    """Labels imported documents; a failure here never fails the import."""
+    from classifier import classify_documents
+    try:
+        counts = classify_documents(conn, doc_ids)
+    except Exception as e:
+        conn.rollback()
+        metrics.inc("import_errors_total", kind="classify")
+        print(f"Warning: Could not classify imported documents ({e}).", file=sys.stderr)
+        return None
+    # NOTE: stderr, as this also runs inside the stdio MCP server, where stdout is the protocol
+    if counts["classifier"] or counts["llm"]:
+        print(f"Labelled {counts['classifier']} document(s) locally and {counts['llm']} with the LLM.",
+              file=sys.stderr)
+    return counts
@@ -0,0 +1,185 @@
+import os
+import sys
+import time
+
+import metrics
+
+# Backends in the order "auto" tries them: fastest first, PyPDF2 (always installed
+# via requirements.txt) last. Pick one explicitly with PDF_BACKEND=<name>.
+BACKEND_ORDER = ["pypdfium2", "pymupdf", "pypdf", "PyPDF2"]
+
+PDF_BACKEND = os.getenv("PDF_BACKEND", "auto")
+# Per-file budgets; a file that exceeds either stops after the current page
+PDF_MAX_SECONDS = float(os.getenv("PDF_MAX_SECONDS", "300"))
+PDF_MAX_MEMORY_MB = float(os.getenv("PDF_MAX_MEMORY_MB", "1024"))
+
+
+class PdfBudgetExceeded(RuntimeError):
+    """Raised by iter_pages when a file goes over its time or memory budget."""
+
+    def __init__(self, path, pages_done, reason):
+        super().__init__(f"{os.path.basename(path)}: {reason} after {pages_done} page(s)")
+        self.path = path
+        self.pages_done = pages_done
+        self.reason = reason
+
+
+def _rss_mb():
+    """Current resident set size in MB (peak RSS where the current value isn't available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+# ---------- Backends ----------
+# Each takes a path and yields one page's text at a time, dropping its references
+# to the page before moving on so only the current page has to be held in memory.
+
+def _pages_pymupdf(path, budget):
+    try:
+        import pymupdf
+    except ImportError:
+        import fitz as pymupdf
+    doc = pymupdf.open(path)
+    try:
+        for i in range(doc.page_count):
+            page = doc.load_page(i)
+            text = page.get_text()
+            page = None
+            yield text
+    finally:
+        doc.close()
+
+
+def _pages_pypdfium2(path, budget):
+    import pypdfium2
+    pdf = pypdfium2.PdfDocument(path)
+    try:
+        for i in range(len(pdf)):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            text = textpage.get_text_range()
+            textpage.close()
+            page.close()
+            yield text
+    finally:
+        pdf.close()
+
+
+def _pages_pypdf_like(reader, budget):
+    """Shared page loop for pypdf and PyPDF2, which keep every parsed object cached."""
+    for i in range(len(reader.pages)):
+        page = reader.pages[i]
+        text = page.extract_text() or ""
+        page = None
+        yield text
+        # The readers cache every resolved object (decoded content streams, fonts,
+        # images) for the life of the reader; drop the cache when memory gets tight.
+        if budget.over_soft_limit():
+            reader.resolved_objects.clear()
+            metrics.inc("pdf_cache_releases_total")
+
+
+def _pages_pypdf(path, budget):
+    from pypdf import PdfReader
+    with open(path, "rb") as f:
+        yield from _pages_pypdf_like(PdfReader(f), budget)
+
+
+def _pages_pypdf2(path, budget):
+    from PyPDF2 import PdfReader
+    with open(path, "rb") as f:
+        yield from _pages_pypdf_like(PdfReader(f), budget)
+
+
+BACKENDS = {
+    "pypdfium2": (("pypdfium2",), _pages_pypdfium2),
+    "pymupdf": (("pymupdf", "fitz"), _pages_pymupdf),
+    "pypdf": (("pypdf",), _pages_pypdf),
+    "PyPDF2": (("PyPDF2",), _pages_pypdf2),
+}
+
+
+def _importable(modules):
+    from importlib.util import find_spec
+    return any(find_spec(m) is not None for m in modules)
+
+
+def available_backends():
+    """Names of the installed backends, in auto-detection order."""
+    return [name for name in BACKEND_ORDER if _importable(BACKENDS[name][0])]
+
+
+def choose_backend(name=None):
+    """Resolves a backend name ('auto' or None uses PDF_BACKEND, then the fastest installed)."""
+    name = name or PDF_BACKEND
+    if name != "auto":
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown PDF backend '{name}'. Choose from: auto, {', '.join(BACKEND_ORDER)}")
+        if not _importable(BACKENDS[name][0]):
+            raise ValueError(f"PDF backend '{name}' is not installed.")
+        return name
+    available = available_backends()
+    if not available:
+        raise RuntimeError("No PDF backend installed. Install PyPDF2 (see requirements.txt).")
+    return available[0]
+
+
+class _Budget:
+    def __init__(self, path, max_seconds, max_memory_mb):
+        self.path = path
+        self.max_seconds = max_seconds
+        self.max_memory_mb = max_memory_mb
+        self.start = time.monotonic()
+        self.base_mb = _rss_mb()
+
+    def used_mb(self):
+        return _rss_mb() - self.base_mb
+
+    def over_soft_limit(self):
+        return bool(self.max_memory_mb) and self.used_mb() > self.max_memory_mb / 2
+
+    def check(self, pages_done):
+        if self.max_seconds and time.monotonic() - self.start > self.max_seconds:
+            raise PdfBudgetExceeded(self.path, pages_done, f"time budget of {self.max_seconds:g}s exceeded")
+        if self.max_memory_mb and self.used_mb() > self.max_memory_mb:
+            raise PdfBudgetExceeded(self.path, pages_done, f"memory budget of {self.max_memory_mb:g} MB exceeded")
+
+
+def iter_pages(path, backend=None, max_seconds=None, max_memory_mb=None):
+    """
+    Yields (page_number, text) for each page of a PDF, one page at a time.
+
+    Raises PdfBudgetExceeded (after yielding the pages done so far) when the file takes
+    longer than max_seconds or grows the process by more than max_memory_mb; either
+    defaults to PDF_MAX_SECONDS / PDF_MAX_MEMORY_MB, and 0 disables the limit. The time
+    budget is checked between pages, so a single pathological page is not interrupted.
+    """
+    name = choose_backend(backend)
+    budget = _Budget(
+        path,
+        PDF_MAX_SECONDS if max_seconds is None else max_seconds,
+        PDF_MAX_MEMORY_MB if max_memory_mb is None else max_memory_mb,
+    )
+    pages = BACKENDS[name][1](path, budget)
+    page_no = 0
+    try:
+        while True:
+            with metrics.timer("pdf_page_seconds", backend=name):
+                text = next(pages, None)
+            if text is None:
+                break
+            page_no += 1
+            metrics.inc("pdf_pages_total", backend=name)
+            yield page_no, text
+            budget.check(page_no)
+    finally:
+        pages.close()
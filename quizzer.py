@@ -3,7 +3,12 @@ import json
 import sqlite3
 import datetime
 from rich import print
-from llm import ask_gemini_cli
+from llm import ask_gemini_cli, ask_gemini_cli_stream
+from response_parser import JsonArrayStream, parse_json_object
+import metrics
+import attempt_log
+import tokens
+from chunk_store import get_chunk_text
 
 # Prompts for Gemini
 # NOTE: Prompt for generating questions
@@ -38,74 +43,111 @@ Original Source Material:
 {source_content}
 """
 
-def generate_quiz(conn: sqlite3.Connection, kp_id: int, n: int = 5):
+# Expected shape of each generated question and of a grading verdict
+QUESTION_SCHEMA = {
+    "qtype": (str, False),
+    "stem": (str, True),
+    "options": (dict, True),
+    "answer": (str, True),
+    "explanation": (str, False),
+}
+
+GRADE_SCHEMA = {
+    "is_correct": (bool, True),
+    "correct_answer": (str, False),
+    "explanation": (str, False),
+}
+
+def _stream_questions(conn: sqlite3.Connection, kp_id: int, n: int, parser: JsonArrayStream):
+    """(source_chunk_id, question stream) for a knowledge point, or None if it doesn't exist."""
+    result = conn.execute("SELECT kp, source_chunk_id FROM knowledge_points WHERE id = ?", (kp_id,)).fetchone()
+    if not result:
+        return None
+    kp_text, source_chunk_id = result
+
+    fitted = tokens.truncate(kp_text, tokens.room("generate_quiz", GENERATE_QUIZ_PROMPT))
+    prompt = GENERATE_QUIZ_PROMPT.format(n=n, kp_text=fitted)
+    pieces = tokens.track_stream(conn, "generate_quiz", prompt, ask_gemini_cli_stream(prompt),
+                                 truncated=tokens.estimate(kp_text) - tokens.estimate(fitted))
+    return source_chunk_id, parser.iter(pieces)
+
+def _insert_question(cursor: sqlite3.Cursor, kp_id: int, q: dict, source_chunk_id):
+    q.setdefault("qtype", "choice")
+    with metrics.timer("db_write_seconds", op="insert_question"):
+        cursor.execute(
+            "INSERT INTO questions (kp_id, qtype, stem, options, answer, explanation, source_chunk_id, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (kp_id, q.get("qtype"), q.get("stem"), json.dumps(q.get("options")), q.get("answer"), q.get("explanation"), source_chunk_id, datetime.datetime.now().isoformat())
+        )
+    q["id"] = cursor.lastrowid
+    q["kp_id"] = kp_id
+
+def iter_quiz(conn: sqlite3.Connection, kp_id: int, n: int = 5):
     """
-    Generates n quiz questions based on a specific knowledge point ID and saves them to the database.
+    Streams quiz questions for a knowledge point, saving and yielding each one as soon
+    as Gemini has produced it, so a quiz can start before generation has finished.
     """
     cursor = conn.cursor()
-    cursor.execute("SELECT kp FROM knowledge_points WHERE id = ?", (kp_id,))
-    result = cursor.fetchone()
-    if not result:
-        print("[bold red]Error:[/bold red] Knowledge point not found.")
-        return []
-    
-    kp_text = result[0]
-    
-    prompt = GENERATE_QUIZ_PROMPT.format(n=n, kp_text=kp_text)
-    
+    parser = JsonArrayStream(QUESTION_SCHEMA)
+    n_saved = 0
     try:
-        response_text = ask_gemini_cli(prompt)
-        
-        # Extract JSON from markdown code blocks if present
-        if response_text.strip().startswith('```json'):
-            # Find the JSON content between ```json and ```
-            start = response_text.find('```json') + 7
-            end = response_text.find('```', start)
-            json_content = response_text[start:end].strip()
-        elif response_text.strip().startswith('```'):
-            # Handle generic code blocks
-            start = response_text.find('```') + 3
-            end = response_text.find('```', start)
-            json_content = response_text[start:end].strip()
-        else:
-            json_content = response_text.strip()
-        
-        questions = json.loads(json_content)
-    except json.JSONDecodeError as e:
-        print(f"[bold red]Error:[/bold red] Failed to parse JSON from Gemini. {e}")
-        print(f"Gemini raw output: {response_text}")
-        return []
+        stream = _stream_questions(conn, kp_id, n, parser)
+        if stream is None:
+            print("[bold red]Error:[/bold red] Knowledge point not found.")
+            return
+        source_chunk_id, questions = stream
+        for q in questions:
+            try:
+                _insert_question(cursor, kp_id, q, source_chunk_id)
+                # NOTE: Commit before handing the question out, so the database isn't kept
+                # locked while it's answered (e.g. against the write-behind answer log)
+                conn.commit()
+            except Exception as e:
+                print(f"[bold red]Error:[/bold red] Failed to save question to DB: {e}")
+                continue
+            n_saved += 1
+            yield q
     except Exception as e:
         print(f"[bold red]Error:[/bold red] An error occurred while generating quiz: {e}")
-        return []
+    finally:
+        conn.commit()
 
-    if not questions:
+    if parser.dropped:
+        metrics.inc("llm_items_dropped_total", parser.dropped, call_site="generate_quiz")
+        print(f"[bold yellow]Warning:[/bold yellow] Skipped {parser.dropped} malformed question(s) from Gemini.")
+    if not n_saved:
         print("[bold red]Error:[/bold red] Gemini did not generate any questions.")
-        return []
 
-    saved_questions = []
-    for q in questions:
-        try:
-            # Get the source_chunk_id from the knowledge_points table
-            cursor.execute("SELECT source_chunk_id FROM knowledge_points WHERE id = ?", (kp_id,))
-            source_chunk_id = cursor.fetchone()[0]
-
-            cursor.execute(
-                "INSERT INTO questions (kp_id, qtype, stem, options, answer, explanation, source_chunk_id, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                (kp_id, q.get("qtype"), q.get("stem"), json.dumps(q.get("options")), q.get("answer"), q.get("explanation"), source_chunk_id, datetime.datetime.now().isoformat())
-            )
-            q_id = cursor.lastrowid
-            q["id"] = q_id
-            saved_questions.append(q)
-        except Exception as e:
-            print(f"[bold red]Error:[/bold red] Failed to save question to DB: {e}")
-            continue
-            
-    conn.commit()
-    print(f"[green]Successfully generated and saved[/] [bold]{len(saved_questions)}[/bold] questions.")
-    
+def generate_quiz(conn: sqlite3.Connection, kp_id: int, n: int = 5):
+    """
+    Generates n quiz questions based on a specific knowledge point ID and saves them to the database.
+    """
+    saved_questions = list(iter_quiz(conn, kp_id, n))
+    if saved_questions:
+        print(f"[green]Successfully generated and saved[/] [bold]{len(saved_questions)}[/bold] questions.")
     return saved_questions
 
+def draft_quiz(conn: sqlite3.Connection, kp_id: int, n: int = 5):
+    """
+    Generates questions for a knowledge point without saving them (see save_questions).
+    Returns (source_chunk_id, questions); raises LookupError if the KP doesn't exist.
+    """
+    parser = JsonArrayStream(QUESTION_SCHEMA)
+    stream = _stream_questions(conn, kp_id, n, parser)
+    if stream is None:
+        raise LookupError(f"Knowledge point {kp_id} not found")
+    source_chunk_id, questions = stream
+    questions = list(questions)
+    if parser.dropped:
+        metrics.inc("llm_items_dropped_total", parser.dropped, call_site="generate_quiz")
+    return source_chunk_id, questions
+
+def save_questions(conn: sqlite3.Connection, kp_id: int, source_chunk_id, questions):
+    """Saves questions from draft_quiz. Does not commit."""
+    cursor = conn.cursor()
+    for q in questions:
+        _insert_question(cursor, kp_id, q, source_chunk_id)
+    return len(questions)
+
 def grade_and_log(conn: sqlite3.Connection, question: dict, user_answer: str) -> bool:
     """
     Grades the user's answer, logs the attempt, and updates the mistakes table.
@@ -117,14 +159,20 @@ def grade_and_log(conn: sqlite3.Connection, question: dict, user_answer: str) ->
     # Get the source content from the chunks table using source_chunk_id
     cursor = conn.cursor()
     source_content = "Source material not found."
+    truncated = 0
     if question.get("id"):
         cursor.execute("SELECT source_chunk_id FROM questions WHERE id = ?", (question.get("id"),))
         result = cursor.fetchone()
         if result and result[0]:
-            cursor.execute("SELECT content FROM chunks WHERE id = ?", (result[0],))
-            chunk_result = cursor.fetchone()
-            if chunk_result:
-                source_content = chunk_result[0]
+            chunk_text = get_chunk_text(conn, result[0])
+            if chunk_text is not None:
+                # NOTE: Long chunks are cut down to the passages closest to the question
+                options = question.get("options")
+                query = f"{question.get('stem')} {options.get(question.get('answer'), '') if isinstance(options, dict) else ''}"
+                source_content = tokens.select_passages(chunk_text, tokens.room(
+                    "grade", GRADE_PROMPT, question.get("stem") or "", question.get("answer") or "", user_answer
+                ), query)
+                truncated = tokens.estimate(chunk_text) - tokens.estimate(source_content)
     
     prompt = GRADE_PROMPT.format(
         stem=question.get("stem"), 
@@ -133,62 +181,35 @@ def grade_and_log(conn: sqlite3.Connection, question: dict, user_answer: str) ->
         source_content=source_content
     )
     
+    response = ""
     try:
-        response = ask_gemini_cli(prompt)
-        
-        # Extract JSON from markdown code blocks if present
-        if response.strip().startswith('```json'):
-            # Find the JSON content between ```json and ```
-            start = response.find('```json') + 7
-            end = response.find('```', start)
-            json_content = response[start:end].strip()
-        elif response.strip().startswith('```'):
-            # Handle generic code blocks
-            start = response.find('```') + 3
-            end = response.find('```', start)
-            json_content = response[start:end].strip()
-        else:
-            json_content = response.strip()
-        
-        grading_result = json.loads(json_content)
-        is_correct = grading_result.get("is_correct", False)
+        with tokens.track(conn, "grade", prompt, truncated) as call:
+            response = call.response = ask_gemini_cli(prompt)
+        grading_result = parse_json_object(response, GRADE_SCHEMA)
+        if grading_result is None:
+            raise ValueError("no valid grading object in response")
+        is_correct = grading_result["is_correct"]
         explanation = grading_result.get("explanation", explanation)
         correct_answer = grading_result.get("correct_answer", correct_answer)
     except Exception as e:
+        metrics.inc("grade_fallbacks_total")
         print(f"[bold red]Error:[/bold red] Failed to grade with Gemini: {e}. Defaulting to simple comparison.")
         print(f"Debug - Raw response: {response[:200]}...")
         if user_answer.strip().lower() == correct_answer.strip().lower():
             is_correct = True
 
-    # Log the attempt
-    conn.execute(
-        "INSERT INTO attempts (question_id, user_answer, is_correct, created_at) VALUES (?, ?, ?, ?)",
-        (question.get("id"), user_answer, 1 if is_correct else 0, datetime.datetime.now().isoformat())
-    )
+    metrics.inc("grades_total", correct=bool(is_correct))
+    _log_attempt(conn, question, user_answer, is_correct, correct_answer)
 
     if not is_correct:
-        # Log the mistake
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, times FROM mistakes WHERE question_id = ?", (question.get("id"),))
-        row = cursor.fetchone()
-        
-        if row:
-            # Update existing mistake
-            mistake_id, times = row
-            conn.execute(
-                "UPDATE mistakes SET wrong_answer=?, correct_answer=?, last_seen_at=?, times=? WHERE id=?",
-                (user_answer, correct_answer, datetime.datetime.now().isoformat(), times + 1, mistake_id)
-            )
-        else:
-            # Insert new mistake
-            conn.execute(
-                "INSERT INTO mistakes (question_id, wrong_answer, correct_answer, kp_id, first_seen_at, last_seen_at, times) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (question.get("id"), user_answer, correct_answer, question.get("kp_id"), datetime.datetime.now().isoformat(), datetime.datetime.now().isoformat(), 1)
-            )
-
         print(f"\n[bold red]Incorrect! The answer is: {correct_answer}[/]")
     else:
         print("[bold green]✅ Correct![/]")
 
-    conn.commit()
     return is_correct
+
+@metrics.timed("db_write_seconds", op="log_attempt")
+def _log_attempt(conn: sqlite3.Connection, question: dict, user_answer: str, is_correct: bool, correct_answer: str):
+    """Records the attempt, updates the KP's mastery rollup and, for wrong answers, the mistake log."""
+    # NOTE: With GRADE_DURABILITY=batch this only queues the answer; see attempt_log.py
+    attempt_log.record(conn, attempt_log.attempt(question, user_answer, is_correct, correct_answer))
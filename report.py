@@ -3,9 +3,11 @@ import os
 import json
 import datetime
 
+import attempt_log
+
 # NOTE: This template generates a clean Markdown report
 REPORT_TEMPLATE = """
-# Study Partner - Mistake Report
+# Study Partner - Mistake Report{title}
 
 **Date:** {date}
 **Total Mistakes:** {total_mistakes}
@@ -21,10 +23,14 @@ REPORT_TEMPLATE = """
 _This report was generated by your personal AI Study Partner._
 """
 
-def generate_report(conn: sqlite3.Connection):
+def generate_report(conn: sqlite3.Connection, user: str = None):
     """
     Generates a Markdown report of all mistakes and saves it to a file.
+    With a user, the report is titled and named for that learner.
     """
+    # Include answers still queued by the write-behind attempt log
+    attempt_log.flush(conn)
+
     cursor = conn.cursor()
     cursor.execute("""
         SELECT
@@ -35,10 +41,12 @@ def generate_report(conn: sqlite3.Connection):
             d.path,
             c.page_from,
             c.page_to,
-            c.content
+            b.preview,
+            b.content_len
         FROM mistakes m
         JOIN questions q ON q.id = m.question_id
         LEFT JOIN chunks c ON c.id = q.source_chunk_id
+        LEFT JOIN chunk_bodies b ON b.id = c.body_id
         LEFT JOIN documents d ON d.id = c.document_id
         ORDER BY m.first_seen_at DESC
     """)
@@ -49,7 +57,7 @@ def generate_report(conn: sqlite3.Connection):
 
     mistake_list = ""
     for i, row in enumerate(mistakes, 1):
-        stem, wrong_ans, correct_ans, first_seen, path, page_from, page_to, content = row
+        stem, wrong_ans, correct_ans, first_seen, path, page_from, page_to, preview, content_len = row
         
         mistake_entry = (
             f"### {i}. Question: {stem}\n"
@@ -61,15 +69,18 @@ def generate_report(conn: sqlite3.Connection):
         if path:
             mistake_entry += f"- **Source:** {os.path.basename(path)}, page {page_from}\n"
         
-        if content:
-            # Show first 200 characters of the source content for context
-            preview = content[:200] + "..." if len(content) > 200 else content
+        if preview:
+            # Show first 200 characters of the source content for context (stored
+            # uncompressed next to the chunk, so the report never decompresses)
+            if content_len > len(preview):
+                preview += "..."
             mistake_entry += f"- **Source Content:** {preview}\n"
             
         mistake_entry += "\n"
         mistake_list += mistake_entry
     
     report_content = REPORT_TEMPLATE.format(
+        title=f" for {user}" if user else "",
         date=datetime.date.today().isoformat(),
         total_mistakes=len(mistakes),
         mistake_list=mistake_list
@@ -78,7 +89,8 @@ def generate_report(conn: sqlite3.Connection):
     # Save the report to a file
     report_dir = "reports"
     os.makedirs(report_dir, exist_ok=True)
-    report_file = os.path.join(report_dir, f"mistake_report_{datetime.date.today().isoformat()}.md")
+    prefix = f"mistake_report_{user}_" if user else "mistake_report_"
+    report_file = os.path.join(report_dir, f"{prefix}{datetime.date.today().isoformat()}.md")
     
     with open(report_file, "w", encoding="utf-8") as f:
         f.write(report_content)
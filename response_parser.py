@@ -0,0 +1,249 @@
+import json
+
+# Schemas are plain dicts mapping a field name to (expected type, required).
+# Call sites declare their own schema next to the prompt that asks for it.
+
+_TRUE = {"true", "yes", "1", "correct"}
+_FALSE = {"false", "no", "0", "incorrect"}
+
+
+def _coerce(value, expected):
+    """Returns value converted to the expected type, or raises ValueError."""
+    if expected is bool:
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.strip().lower() in _TRUE | _FALSE:
+            return value.strip().lower() in _TRUE
+        if isinstance(value, int):
+            return bool(value)
+        raise ValueError(f"expected bool, got {value!r}")
+    if expected is int:
+        if isinstance(value, bool):
+            raise ValueError(f"expected int, got {value!r}")
+        if isinstance(value, int):
+            return value
+        if isinstance(value, str):
+            # Models sometimes echo the marker, e.g. "CHUNK_ID:12"
+            digits = value.rsplit(":", 1)[-1].strip()
+            return int(digits)
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        raise ValueError(f"expected int, got {value!r}")
+    if expected is str:
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        raise ValueError(f"expected str, got {value!r}")
+    if isinstance(value, expected):
+        return value
+    raise ValueError(f"expected {expected.__name__}, got {value!r}")
+
+
+def validate(item, schema):
+    """
+    Checks a decoded JSON value against a schema.
+
+    Returns a new dict holding only the schema's fields (coerced to their expected
+    types), or None if the item is not an object or a required field is missing or
+    invalid. Invalid optional fields are dropped rather than rejecting the item.
+    """
+    if schema is None:
+        return item
+    if not isinstance(item, dict):
+        return None
+    clean = {}
+    for name, (expected, required) in schema.items():
+        value = item.get(name)
+        if value is None or value == "":
+            if required:
+                return None
+            continue
+        try:
+            clean[name] = _coerce(value, expected)
+        except (ValueError, TypeError):
+            if required:
+                return None
+    return clean
+
+
+class JsonArrayStream:
+    """
+    Incrementally pulls elements out of a JSON array embedded in LLM output.
+
+    Text can be fed in arbitrary pieces as it streams in. Leading prose and markdown
+    fences are skipped, each array element is decoded on its own as soon as it is
+    complete, and elements that fail to decode or validate are counted in `dropped`
+    instead of discarding the whole response.
+    """
+
+    def __init__(self, schema=None):
+        self.schema = schema
+        self.dropped = 0
+        self.done = False
+        self._buf = ""
+        self._pos = 0
+        self._in_array = False
+        self._start = None    # start offset of the element being collected
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text):
+        """Adds more response text and returns the newly completed, valid items."""
+        if self.done or not text:
+            return []
+        self._buf += text
+        items = []
+        while not self.done:
+            if not self._in_array:
+                if not self._seek_array():
+                    break
+                continue
+            if self._start is None:
+                if not self._seek_element():
+                    break
+                continue
+            raw = self._scan_element()
+            if raw is None:
+                break
+            self._accept(raw, items)
+        self._compact()
+        return items
+
+    def close(self):
+        """Flushes a trailing element when the stream ends without a closing bracket."""
+        items = []
+        if self._in_array and self._start is not None and not self.done:
+            raw = self._buf[self._start:].strip()
+            if raw:
+                self._accept(raw, items)
+        self.done = True
+        return items
+
+    def iter(self, source):
+        """Yields valid items from a string or an iterable of streamed text pieces."""
+        if isinstance(source, str):
+            source = (source,)
+        for piece in source:
+            yield from self.feed(piece)
+        yield from self.close()
+
+    # -- scanning helpers --
+
+    def _seek_array(self):
+        """Finds a '[' that opens an array of objects; False means more text is needed."""
+        buf = self._buf
+        while True:
+            i = buf.find("[", self._pos)
+            if i < 0:
+                self._pos = len(buf)
+                return False
+            j = i + 1
+            while j < len(buf) and buf[j].isspace():
+                j += 1
+            if j == len(buf):
+                self._pos = i
+                return False
+            if buf[j] in "{]":
+                self._in_array = True
+                self._pos = i + 1
+                return True
+            self._pos = i + 1
+
+    def _seek_element(self):
+        buf = self._buf
+        while self._pos < len(buf):
+            ch = buf[self._pos]
+            if ch.isspace() or ch == ",":
+                self._pos += 1
+            elif ch == "]":
+                self.done = True
+                return True
+            else:
+                self._start = self._pos
+                self._depth = 0
+                self._in_string = False
+                self._escape = False
+                return True
+        return False
+
+    def _scan_element(self):
+        """Advances over the current element; returns its text once complete."""
+        buf = self._buf
+        while self._pos < len(buf):
+            ch = buf[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    # Closing bracket of the array itself ends a scalar element.
+                    raw = buf[self._start:self._pos]
+                    self._start = None
+                    return raw
+                self._depth -= 1
+                if self._depth == 0:
+                    self._pos += 1
+                    raw = buf[self._start:self._pos]
+                    self._start = None
+                    return raw
+            elif ch == "," and self._depth == 0:
+                raw = buf[self._start:self._pos]
+                self._start = None
+                return raw
+            self._pos += 1
+        return None
+
+    def _accept(self, raw, items):
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            self.dropped += 1
+            return
+        clean = validate(value, self.schema)
+        if clean is None:
+            self.dropped += 1
+        else:
+            items.append(clean)
+
+    def _compact(self):
+        """Drops already-consumed text so long streams don't keep growing the buffer."""
+        keep = self._start if self._start is not None else self._pos
+        if keep > 4096:
+            self._buf = self._buf[keep:]
+            self._pos -= keep
+            if self._start is not None:
+                self._start -= keep
+
+
+def parse_json_array(text, schema=None):
+    """Returns the valid items of the first JSON array of objects found in text."""
+    return list(JsonArrayStream(schema).iter(text))
+
+
+def parse_json_object(text, schema=None):
+    """
+    Returns the first JSON object in text that validates against schema, or None.
+    Surrounding prose, markdown fences and trailing text are ignored.
+    """
+    decoder = json.JSONDecoder()
+    i = text.find("{")
+    while i >= 0:
+        try:
+            value, _ = decoder.raw_decode(text, i)
+        except json.JSONDecodeError:
+            value = None
+        clean = validate(value, schema) if isinstance(value, dict) else None
+        if clean is not None:
+            return clean
+        i = text.find("{", i + 1)
+    return None
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    """A fresh database in a temporary folder, with the offline stand-in LLM."""
+    import llm
+    from db import get_db
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(llm, "_backend", None)
+    llm.set_backend("local")
+    c = get_db(str(tmp_path / "study.db"))
+    yield c
+    c.close()
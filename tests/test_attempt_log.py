@@ -0,0 +1,28 @@
+import sqlite3
+
+import attempt_log
+import quizzer
+
+
+def test_batch_flush_succeeds_during_quiz(conn, monkeypatch, tmp_path):
+    monkeypatch.setattr(attempt_log, "GRADE_DURABILITY", "batch")
+    monkeypatch.setattr(attempt_log, "ATTEMPT_FLUSH_SECONDS", 3600)  # flushed by hand below
+    kp_id = conn.execute(
+        "INSERT INTO knowledge_points (subject, topic, kp) VALUES ('Physics', 'Optics', "
+        "'Light travels at about 300,000 km per second in a vacuum.')"
+    ).lastrowid
+    conn.commit()
+
+    flushed = []
+    try:
+        for q in quizzer.iter_quiz(conn, kp_id, 3):
+            quizzer.grade_and_log(conn, q, "A")
+            # The quiz's connection mustn't be holding the write lock mid-quiz
+            assert not conn.in_transaction
+            flushed.append(attempt_log._log_for(conn).flush())
+            other = sqlite3.connect(str(tmp_path / "study.db"))
+            assert other.execute("SELECT COUNT(*) FROM attempts").fetchone()[0] == len(flushed)
+            other.close()
+    finally:
+        attempt_log.close_all()
+    assert flushed and all(n == 1 for n in flushed)
@@ -0,0 +1,44 @@
+import gzip
+
+import bank
+from chunk_store import get_chunk_text
+from db import get_db
+from parser import _insert_doc, _insert_chunk
+
+
+def _bank(tmp_path):
+    """A bank of one page with a knowledge point and a question, whose question line appears twice."""
+    src = get_db(str(tmp_path / "src.db"))
+    doc_id = _insert_doc(src, "lecture.txt", "Physics")
+    _insert_chunk(src, doc_id, 1, 1, "The bank's text for page one.")
+    kp_id = src.execute("INSERT INTO knowledge_points (subject, kp, source_chunk_id) VALUES ('Physics', 'kp', 1)").lastrowid
+    src.execute("INSERT INTO questions (kp_id, stem, answer, source_chunk_id) VALUES (?, 'Why?', 'A', 1)", (kp_id,))
+    src.commit()
+    path = tmp_path / "bank.jsonl.gz"
+    bank.export_bank(src, str(path), include_chunks=True)
+    src.close()
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        lines = f.readlines()
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.writelines(lines + [l for l in lines if '"type": "question"' in l])
+    return str(path)
+
+
+def test_import_keeps_local_chunk_text(conn, tmp_path):
+    path = _bank(tmp_path)
+    doc_id = _insert_doc(conn, "lecture.txt", "Physics")
+    _insert_chunk(conn, doc_id, 1, 1, "My own notes for page one.")
+
+    counts = bank.import_bank(conn, path)
+
+    assert counts["chunk_conflict"] == 1
+    assert get_chunk_text(conn, 1) == "My own notes for page one."
+
+
+def test_import_counts_repeats_within_the_bank(conn, tmp_path):
+    path = _bank(tmp_path)
+    counts = bank.import_bank(conn, path)
+    assert (counts["question"], counts.get("question_duplicate"), counts.get("question_existing")) == (1, 1, None)
+
+    counts = bank.import_bank(conn, path)
+    assert (counts.get("question"), counts["question_existing"]) == (None, 2)
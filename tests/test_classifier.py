@@ -0,0 +1,41 @@
+import classifier
+from parser import _insert_doc, _insert_chunk
+
+PHYSICS = ("Newton's second law relates force, mass and acceleration. Momentum is conserved in "
+           "collisions. Kinetic energy grows with the square of velocity; gravity accelerates falling bodies.")
+BIOLOGY = ("Cells divide by mitosis. Enzymes catalyse reactions in the cell, and DNA carries the genes "
+           "that proteins are built from. Photosynthesis in chloroplasts turns light into sugar.")
+COOKING = ("Whisk the eggs with sugar, fold in the flour and butter, and bake the cake until golden; "
+           "a hot oven gives the batter the energy to rise. Season the sauce with salt and fresh basil.")
+
+
+def _doc(conn, path, text, subject=None):
+    doc_id = _insert_doc(conn, path, subject)
+    _insert_chunk(conn, doc_id, 1, 1, text)
+    return doc_id
+
+
+def test_single_subject_is_not_confident(conn, monkeypatch):
+    monkeypatch.setattr(classifier, "CLASSIFY_MODE", "local")
+    _doc(conn, "physics.txt", PHYSICS, "Physics")
+    cooking = _doc(conn, "cake.txt", COOKING)
+
+    assert classifier.classify_documents(conn, [cooking])["unlabelled"] == 1
+    assert conn.execute("SELECT subject FROM documents WHERE id = ?", (cooking,)).fetchone()[0] is None
+
+
+def test_two_subjects_label_locally(conn, monkeypatch):
+    monkeypatch.setattr(classifier, "CLASSIFY_MODE", "local")
+    _doc(conn, "physics.txt", PHYSICS, "Physics")
+    _doc(conn, "biology.txt", BIOLOGY, "Biology")
+    doc_id = _doc(conn, "mechanics.txt", "Force equals mass times acceleration; momentum and kinetic energy.")
+
+    assert classifier.classify_documents(conn, [doc_id])["classifier"] == 1
+    assert conn.execute("SELECT subject FROM documents WHERE id = ?", (doc_id,)).fetchone()[0] == "Physics"
+
+
+def test_model_retrains_when_a_subject_changes(conn):
+    _doc(conn, "notes.txt", PHYSICS, "Physics")
+    assert set(classifier.model(conn).subjects) == {"Physics"}
+    _insert_doc(conn, "notes.txt", "Mechanics")  # re-import with another subject
+    assert set(classifier.model(conn).subjects) == {"Mechanics"}
@@ -0,0 +1,64 @@
+import sqlite3
+
+import pytest
+
+import db
+
+
+def test_unique_mistakes_migration_merges_counts():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(db.USER_SCHEMA)
+    conn.executemany(
+        "INSERT INTO mistakes (question_id, wrong_answer, correct_answer, first_seen_at, last_seen_at, times) "
+        "VALUES (?, ?, ?, ?, ?, ?)", [
+            (1, "A", "C", "2025-01-01", "2025-01-03", 2),
+            (1, "B", "C", "2025-01-02", "2025-01-05", 3),
+            (2, "D", "A", "2025-01-04", "2025-01-04", 1),
+        ])
+    db._m6_unique_mistakes(conn)
+    rows = conn.execute(
+        "SELECT question_id, wrong_answer, first_seen_at, last_seen_at, times FROM mistakes ORDER BY question_id"
+    ).fetchall()
+    assert rows == [(1, "B", "2025-01-01", "2025-01-05", 5), (2, "D", "2025-01-04", "2025-01-04", 1)]
+
+
+def _tables(path):
+    conn = sqlite3.connect(path)
+    names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.close()
+    return names
+
+
+def test_user_database_is_attached_to_the_shared_one(tmp_path):
+    shared = str(tmp_path / "study.db")
+    conn = db.get_db(shared, user="alice")
+    files = {name: path for _, name, path in conn.execute("PRAGMA database_list")}
+    assert files == {"main": str(tmp_path / "users" / "alice.db"), "shared": shared}
+
+    # Unqualified names reach the shared tables through the attachment...
+    kp_id = conn.execute("INSERT INTO knowledge_points (kp) VALUES ('shared kp')").lastrowid
+    q_id = conn.execute("INSERT INTO questions (kp_id, stem) VALUES (?, 'Why?')", (kp_id,)).lastrowid
+    # ...and the learner's history goes to their own file
+    conn.execute("INSERT INTO attempts (question_id, user_answer, is_correct) VALUES (?, 'A', 0)", (q_id,))
+    conn.commit()
+    conn.close()
+
+    user_tables, shared_tables = _tables(files["main"]), _tables(shared)
+    assert {"attempts", "mistakes", "kp_mastery", "llm_calls"} <= user_tables
+    assert not {"documents", "chunks", "knowledge_points", "questions"} & user_tables
+    assert {"documents", "chunks", "knowledge_points", "questions", "tasks"} <= shared_tables
+
+    bob = db.get_db(shared, user="bob")
+    assert bob.execute("SELECT COUNT(*) FROM knowledge_points").fetchone()[0] == 1
+    assert bob.execute("SELECT COUNT(*) FROM attempts").fetchone()[0] == 0
+    bob.close()
+    alice = sqlite3.connect(files["main"])
+    assert alice.execute("SELECT COUNT(*) FROM attempts").fetchone()[0] == 1
+    alice.close()
+    assert db.list_users(shared) == ["alice", "bob"]
+
+
+def test_user_names_cannot_leave_the_users_folder(tmp_path):
+    for name in ("../evil", "a/b", ""):
+        with pytest.raises(ValueError):
+            db.user_db_path(str(tmp_path / "study.db"), name)
@@ -0,0 +1,35 @@
+import llm_standin
+
+
+class _OneByteAtATime:
+    """A streamed HTTP response whose reads split multi-byte characters."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def read1(self, n):
+        piece, self.data = self.data[:1], self.data[1:]
+        return piece
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_http_stream_keeps_split_characters(monkeypatch):
+    text = '[{"kp": "Schrödinger\'s equation", "topic": "量子力学"}]'
+    backend = llm_standin.HTTPBackend()
+    monkeypatch.setattr(backend, "_post", lambda *a, **k: _OneByteAtATime(text.encode("utf-8")))
+    assert "".join(backend.stream("prompt")) == text
+
+
+def test_server_options_default_to_env(monkeypatch):
+    monkeypatch.setenv("LLM_STANDIN_SEED", "7")
+    monkeypatch.setenv("LLM_STANDIN_LATENCY", "0.5")
+    monkeypatch.setattr("sys.argv", ["llm_standin.py", "--port", "0"])
+    started = {}
+    monkeypatch.setattr(llm_standin, "serve", lambda host, port, limits: started.update(limits=limits))
+    llm_standin.main()
+    assert (started["limits"].seed, started["limits"].latency) == (7, 0.5)
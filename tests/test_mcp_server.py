@@ -0,0 +1,39 @@
+import pytest
+
+pytest.importorskip("mcp")
+from starlette.testclient import TestClient
+
+import mcp_server
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr(mcp_server, "DB_PATH", str(tmp_path / "study.db"))
+    monkeypatch.setattr(mcp_server, "_state", {"ready": False, "shutting_down": False})
+    monkeypatch.setattr(mcp_server, "_workers", None)
+    monkeypatch.setattr(mcp_server._local, "conns", {}, raising=False)
+    return mcp_server
+
+
+@pytest.mark.parametrize("transport", ["http", "sse"])
+def test_health_and_readiness(server, transport, monkeypatch):
+    app = server.mcp.sse_app() if transport == "sse" else server.mcp.streamable_http_app()
+    with TestClient(app) as client:
+        assert client.get("/healthz").json() == {"status": "ok"}
+
+        starting = client.get("/readyz")
+        assert (starting.status_code, starting.json()["status"]) == (503, "starting")
+
+        server._state["ready"] = True
+        ready = client.get("/readyz")
+        assert (ready.status_code, ready.json()["status"]) == (200, "ready")
+
+        monkeypatch.setattr(server, "_conn", lambda user=None: (_ for _ in ()).throw(RuntimeError("disk gone")))
+        broken = client.get("/readyz")
+        assert (broken.status_code, broken.json()["error"]) == (503, "disk gone")
+
+        server._state["shutting_down"] = True
+        stopping = client.get("/readyz")
+        assert (stopping.status_code, stopping.json()["status"]) == (503, "shutting down")
+        # Liveness doesn't change while draining
+        assert client.get("/healthz").status_code == 200
@@ -0,0 +1,32 @@
+import os
+
+import parser
+
+
+def _import_pdf(conn, monkeypatch, path, pages):
+    monkeypatch.setattr(parser, "iter_pages", lambda p: iter(enumerate(pages, 1)))
+    return parser.import_file(conn, str(path))
+
+
+def test_reimport_with_fewer_pages_unlinks_removed_chunks(conn, monkeypatch, tmp_path):
+    pdf = tmp_path / "slides.pdf"
+    pdf.write_bytes(b"v1")
+    assert _import_pdf(conn, monkeypatch, pdf, ["Page one text", "Page two text", "Page three text"]) == 3
+    kept, removed = [r[0] for r in conn.execute("SELECT id FROM chunks WHERE page_from IN (1, 3) ORDER BY page_from")]
+    for chunk_id in (kept, removed):
+        kp_id = conn.execute("INSERT INTO knowledge_points (kp, source_chunk_id) VALUES ('kp', ?)", (chunk_id,)).lastrowid
+        conn.execute("INSERT INTO questions (kp_id, stem, source_chunk_id) VALUES (?, 'stem', ?)", (kp_id, chunk_id))
+    conn.commit()
+
+    pdf.write_bytes(b"v2, now two pages")
+    os.utime(pdf, (1, 1))
+    assert _import_pdf(conn, monkeypatch, pdf, ["Page one text", "Page two, rewritten"]) == 2
+
+    assert [r[0] for r in conn.execute("SELECT page_from FROM chunks ORDER BY page_from")] == [1, 2]
+    for table in ("knowledge_points", "questions"):
+        links = [r[0] for r in conn.execute(f"SELECT source_chunk_id FROM {table} ORDER BY id")]
+        assert links == [kept, None]
+    # Nothing left for `doctor` to flag
+    assert not conn.execute(
+        "SELECT 1 FROM knowledge_points k WHERE k.source_chunk_id IS NOT NULL "
+        "AND NOT EXISTS (SELECT 1 FROM chunks c WHERE c.id = k.source_chunk_id)").fetchone()
@@ -0,0 +1,64 @@
+import pytest
+
+from response_parser import JsonArrayStream, parse_json_array, parse_json_object
+
+SCHEMA = {"kp": (str, True), "chunk_id": (int, False)}
+
+RESPONSE = """Sure! Here are the knowledge points [as requested]:
+
+```json
+[
+  {"kp": "Brackets ] and [ inside strings, and \\"escaped quotes\\", are text", "chunk_id": 3},
+  {"kp": "Schrödinger's equation", "chunk_id": "CHUNK_ID:7"},
+  {"kp": "nested", "extra": {"a": [1, 2, {"b": "}"}]}}
+]
+```
+Let me know if you need more."""
+
+
+def _stream(text, size):
+    parser = JsonArrayStream(SCHEMA)
+    return list(parser.iter(text[i:i + size] for i in range(0, len(text), size))), parser.dropped
+
+
+def test_skips_prose_and_code_fences():
+    items = parse_json_array(RESPONSE, SCHEMA)
+    assert [i["kp"] for i in items] == [
+        'Brackets ] and [ inside strings, and "escaped quotes", are text', "Schrödinger's equation", "nested"]
+    assert [i.get("chunk_id") for i in items] == [3, 7, None]
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 64])
+def test_split_pieces_give_the_same_items(size):
+    assert _stream(RESPONSE, size) == (parse_json_array(RESPONSE, SCHEMA), 0)
+
+
+def test_items_are_yielded_as_soon_as_they_are_complete():
+    parser = JsonArrayStream(SCHEMA)
+    assert parser.feed('[{"kp": "one"}, {"kp": "tw') == [{"kp": "one"}]
+    assert parser.feed('o"}]') == [{"kp": "two"}]
+    assert parser.done
+
+
+def test_malformed_elements_are_dropped_not_fatal():
+    text = '[{"kp": "ok"}, {"kp": broken}, {"no_kp": 1}, "scalar", {"kp": "also ok", "chunk_id": "x"}]'
+    items, dropped = _stream(text, 5)
+    assert items == [{"kp": "ok"}, {"kp": "also ok"}]  # an invalid optional field is left out
+    assert dropped == 3
+
+
+def test_truncated_stream_keeps_complete_items():
+    items, dropped = _stream('[{"kp": "done"}, {"kp": "cut off', 4)
+    assert items == [{"kp": "done"}]
+    assert dropped == 1
+
+
+def test_no_array_gives_nothing():
+    assert parse_json_array("I could not find any knowledge points.", SCHEMA) == []
+
+
+def test_parse_json_object_skips_prose_and_invalid_objects():
+    schema = {"is_correct": (bool, True), "explanation": (str, False)}
+    text = 'Grading {not json} then:\n```json\n{"is_correct": "yes", "explanation": "Right"}\n```'
+    assert parse_json_object(text, schema) == {"is_correct": True, "explanation": "Right"}
+    assert parse_json_object('{"explanation": "no verdict"}', schema) is None
@@ -0,0 +1,117 @@
+import pytest
+
+import tokens
+
+
+@pytest.mark.parametrize("backend", ["mock", "local", "http", "fake"])
+def test_offline_backends_are_free(backend):
+    assert tokens.cost(backend, 10_000, 10_000) == 0.0
+
+
+def test_gemini_is_charged():
+    assert tokens.cost("gemini", 1_000_000, 0) == pytest.approx(tokens.PRICE_INPUT)
+
+
+def _budget(monkeypatch, site, template, material):
+    """Leaves room for `material` tokens of source text at site once template is counted."""
+    monkeypatch.setitem(tokens.BUDGETS, site, tokens.estimate(template) + material)
+
+
+def _calls(conn, site):
+    return conn.execute(
+        "SELECT prompt_tokens, truncated_tokens FROM llm_calls WHERE call_site = ? ORDER BY id", (site,)
+    ).fetchall()
+
+
+def test_room_never_drops_below_minimum(monkeypatch):
+    monkeypatch.setitem(tokens.BUDGETS, "grade", 100)
+    assert tokens.room("grade", "x" * 4_000) == tokens.MIN_ROOM
+
+
+def test_truncate_fits_budget():
+    text = "word " * 2_000
+    cut = tokens.truncate(text, 300)
+    assert tokens.estimate(cut) <= 300 and cut.endswith(tokens.TRUNCATION_MARK)
+    assert tokens.truncate("short text", 300) == "short text"
+
+
+def test_select_passages_keeps_relevant_paragraph():
+    filler = ["Unrelated filler paragraph number %d about nothing much at all." % i for i in range(200)]
+    filler.insert(120, "Photosynthesis turns light into sugar inside chloroplasts.")
+    picked = tokens.select_passages("\n\n".join(filler), 300, "Where does photosynthesis happen?")
+    assert "chloroplasts" in picked and tokens.estimate(picked) <= 300
+
+
+def test_pack_batches_fit_budget():
+    items = ["x" * 400] * 10  # 100 tokens each
+    batches = list(tokens.pack(items, 350))
+    assert [len(b) for b in batches] == [3, 3, 3, 1]
+    assert [len(b) for b in tokens.pack(["x" * 4_000, "y"], 350)] == [1, 1]  # oversized on its own
+
+
+def test_generate_quiz_prompt_within_budget(conn, monkeypatch):
+    import quizzer
+
+    _budget(monkeypatch, "generate_quiz", quizzer.GENERATE_QUIZ_PROMPT, 300)
+    kp_id = conn.execute("INSERT INTO knowledge_points (subject, topic, kp) VALUES ('Physics', 'Optics', ?)",
+                         ("Light bends when it enters glass. " * 200,)).lastrowid
+    conn.commit()
+    quizzer.draft_quiz(conn, kp_id, 3)
+
+    [(prompt_tokens, truncated)] = _calls(conn, "generate_quiz")
+    assert prompt_tokens <= tokens.BUDGETS["generate_quiz"] and truncated > 0
+
+
+def test_extraction_splits_over_budget(conn, monkeypatch):
+    import kp_extractor
+    from parser import _insert_doc, _insert_chunk
+
+    _budget(monkeypatch, "extract_knowledge_points", kp_extractor.PROMPT, 400)
+    doc_id = _insert_doc(conn, "notes.txt", "Physics")
+    for page in range(1, 7):  # about 150 tokens each, so two or three per call
+        _insert_chunk(conn, doc_id, page, page, f"Page {page}: momentum is conserved in collisions. " * 12)
+    kp_extractor.extract_pending(conn)
+
+    calls = _calls(conn, "extract_knowledge_points")
+    assert len(calls) > 1
+    assert all(p <= tokens.BUDGETS["extract_knowledge_points"] and t == 0 for p, t in calls)
+    assert conn.execute("SELECT COUNT(*) FROM chunk_bodies WHERE extracted_at IS NULL").fetchone()[0] == 0
+
+
+def test_oversized_chunk_is_truncated_for_extraction(conn, monkeypatch):
+    import kp_extractor
+    from parser import _insert_doc, _insert_chunk
+
+    _budget(monkeypatch, "extract_knowledge_points", kp_extractor.PROMPT, 400)
+    _insert_chunk(conn, _insert_doc(conn, "book.txt", "Physics"), 1, 1, "Energy is conserved. " * 500)
+    kp_extractor.extract_pending(conn)
+
+    [(prompt_tokens, truncated)] = _calls(conn, "extract_knowledge_points")
+    assert prompt_tokens <= tokens.BUDGETS["extract_knowledge_points"] and truncated > 0
+
+
+def test_grading_sends_relevant_passages_within_budget(conn, monkeypatch):
+    import quizzer
+    from parser import _insert_doc, _insert_chunk
+
+    _budget(monkeypatch, "grade", quizzer.GRADE_PROMPT, 300)
+    paragraphs = ["Filler paragraph %d on an unrelated matter entirely." % i for i in range(300)]
+    paragraphs.insert(250, "Mitochondria are the powerhouse of the cell.")
+    _insert_chunk(conn, _insert_doc(conn, "bio.txt", "Biology"), 1, 1, "\n\n".join(paragraphs))
+    chunk_id = conn.execute("SELECT MAX(id) FROM chunks").fetchone()[0]
+    kp_id = conn.execute("INSERT INTO knowledge_points (subject, topic, kp) VALUES ('Biology', 'Cells', 'x')").lastrowid
+    question = {"stem": "What is the powerhouse of the cell?", "answer": "Mitochondria", "options": None}
+    question["id"] = conn.execute(
+        "INSERT INTO questions (kp_id, qtype, stem, answer, source_chunk_id) VALUES (?, 'short', ?, ?, ?)",
+        (kp_id, question["stem"], question["answer"], chunk_id)).lastrowid
+    question["kp_id"] = kp_id
+    conn.commit()
+
+    prompts = []
+    real = quizzer.ask_gemini_cli
+    monkeypatch.setattr(quizzer, "ask_gemini_cli", lambda prompt: prompts.append(prompt) or real(prompt))
+    quizzer.grade_and_log(conn, question, "Mitochondria")
+
+    [(prompt_tokens, truncated)] = _calls(conn, "grade")
+    assert prompt_tokens <= tokens.BUDGETS["grade"] and truncated > 0
+    assert "Mitochondria are the powerhouse of the cell." in prompts[0]
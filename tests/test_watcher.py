@@ -0,0 +1,18 @@
+import watcher
+
+
+def test_ingest_folder_only_touches_its_own_documents(conn, monkeypatch, tmp_path):
+    for folder in ("notes_v1", "notesXv1"):
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "a.txt").write_text(f"Text in {folder}.")
+    extracted = []
+    monkeypatch.setattr("kp_extractor.extract_pending", lambda c, chunk_ids: extracted.extend(chunk_ids) or 0)
+    monkeypatch.setattr("classifier.CLASSIFY_MODE", "off")
+
+    watcher.ingest(conn, [str(tmp_path / "notesXv1")])
+    watcher.ingest(conn, [str(tmp_path / "notes_v1")], extract=True)
+
+    docs = {r[0] for r in conn.execute(
+        "SELECT d.path FROM chunks c JOIN documents d ON d.id = c.document_id WHERE c.id IN (%s)"
+        % ",".join("?" * len(extracted)), extracted)}
+    assert docs == {str(tmp_path / "notes_v1" / "a.txt")}
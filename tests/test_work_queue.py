@@ -0,0 +1,91 @@
+import pytest
+
+import work_queue
+from parser import _insert_doc, _insert_chunk
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = _Clock()
+    monkeypatch.setattr(work_queue.time, "time", c.time)
+    return c
+
+
+def _queue_kps(conn, n):
+    ids = [conn.execute("INSERT INTO knowledge_points (kp) VALUES (?)", (f"kp {i}",)).lastrowid for i in range(n)]
+    conn.commit()
+    assert work_queue.enqueue_questions(conn, ids, n=2) == n
+    return ids
+
+
+def test_claim_is_exclusive_until_the_lease_expires(conn, clock):
+    _queue_kps(conn, 2)
+    first = work_queue.claim(conn, "a", limit=1)
+    second = work_queue.claim(conn, "b", limit=5)
+    assert [t["id"] for t in first] != [t["id"] for t in second]
+    assert work_queue.claim(conn, "c", limit=5) == []
+
+    clock.now += work_queue.WORK_LEASE_SECONDS + 1
+    retaken = work_queue.claim(conn, "c", limit=5)
+    assert sorted(t["id"] for t in retaken) == sorted(t["id"] for t in first + second)
+    assert conn.execute("SELECT MAX(attempts) FROM tasks").fetchone()[0] == 2
+
+
+def test_finish_after_losing_the_lease_saves_nothing(conn, clock):
+    _queue_kps(conn, 1)
+    [stale] = work_queue.claim(conn, "slow")
+    clock.now += work_queue.WORK_LEASE_SECONDS + 1
+    [fresh] = work_queue.claim(conn, "fast")
+    saved = []
+
+    assert not work_queue.finish(conn, [stale], lambda c: saved.append("slow"), {})
+    assert work_queue.finish(conn, [fresh], lambda c: saved.append("fast"), {"questions": 2})
+    assert saved == ["fast"]
+    assert conn.execute("SELECT status, worker FROM tasks").fetchone() == ("done", "fast")
+    assert not conn.in_transaction
+
+
+def test_tasks_fail_once_out_of_attempts(conn, clock, monkeypatch):
+    monkeypatch.setattr(work_queue, "WORK_MAX_ATTEMPTS", 2)
+    _queue_kps(conn, 1)
+    for _ in range(2):
+        assert work_queue.claim(conn, "w")
+        clock.now += work_queue.WORK_LEASE_SECONDS + 1  # the worker died
+    assert work_queue.claim(conn, "w") == []
+    assert conn.execute("SELECT status, error FROM tasks").fetchone() == ("failed", "lease expired")
+
+    assert work_queue.retry_failed(conn) == 1
+    assert work_queue.claim(conn, "w")
+
+
+def test_failed_attempt_waits_before_retry(conn, clock):
+    _queue_kps(conn, 1)
+    work_queue.fail(conn, work_queue.claim(conn, "w"), RuntimeError("LLM down"))
+    assert work_queue.claim(conn, "w") == []
+    clock.now += work_queue.WORK_RETRY_SECONDS
+    assert work_queue.claim(conn, "w")
+
+
+def test_workers_extract_each_text_once(conn, tmp_path):
+    doc_id = _insert_doc(conn, "notes.txt", "Physics")
+    for page in range(1, 5):
+        _insert_chunk(conn, doc_id, page, page, f"Page {page}: momentum is conserved when no external force acts.")
+    # the same text under another document is one task
+    _insert_chunk(conn, _insert_doc(conn, "copy.txt", "Physics"), 1, 1,
+                  "Page 1: momentum is conserved when no external force acts.")
+    assert work_queue.enqueue_extraction(conn) == 4
+
+    work_queue.run_worker(str(tmp_path / "study.db"), kinds=("extract",), batch=3, exit_when_idle=True)
+
+    assert work_queue.status(conn) == [{"kind": "extract", "status": "done", "tasks": 4, "expired": 0}]
+    assert conn.execute("SELECT COUNT(*) FROM chunk_bodies WHERE extracted_at IS NULL").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM llm_calls WHERE call_site = 'extract_knowledge_points'").fetchone()[0] == 2
+    assert work_queue.enqueue_extraction(conn) == 0
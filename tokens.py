@@ -0,0 +1,244 @@
+import os
+import re
+import math
+import time
+import sqlite3
+import datetime
+from contextlib import contextmanager
+
+import metrics
+
+# Every prompt sent to the LLM has a token budget per call site. Sizes are estimated
+# locally (no tokenizer, no network): about one token per CHARS_PER_TOKEN characters
+# of Latin text and one per CJK character, which errs on the large side for Gemini.
+# Source material that doesn't fit is trimmed to the passages most relevant to the
+# question (grading), truncated (single texts) or split over several calls (extraction).
+#
+# Each call's estimated token counts, latency and cost are recorded in llm_calls
+# (see usage() and `python app.py usage`).
+
+CHARS_PER_TOKEN = 4
+MIN_ROOM = 256  # never squeeze the material below this, even if the template is huge
+
+# Budget per call site for the whole prompt, override with TOKEN_BUDGET_<CALL_SITE>
+BUDGETS = {
+    site: int(os.getenv(f"TOKEN_BUDGET_{site.upper()}", default))
+    for site, default in {
+        "generate_quiz": 2_000,
+        "grade": 4_000,
+        "extract_knowledge_points": 30_000,
+        "summarize": 30_000,
+        "classify": 4_000,
+    }.items()
+}
+
+# USD per million tokens (defaults: Gemini 2.5 Flash list prices). Only an estimate;
+# the mock backend, the offline stand-in (in-process or over HTTP, see llm_standin.py)
+# and the benchmarks' fake LLM are free.
+PRICE_INPUT = float(os.getenv("LLM_PRICE_INPUT", "0.30"))
+PRICE_OUTPUT = float(os.getenv("LLM_PRICE_OUTPUT", "2.50"))
+FREE_BACKENDS = ("mock", "local", "http", "fake")
+
+TRUNCATION_MARK = " [...]"
+
+_CJK = re.compile("[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+_WORD = re.compile(r"[^\W\d_]{3,}|\d+")
+
+
+def estimate(text):
+    """Estimated number of tokens in text."""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / CHARS_PER_TOKEN)
+
+
+def room(call_site, *fixed):
+    """Tokens left for source material at call_site once the fixed parts of the prompt are counted."""
+    return max(BUDGETS[call_site] - sum(estimate(f) for f in fixed), MIN_ROOM)
+
+
+def truncate(text, max_tokens):
+    """text cut (at a word boundary if possible) so its estimate fits max_tokens."""
+    if estimate(text) <= max_tokens:
+        return text
+    max_tokens -= estimate(TRUNCATION_MARK)
+    cut = int(len(text) * max_tokens / estimate(text))
+    while cut > 0 and estimate(text[:cut]) > max_tokens:
+        cut = int(cut * 0.9)
+    space = text.rfind(" ", int(cut * 0.8), cut)
+    return text[:space if space > 0 else cut].rstrip() + TRUNCATION_MARK
+
+
+def _passages(text):
+    for pattern, sep in ((r"\n\s*\n", "\n\n"), (r"\n", "\n"), (r"(?<=[.!?。！？])\s*", " ")):
+        parts = [p.strip() for p in re.split(pattern, text) if p.strip()]
+        if len(parts) > 1:
+            return parts, sep
+    return [text], ""
+
+
+def _terms(text):
+    text = text.lower()
+    return set(_WORD.findall(text)) | set(_CJK.findall(text))
+
+
+def select_passages(text, max_tokens, query=""):
+    """
+    The paragraphs (or lines, or sentences) of text sharing the most words with query
+    that fit in max_tokens together, in their original order with gaps marked.
+    """
+    if estimate(text) <= max_tokens:
+        return text
+    parts, sep = _passages(text)
+    if len(parts) == 1:
+        return truncate(text, max_tokens)
+    terms = _terms(query)
+    ranked = sorted(range(len(parts)), key=lambda i: (-len(terms & _terms(parts[i])), i))
+    keep, used = [], 0
+    for i in ranked:
+        n = estimate(parts[i] + sep + TRUNCATION_MARK)
+        if used + n <= max_tokens:
+            keep.append(i)
+            used += n
+    if not keep:
+        return truncate(parts[ranked[0]], max_tokens)
+    out, last = [], -1
+    for i in sorted(keep):
+        if i != last + 1:
+            out.append(TRUNCATION_MARK.strip())
+        out.append(parts[i])
+        last = i
+    if last != len(parts) - 1:
+        out.append(TRUNCATION_MARK.strip())
+    return sep.join(out)
+
+
+def pack(items, max_tokens, text=lambda item: item):
+    """
+    Splits items into consecutive batches whose texts fit max_tokens together. An item
+    too big on its own gets a batch of its own (for the caller to truncate). Yields
+    lists of (item, text).
+    """
+    batch, used = [], 0
+    for item in items:
+        t = text(item)
+        n = estimate(t)
+        if batch and used + n > max_tokens:
+            yield batch
+            batch, used = [], 0
+        batch.append((item, t))
+        used += n
+    if batch:
+        yield batch
+
+
+# ---------- Usage ----------
+
+class Call:
+    """One LLM call being tracked: set .response (track) or let track_stream collect it."""
+
+    def __init__(self, call_site, prompt, truncated=0):
+        self.call_site = call_site
+        self.prompt = prompt
+        self.truncated = max(truncated, 0)
+        self.response = ""
+
+
+@contextmanager
+def track(conn, call_site, prompt, truncated=0):
+    """
+    Records the LLM call made in the enclosed block in llm_calls when it ends:
+
+        with tokens.track(conn, "grade", prompt) as call:
+            call.response = ask_gemini_cli(prompt)
+    """
+    call = Call(call_site, prompt, truncated)
+    start = time.perf_counter()
+    status = "error"
+    try:
+        yield call
+        status = "ok"
+    except GeneratorExit:
+        status = "cancelled"  # the caller stopped reading a streamed response
+        raise
+    finally:
+        record(conn, call, time.perf_counter() - start, status)
+
+
+def track_stream(conn, call_site, prompt, pieces, truncated=0):
+    """Passes the pieces of a streamed response through, recording the call once it ends."""
+    received = []
+    with track(conn, call_site, prompt, truncated) as call:
+        try:
+            for piece in pieces:
+                received.append(piece)
+                yield piece
+        finally:
+            call.response = "".join(received)
+
+
+def cost(backend, prompt_tokens, response_tokens):
+    """Estimated USD cost of a call."""
+    if backend in FREE_BACKENDS:
+        return 0.0
+    return (prompt_tokens * PRICE_INPUT + response_tokens * PRICE_OUTPUT) / 1_000_000
+
+
+def record(conn, call, seconds, status="ok"):
+    """
+    Adds a row to llm_calls (and the token metrics). Committed right away unless the
+    connection is already in a transaction, in which case it goes with the caller's commit.
+    """
+    from llm import get_backend
+    backend = get_backend().name
+    prompt_tokens, response_tokens = estimate(call.prompt), estimate(call.response)
+    usd = cost(backend, prompt_tokens, response_tokens)
+    metrics.inc("llm_tokens_total", prompt_tokens, call_site=call.call_site, kind="prompt")
+    metrics.inc("llm_tokens_total", response_tokens, call_site=call.call_site, kind="response")
+    metrics.inc("llm_cost_usd_total", usd, call_site=call.call_site)
+    if call.truncated:
+        metrics.inc("llm_truncated_tokens_total", call.truncated, call_site=call.call_site)
+    if conn is None:
+        return
+    try:
+        in_transaction = conn.in_transaction
+        conn.execute(
+            "INSERT INTO llm_calls (call_site, backend, prompt_tokens, response_tokens, truncated_tokens, "
+            "seconds, cost_usd, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (call.call_site, backend, prompt_tokens, response_tokens, call.truncated,
+             round(seconds, 3), usd, status, datetime.datetime.now().isoformat()),
+        )
+        if not in_transaction:
+            conn.commit()
+    except sqlite3.Error as e:
+        metrics.inc("errors_total", where="llm_usage")
+        print(f"Warning: Could not record LLM usage ({e}).")
+
+
+def usage(conn, since=None):
+    """
+    Recorded LLM calls per call site, most time-consuming first. With a learner's
+    database, their own calls (grading) are added to the shared ones (extraction, quizzes).
+    """
+    tables = ["main.llm_calls"]
+    if any(name == "shared" for _, name, _ in conn.execute("PRAGMA database_list")):
+        tables.append("shared.llm_calls")
+    calls = " UNION ALL ".join(f"SELECT * FROM {t} WHERE created_at >= ?" for t in tables)
+    rows = conn.execute(f"""
+        SELECT call_site, COUNT(*), SUM(prompt_tokens), SUM(response_tokens), SUM(truncated_tokens),
+               SUM(seconds), SUM(cost_usd), SUM(status != 'ok')
+        FROM ({calls})
+        GROUP BY call_site
+        ORDER BY SUM(seconds) DESC
+    """, [since or ""] * len(tables)).fetchall()
+    keys = ("call_site", "calls", "prompt_tokens", "response_tokens", "truncated_tokens",
+            "seconds", "cost_usd", "failed")
+    out = []
+    for row in rows:
+        item = dict(zip(keys, row))
+        item["avg_seconds"] = round(item["seconds"] / item["calls"], 3)
+        item["seconds"] = round(item["seconds"], 3)
+        item["cost_usd"] = round(item["cost_usd"], 6)
+        out.append(item)
+    return out
@@ -0,0 +1,260 @@
+import os
+import sys
+import time
+import struct
+import threading
+
+import metrics
+
+# Watch mode: notices files added to or changed in a study folder and imports just
+# those (see parser.import_file, which skips files whose mtime/size haven't changed).
+# On Linux changes come from inotify; elsewhere, or with WATCH_POLL=1, the folder is
+# re-scanned every WATCH_POLL_INTERVAL seconds. Events are collected until the folder
+# has been quiet for WATCH_DEBOUNCE seconds, so copying in a batch of slides (or a
+# PDF still being written) is imported once, after it has finished.
+
+WATCH_DEBOUNCE = float(os.getenv("WATCH_DEBOUNCE", "1.0"))
+WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", "2.0"))
+WATCH_POLL = os.getenv("WATCH_POLL", "0") == "1"
+
+# inotify(7) event bits
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+_EVENT = struct.Struct("iIII")
+
+
+class _Inotify:
+    """Recursive inotify watch on a folder, via ctypes (Linux only)."""
+
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, root):
+        import ctypes
+        import ctypes.util
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}
+        self.root = root
+        for path, _, _ in os.walk(root):
+            self._add(path)
+
+    def _add(self, path):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd >= 0:
+            self.dirs[wd] = path
+
+    def read(self, timeout):
+        """Returns the paths that changed, waiting up to timeout seconds for the first event."""
+        import select
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size: offset + _EVENT.size + length].rstrip(b"\0")
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost; fall back to an (incremental) import of everything
+                metrics.inc("watch_overflows_total")
+                changed.add(self.root)
+                continue
+            if wd not in self.dirs or not name:
+                continue
+            path = os.path.join(self.dirs[wd], os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # New subfolder: watch it, and import whatever landed in it before the watch
+                    for sub, _, _ in os.walk(path):
+                        self._add(sub)
+                    changed.add(path)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _Poller:
+    """Portable fallback: compares (mtime, size) of every file between scans."""
+
+    def __init__(self, root, interval=WATCH_POLL_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self.seen = self._scan()
+
+    def _scan(self):
+        state = {}
+        for path, _, files in os.walk(self.root):
+            for f in files:
+                p = os.path.join(path, f)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                state[p] = (st.st_mtime, st.st_size)
+        return state
+
+    def read(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        state = self._scan()
+        changed = {p for p, sig in state.items() if self.seen.get(p) != sig}
+        self.seen = state
+        return changed
+
+    def close(self):
+        pass
+
+
+def _open_source(root, poll=None):
+    if poll is None:
+        poll = WATCH_POLL
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            return _Inotify(root)
+        except (OSError, AttributeError) as e:
+            # NOTE: stderr, as watchers also run inside the stdio MCP server (start_watch)
+            print(f"Warning: inotify unavailable ({e}); polling {root} every {WATCH_POLL_INTERVAL:g}s instead.",
+                  file=sys.stderr)
+    return _Poller(root)
+
+
+def watch(root, on_batch, debounce=None, poll=None, stop=None):
+    """
+    Calls on_batch(paths) with the sorted list of files/folders under root that were
+    added or changed, once the folder has been quiet for `debounce` seconds. Runs until
+    `stop` (a threading.Event) is set or the process is interrupted. Deleted files are
+    ignored: their documents, and the quiz history linked to them, are kept.
+    """
+    debounce = WATCH_DEBOUNCE if debounce is None else debounce
+    stop = stop or threading.Event()
+    source = _open_source(root, poll)
+    pending = set()
+    last_event = 0.0
+    try:
+        while not stop.is_set():
+            changed = source.read(debounce if pending else 1.0)
+            if changed:
+                metrics.inc("watch_events_total", len(changed))
+                pending |= changed
+                last_event = time.monotonic()
+            elif pending and time.monotonic() - last_event >= debounce:
+                batch = sorted(pending)
+                pending.clear()
+                on_batch(batch)
+    finally:
+        source.close()
+
+
+def ingest(conn, paths, subject=None, extract=False):
+    """
+    Imports the given files (folders are imported recursively) and, with extract=True,
+    extracts knowledge points from their new text. Returns (docs, chunks, kps).
+    """
+    from parser import import_file, import_path, classify
+
+    n_docs = n_chunks = 0
+    touched = []
+    files = []
+    with metrics.timer("watch_ingest_seconds"):
+        for p in paths:
+            if os.path.isdir(p):
+                docs, chunks = import_path(conn, p, subject)
+                n_docs += docs
+                n_chunks += chunks
+                prefix = os.path.join(p, "")
+                touched += [r[0] for r in conn.execute(
+                    "SELECT id FROM documents WHERE substr(path, 1, length(?)) = ?", (prefix, prefix)
+                )]
+            elif os.path.isfile(p):
+                n = import_file(conn, p, subject)
+                if n is not None:
+                    n_docs += 1
+                    n_chunks += n
+                    files += [r[0] for r in conn.execute("SELECT id FROM documents WHERE path=?", (p,))]
+        classify(conn, files)  # folders were classified by import_path
+        touched += files
+    n_kps = 0
+    if extract and n_chunks:
+        from kp_extractor import extract_pending
+        marks = ",".join("?" * len(touched))
+        chunk_ids = [r[0] for r in conn.execute(
+            f"SELECT id FROM chunks WHERE document_id IN ({marks})", touched
+        )]
+        n_kps = extract_pending(conn, chunk_ids)
+    return n_docs, n_chunks, n_kps
+
+
+class Watcher:
+    """Runs watch() + ingest() for one folder in a background thread (used by the MCP server)."""
+
+    def __init__(self, root, db_path, subject=None, extract=False, debounce=None, poll=None):
+        self.root = root
+        self.db_path = db_path
+        self.subject = subject
+        self.extract = extract
+        self.debounce = debounce
+        self.poll = poll
+        self.stats = {"batches": 0, "docs": 0, "chunks": 0, "kps": 0, "last_batch_at": None, "last_error": None}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"watch:{root}", daemon=True)
+
+    def _run(self):
+        from db import get_db
+        # SQLite connections can't be shared across threads; this one belongs to the watcher
+        try:
+            conn = get_db(self.db_path)
+        except Exception as e:
+            metrics.inc("errors_total", where="watch_ingest")
+            self.stats["last_error"] = str(e)
+            return
+        try:
+            on_batch = self._on_batch(conn)
+            # Catch up on anything that changed while nobody was watching
+            on_batch([self.root])
+            watch(self.root, on_batch, self.debounce, self.poll, self._stop)
+        except Exception as e:
+            metrics.inc("errors_total", where="watch")
+            self.stats["last_error"] = str(e)
+        finally:
+            conn.close()
+
+    def _on_batch(self, conn):
+        def on_batch(paths):
+            try:
+                self._record(ingest(conn, paths, self.subject, self.extract))
+            except Exception as e:
+                # Keep watching; the next change to the file will retry it
+                metrics.inc("errors_total", where="watch_ingest")
+                self.stats["last_error"] = str(e)
+        return on_batch
+
+    def _record(self, counts):
+        import datetime
+        self.stats["batches"] += 1
+        for key, n in zip(("docs", "chunks", "kps"), counts):
+            self.stats[key] += n
+        self.stats["last_batch_at"] = datetime.datetime.now().isoformat()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
@@ -0,0 +1,292 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import datetime
+import threading
+from rich import print
+
+import metrics
+
+# A durable queue of LLM work in the shared database, so several `worker` processes
+# (on this machine or others opening the same file) can share extraction and question
+# generation. Tasks are:
+#   extract   target_id: a chunk; extract knowledge points from its text (one task per
+#             distinct text, under its lowest chunk id, as in chunk_store.iter_chunks)
+#   generate  target_id: a knowledge point; generate params["n"] questions for it
+#
+# A worker claims tasks in one UPDATE, which sets a random lease token and a deadline
+# (WORK_LEASE_SECONDS). The LLM call runs outside any transaction; its results are
+# saved in the same transaction that marks the task done, and only while the worker
+# still holds the lease. A worker that crashes or hangs loses its lease at the
+# deadline and the task goes to the next worker, up to WORK_MAX_ATTEMPTS times, so
+# each task's results are saved once.
+#
+# NOTE: Claims rely on SQLite's file locks, so all workers must open the same file
+# (local disk, or a network file system with working locks). A copy kept in sync by a
+# file-sync service cannot make claims atomic and isn't supported. Lease deadlines
+# use each machine's clock, which should be roughly right.
+
+WORK_LEASE_SECONDS = float(os.getenv("WORK_LEASE_SECONDS", "300"))
+WORK_MAX_ATTEMPTS = int(os.getenv("WORK_MAX_ATTEMPTS", "3"))
+WORK_RETRY_SECONDS = float(os.getenv("WORK_RETRY_SECONDS", "30"))  # wait before retry, times attempts
+BUSY_TIMEOUT_MS = 30_000  # workers wait this long for another's write lock
+
+KINDS = ("extract", "generate")
+
+
+def _now():
+    return datetime.datetime.now().isoformat()
+
+
+def worker_name():
+    """host:pid, plus the thread name for worker threads."""
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    thread = threading.current_thread()
+    return name if thread is threading.main_thread() else f"{name}:{thread.name}"
+
+
+# ---------- Queueing ----------
+
+def enqueue_extraction(conn, subject=None):
+    """
+    Adds an extract task for every text not extracted yet (of documents with the given
+    subject), unless one is already open. Returns the number added.
+    """
+    cur = conn.execute("""
+        INSERT OR IGNORE INTO tasks (kind, target_id, created_at, updated_at)
+        SELECT 'extract', MIN(c.id), :now, :now
+        FROM chunks c JOIN chunk_bodies b ON b.id = c.body_id JOIN documents d ON d.id = c.document_id
+        WHERE b.extracted_at IS NULL
+        GROUP BY c.body_id
+        HAVING :subject IS NULL OR MAX(d.subject = :subject)
+    """, {"now": _now(), "subject": subject})
+    conn.commit()
+    return cur.rowcount
+
+
+def enqueue_questions(conn, kp_ids=None, n=5):
+    """
+    Adds a generate task for the given knowledge points, or for every one without
+    questions, unless one is already open. Returns the number added.
+    """
+    params = json.dumps({"n": n})
+    if kp_ids is None:
+        cur = conn.execute("""
+            INSERT OR IGNORE INTO tasks (kind, target_id, params, created_at, updated_at)
+            SELECT 'generate', k.id, ?, ?, ?
+            FROM knowledge_points k
+            WHERE NOT EXISTS (SELECT 1 FROM questions q WHERE q.kp_id = k.id)
+        """, (params, _now(), _now()))
+        added = cur.rowcount
+    else:
+        added = 0
+        for kp_id in kp_ids:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO tasks (kind, target_id, params, created_at, updated_at) VALUES ('generate', ?, ?, ?, ?)",
+                (kp_id, params, _now(), _now()))
+            added += cur.rowcount
+    conn.commit()
+    return added
+
+
+def retry_failed(conn, kind=None):
+    """Puts failed tasks back in the queue with fresh attempts. Returns the number requeued."""
+    cur = conn.execute(
+        "UPDATE OR IGNORE tasks SET status = 'pending', attempts = 0, lease_until = NULL, updated_at = ? "
+        "WHERE status = 'failed' AND (? IS NULL OR kind = ?)", (_now(), kind, kind))
+    conn.commit()
+    return cur.rowcount
+
+
+def status(conn):
+    """Task counts per kind and status, with how many leases have expired."""
+    now = time.time()
+    return [
+        {"kind": kind, "status": st, "tasks": n, "expired": expired}
+        for kind, st, n, expired in conn.execute("""
+            SELECT kind, status, COUNT(*), SUM(status = 'leased' AND lease_until < ?)
+            FROM tasks GROUP BY kind, status ORDER BY kind, status
+        """, (now,))
+    ]
+
+
+# ---------- Leases ----------
+
+def claim(conn, worker, kinds=KINDS, limit=1):
+    """
+    Leases up to limit tasks of the given kinds: pending ones that are due and ones
+    whose lease has expired. Tasks out of attempts are marked failed instead.
+    Returns dicts with id, kind, target_id, params and lease.
+    """
+    now = time.time()
+    marks = ",".join("?" * len(kinds))
+    conn.execute(
+        f"UPDATE tasks SET status = 'failed', error = COALESCE(error, 'lease expired'), lease = NULL, updated_at = ? "
+        f"WHERE status = 'leased' AND lease_until < ? AND attempts >= ? AND kind IN ({marks})",
+        (_now(), now, WORK_MAX_ATTEMPTS, *kinds))
+    lease = uuid.uuid4().hex
+    rows = conn.execute(f"""
+        UPDATE tasks SET status = 'leased', worker = ?, lease = ?, lease_until = ?,
+                         attempts = attempts + 1, updated_at = ?
+        WHERE id IN (
+          SELECT id FROM tasks
+          WHERE kind IN ({marks}) AND attempts < ? AND (
+            (status = 'pending' AND (lease_until IS NULL OR lease_until <= ?))
+            OR (status = 'leased' AND lease_until < ?))
+          ORDER BY id LIMIT ?)
+        RETURNING id, kind, target_id, params
+    """, (worker, lease, now + WORK_LEASE_SECONDS, _now(), *kinds, WORK_MAX_ATTEMPTS, now, now, limit)).fetchall()
+    conn.commit()
+    return [{"id": r[0], "kind": r[1], "target_id": r[2], "params": json.loads(r[3] or "{}"), "lease": lease}
+            for r in sorted(rows)]
+
+
+def finish(conn, tasks, save, result):
+    """
+    Marks tasks done and calls save(conn) to write their results, in one transaction,
+    if the worker still holds all of their leases. Returns False (and saves nothing) if
+    a lease was lost, e.g. it expired and another worker took the task.
+    """
+    if not tasks:
+        return True
+    ids = [t["id"] for t in tasks]
+    cur = conn.execute(
+        f"UPDATE tasks SET status = 'done', result = ?, error = NULL, lease = NULL, lease_until = NULL, updated_at = ? "
+        f"WHERE status = 'leased' AND lease = ? AND id IN ({','.join('?' * len(ids))})",
+        (json.dumps(result), _now(), tasks[0]["lease"], *ids))
+    if cur.rowcount != len(ids):
+        conn.rollback()
+        metrics.inc("work_leases_lost_total", len(ids), kind=tasks[0]["kind"])
+        print(f"[bold yellow]Warning:[/] Lease on {len(ids)} {tasks[0]['kind']} task(s) expired before they finished; "
+              "their results were dropped (another worker has them).")
+        return False
+    try:
+        save(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return True
+
+
+def fail(conn, tasks, error):
+    """Returns tasks to the queue after a failed attempt (or marks them failed once out of attempts)."""
+    if not tasks:
+        return
+    ids = [t["id"] for t in tasks]
+    conn.execute(f"""
+        UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                         error = ?, lease = NULL, lease_until = ? + attempts * ?, updated_at = ?
+        WHERE status = 'leased' AND lease = ? AND id IN ({','.join('?' * len(ids))})
+    """, (WORK_MAX_ATTEMPTS, str(error)[:500], time.time(), WORK_RETRY_SECONDS, _now(), tasks[0]["lease"], *ids))
+    conn.commit()
+
+
+def release(conn, tasks):
+    """Gives back leased tasks that weren't started, without using up an attempt."""
+    if not tasks:
+        return
+    ids = [t["id"] for t in tasks]
+    conn.execute(
+        f"UPDATE tasks SET status = 'pending', attempts = attempts - 1, lease = NULL, lease_until = NULL, updated_at = ? "
+        f"WHERE status = 'leased' AND lease = ? AND id IN ({','.join('?' * len(ids))})",
+        (_now(), tasks[0]["lease"], *ids))
+    conn.commit()
+
+
+# ---------- Workers ----------
+
+def _run_extract(conn, tasks):
+    """Extracts the tasks' chunks, finishing each task with the LLM call that covered it."""
+    from kp_extractor import iter_extracted, save_extracted
+
+    by_chunk = {t["target_id"]: t for t in tasks}
+    open_ = dict(by_chunk)
+    try:
+        for chunk_ids, kp_items in iter_extracted(conn, list(by_chunk)):
+            done = [open_[c] for c in chunk_ids if c in open_]
+            if finish(conn, done, lambda c: save_extracted(c, chunk_ids, kp_items),
+                      {"knowledge_points": len(kp_items)}):
+                metrics.inc("work_tasks_total", len(done), kind="extract", status="done")
+            for t in done:
+                del open_[t["target_id"]]
+        # The rest had been extracted already (e.g. by `summarize`)
+        finish(conn, list(open_.values()), lambda c: None, {"knowledge_points": 0})
+    except Exception as e:
+        fail(conn, list(open_.values()), e)
+        metrics.inc("work_tasks_total", len(open_), kind="extract", status="error")
+        raise
+
+
+def _run_generate(conn, task):
+    from quizzer import draft_quiz, save_questions
+
+    try:
+        source_chunk_id, questions = draft_quiz(conn, task["target_id"], task["params"].get("n", 5))
+        if not questions:
+            raise ValueError("no questions generated")
+    except Exception as e:
+        fail(conn, [task], e)
+        metrics.inc("work_tasks_total", kind="generate", status="error")
+        raise
+    if finish(conn, [task], lambda c: save_questions(c, task["target_id"], source_chunk_id, questions),
+              {"questions": len(questions)}):
+        metrics.inc("work_tasks_total", kind="generate", status="done")
+
+
+def work(conn, worker, kinds=KINDS, batch=1, stop=None):
+    """
+    Claims one round of tasks (up to batch of them; extract tasks share LLM calls) and
+    runs them. Returns the number of tasks claimed, 0 when there was nothing to do.
+    """
+    tasks = claim(conn, worker, kinds, batch)
+    extract = [t for t in tasks if t["kind"] == "extract"]
+    generate = [t for t in tasks if t["kind"] == "generate"]
+    if extract:
+        try:
+            with metrics.timer("work_task_seconds", kind="extract"):
+                _run_extract(conn, extract)
+        except Exception as e:
+            print(f"[bold red]Error:[/] {worker}: extraction of {len(extract)} chunk(s) failed: {e}")
+    for i, task in enumerate(generate):
+        if stop is not None and stop.is_set():
+            release(conn, generate[i:])
+            break
+        try:
+            with metrics.timer("work_task_seconds", kind="generate"):
+                _run_generate(conn, task)
+        except Exception as e:
+            print(f"[bold red]Error:[/] {worker}: questions for knowledge point {task['target_id']} failed: {e}")
+    return len(tasks)
+
+
+def run_worker(path, kinds=KINDS, batch=1, poll=5.0, exit_when_idle=False, stop=None, on_round=None):
+    """
+    Runs work() in a loop on its own connection until stop is set (or, with
+    exit_when_idle, until there is nothing left to claim), waiting poll seconds when idle.
+    """
+    from db import get_db
+
+    stop = stop or threading.Event()
+    conn = get_db(path)
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    worker = worker_name()
+    try:
+        while not stop.is_set():
+            try:
+                n = work(conn, worker, kinds, batch, stop)
+            except sqlite3.OperationalError as e:  # e.g. locked for longer than the busy timeout
+                metrics.inc("errors_total", where="work_queue")
+                print(f"[bold red]Error:[/] {worker}: {e}")
+                n = 0
+            if on_round:
+                on_round(worker, n)
+            if not n:
+                if exit_when_idle:
+                    break
+                stop.wait(poll)
+    finally:
+        conn.close()